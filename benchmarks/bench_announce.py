@@ -0,0 +1,76 @@
+'''
+    Tracker registration benchmark.
+
+    Registers a growing number of files with a running server, once with a single batched /announce and once
+    with one /addfile per file the way clients used to, and reports how long each took. Every run uses a new
+    connection so it is registered as a fresh peer. Start the server first with its output discarded,
+    e.g. `python server.py > /dev/null`.
+
+    Usage:
+        #> python benchmarks/bench_announce.py [--files N ..] [--addfile-limit N] [--host H] [--port P]
+'''
+
+import os
+import sys
+import argparse
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import shared
+from client import TrackerConnection
+
+DEFAULT_FILES = [10000, 100000, 1000000] # Number of files registered per run.
+ADDFILE_LIMIT = 100000 # Larger runs skip the /addfile comparison, which takes minutes at these sizes.
+LOOKUP_SAMPLE = 1000 # Files looked up with /findfiles after every announce.
+
+def getFileEntries(runName, count):
+    return [(runName + "-file-" + str(i) + ".mp3", 1048576 + i, None) for i in range(count)]
+
+'''
+    timeAnnounce(address, files)
+        Registers every file with one /announce, returns (announce seconds, /findfiles seconds for a sample).
+'''
+def timeAnnounce(address, files):
+    connection = TrackerConnection(address)
+    try:
+        startTime = time.perf_counter()
+        added, duplicates = connection.announce(files)
+        announceTime = time.perf_counter() - startTime
+        if added != len(files): raise RuntimeError("Only " + str(added) + " of " + str(len(files)) + " files were added.")
+
+        startTime = time.perf_counter()
+        connection.findFiles([fileName for fileName, fileSize, rootHash in files[:LOOKUP_SAMPLE]])
+        return announceTime, time.perf_counter() - startTime
+    finally:
+        connection.close()
+
+'''
+    timeAddFile(address, files)
+        Registers every file with its own /addfile, waiting for each reply, returns the seconds taken.
+'''
+def timeAddFile(address, files):
+    connection = TrackerConnection(address)
+    try:
+        startTime = time.perf_counter()
+        for fileName, fileSize, rootHash in files: connection.request("/addfile " + fileName)
+        return time.perf_counter() - startTime
+    finally:
+        connection.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Measures how long registering files with the tracker takes.")
+    parser.add_argument("--files", type = int, nargs = "+", default = DEFAULT_FILES, help = "file counts to register")
+    parser.add_argument("--addfile-limit", dest = "addFileLimit", type = int, default = ADDFILE_LIMIT, help = "largest run also timed with /addfile")
+    parser.add_argument("--host", default = shared.SERVER_ADDRESS[0])
+    parser.add_argument("--port", type = int, default = shared.SERVER_ADDRESS[1])
+    arguments = parser.parse_args()
+    address = (arguments.host, arguments.port)
+
+    print("files".rjust(9) + "  announce".rjust(12) + "  files/s".rjust(12) + "  findfiles x" + str(LOOKUP_SAMPLE) + "  addfile".rjust(12))
+    for run, count in enumerate(arguments.files):
+        files = getFileEntries("run" + str(run) + "-" + str(os.getpid()), count)
+        announceTime, lookupTime = timeAnnounce(address, files)
+        addFileTime = "-"
+        if count <= arguments.addFileLimit:
+            addFileTime = str(round(timeAddFile(address, getFileEntries("addfile" + str(run) + "-" + str(os.getpid()), count)), 2)) + "s"
+        print(str(count).rjust(9) + (str(round(announceTime, 2)) + "s").rjust(12) + str(round(count / announceTime)).rjust(12) + (str(round(lookupTime * 1000, 1)) + "ms").rjust(len("  findfiles x" + str(LOOKUP_SAMPLE))) + addFileTime.rjust(12))
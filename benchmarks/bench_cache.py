@@ -0,0 +1,126 @@
+'''
+    Server compressed-chunk cache benchmark.
+
+    Starts a server with the compressed-chunk cache on and then off, and measures /fetchfile throughput with many clients
+    all fetching one popular file and with the same clients fetching many distinct files, both as raw bytes
+    and with wire compression. Raw transfers always use sendfile and bypass the cache, they are included as a
+    reference. The server is started on the default address, which must be free.
+
+    Usage:
+        #> python benchmarks/bench_cache.py [--clients N] [--fetches N] [--file-size MB] [--files N]
+'''
+
+import os
+import sys
+import argparse
+import random
+import shutil
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import shared
+from client import TrackerConnection
+from benchserver import startServer
+
+CACHE_SIZE = 64 # Megabytes of cache given to the server in the cache-on runs.
+
+'''
+    createTrackedFiles(directory, count, size)
+        Writes compressible test files into the server's tracked-files directory, returns their names.
+'''
+def createTrackedFiles(directory, count, size):
+    trackedDirectory = os.path.join(directory, "tracked-files")
+    os.makedirs(trackedDirectory)
+    words = [random.randbytes(random.randint(3, 9)).hex().encode() for i in range(4096)]
+    fileNames = []
+    for number in range(count):
+        fileName = "bench-" + str(number) + ".txt"
+        with open(os.path.join(trackedDirectory, fileName), "wb") as file:
+            written = 0
+            while written < size:
+                line = b" ".join(random.choices(words, k = 64)) + b"\n"
+                file.write(line[:size - written])
+                written = written + len(line)
+        fileNames.append(fileName)
+    return fileNames
+
+'''
+    fetchDiscard(connection, fileName, codecs)
+        Fetches a file and reads it off the socket without writing it anywhere, returns the bytes received.
+'''
+def fetchDiscard(connection, fileName, codecs):
+    command = "/fetchfile " + fileName + (" " + codecs if codecs else "")
+    connection.send(command)
+    messageType, payload, flags, requestId = shared.recvFrame(connection.socket, withHeader = True)
+    connection.outstanding.popleft()
+    if messageType != shared.MSG_FILE: raise RuntimeError(payload.decode())
+
+    fileHeader = payload.decode().split("\0")
+    fileSize = int(fileHeader[1])
+    received = 0
+    if len(fileHeader) > 2: # Compressed transfer, the file arrives as MSG_CHUNK frames.
+        while received < fileSize: # Every chunk but the last holds STREAM_CHUNK_SIZE bytes of the file.
+            messageType, payload, flags, requestId = shared.recvFrame(connection.socket, withHeader = True)
+            received = received + (shared.STREAM_CHUNK_SIZE if flags & shared.FLAG_COMPRESSED else len(payload))
+        return fileSize
+
+    buffer = bytearray(shared.STREAM_CHUNK_SIZE)
+    while received < fileSize:
+        count = connection.socket.recv_into(buffer, min(len(buffer), fileSize - received))
+        if count == 0: raise ConnectionError("Server closed the connection.")
+        received = received + count
+    return fileSize
+
+'''
+    runClients(clients, fetches, fileNames, codecs)
+        Runs the clients at once, each fetching a random file from the list, returns the MB/s delivered.
+'''
+def runClients(clients, fetches, fileNames, codecs):
+    received = []
+    def runClient():
+        connection = TrackerConnection()
+        try:
+            total = 0
+            for i in range(fetches): total = total + fetchDiscard(connection, random.choice(fileNames), codecs)
+            received.append(total)
+        finally:
+            connection.close()
+
+    threads = [threading.Thread(target = runClient) for i in range(clients)]
+    startTime = time.perf_counter()
+    for thread in threads: thread.start()
+    for thread in threads: thread.join()
+    elapsed = time.perf_counter() - startTime
+    if len(received) != clients: raise RuntimeError("A client failed.")
+    return sum(received) / 1048576 / elapsed
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Measures /fetchfile throughput with the server compressed-chunk cache on and off.")
+    parser.add_argument("--clients", type = int, default = 8)
+    parser.add_argument("--fetches", type = int, default = 8, help = "files fetched by every client")
+    parser.add_argument("--file-size", dest = "fileSize", type = int, default = 4, help = "size of every test file in MB")
+    parser.add_argument("--files", type = int, default = 32, help = "distinct files, together larger than the cache")
+    arguments = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix = "bench-cache-")
+    try:
+        fileNames = createTrackedFiles(directory, arguments.files, arguments.fileSize * 1048576)
+        print(str(arguments.clients) + " clients x " + str(arguments.fetches) + " fetches of " + str(arguments.fileSize) + " MB files, " + str(CACHE_SIZE) + " MB cache (MB/s):")
+        print("".ljust(24) + "cache off".rjust(12) + "cache on".rjust(12))
+        results = {}
+        for cacheSize in (0, CACHE_SIZE):
+            server = startServer(directory, ["--cache-size", str(cacheSize)])
+            try:
+                for workload, names in (("one file", fileNames[:1]), ("distinct files", fileNames)):
+                    for transfer, codecs in (("raw", None), ("zlib", "zlib")):
+                        results.setdefault((workload, transfer), []).append(runClients(arguments.clients, arguments.fetches, names, codecs))
+            finally:
+                server.terminate()
+                server.wait()
+
+        for (workload, transfer), rates in results.items():
+            print(("  " + workload + ", " + transfer).ljust(24) + "".join(str(round(rate)).rjust(12) for rate in rates))
+    finally:
+        shutil.rmtree(directory)
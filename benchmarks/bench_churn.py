@@ -0,0 +1,175 @@
+'''
+    Connection churn soak test.
+
+    Starts the server with short idle and read timeouts and churns thousands of client connections through it.
+    Every client connects and announces a few files, then leaves in one of several ways: sending exit, closing
+    its socket without a word, resetting the connection, going silent or stalling half way through a frame. The
+    silent and stalled connections are kept open, so only the server's reaper can clean them up. Once the
+    churn ends the server must return to where it started: the same number of threads and open descriptors, no
+    clients connected but the probe, nothing left in the tracker and no churned peer returned by /findfiles,
+    all without burning CPU. Exits with status 1 if anything leaked. Reads the server's /proc entries, so it
+    only runs on Linux. The server is started on the default address, which must be free.
+
+    Usage:
+        #> python benchmarks/bench_churn.py [--cycles N] [--concurrency N] [--files N] [--async]
+'''
+
+import os
+import sys
+import argparse
+import random
+import shutil
+import socket
+import struct
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import shared
+from client import TrackerConnection
+from benchserver import startServer
+
+IDLE_TIMEOUT = 2 # Seconds, short so the soak does not wait long for the reaper.
+READ_TIMEOUT = 1
+SETTLE_TIMEOUT = 30 # Seconds the server gets to return to its baseline once the churn ends.
+ENDINGS = ("exit", "close", "reset", "silent", "stalled") # Ways a churned client leaves the server.
+
+'''
+    measureServer(pid)
+        Returns a dictionary of the server's threads, open descriptors and CPU seconds along with the connection
+        and tracker counts of /stats, taken while the probe's own connection is open.
+'''
+def measureServer(pid):
+    connection = TrackerConnection()
+    try:
+        messageType, payload = connection.request("/stats")
+        with open("/proc/" + str(pid) + "/status") as file:
+            threads = int(next(line for line in file if line.startswith("Threads:")).split()[1])
+        descriptors = len(os.listdir("/proc/" + str(pid) + "/fd"))
+        with open("/proc/" + str(pid) + "/stat") as file:
+            fields = file.read().rsplit(")", 1)[1].split()
+        cpuSeconds = (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK") # utime and stime.
+    finally:
+        connection.close()
+
+    lines = payload.decode().replace("[stats]", "", 1).split("\n")
+    tracker = next(line for line in lines if line.startswith("Tracker: ")).split()
+    return {
+        "threads": threads,
+        "descriptors": descriptors,
+        "cpu": cpuSeconds,
+        "connected": int(lines[0].split(", ")[1].split()[0]),
+        "records": int(tracker[1]),
+        "clients": int(tracker[5]),
+    }
+
+'''
+    churnClient(cycle, ending, fileCount, heldSockets)
+        Runs one client through its connection: connect, announce, then leave the way the ending says. Silent
+        and stalled sockets are added to heldSockets so they stay open until the server reaps them.
+'''
+def churnClient(cycle, ending, fileCount, heldSockets):
+    connection = TrackerConnection()
+    connection.announce(["churn-" + str(cycle) + "-" + str(index) + ".bin" for index in range(fileCount)])
+    if ending == "exit":
+        connection.close()
+    elif ending == "close":
+        connection.socket.close()
+    elif ending == "reset":
+        connection.socket.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack("ii", 1, 0)) # Close with an RST.
+        connection.socket.close()
+    else:
+        if ending == "stalled":
+            payload = b"x" * 64
+            connection.socket.sendall(shared.packFrameHeader(shared.MSG_COMMAND, payload) + payload[:16]) # Never finishes the frame.
+        heldSockets.append(connection.socket)
+
+def runChurn(cycles, concurrency, fileCount, heldSockets):
+    endings = [random.choice(ENDINGS) for cycle in range(cycles)]
+    nextCycle = iter(range(cycles))
+    lock = threading.Lock()
+    errors = []
+
+    def worker():
+        while True:
+            with lock:
+                cycle = next(nextCycle, None)
+            if cycle is None: return
+            try:
+                churnClient(cycle, endings[cycle], fileCount, heldSockets)
+            except OSError as e:
+                errors.append(e)
+
+    threads = [threading.Thread(target = worker) for thread in range(concurrency)]
+    for thread in threads: thread.start()
+    for thread in threads: thread.join()
+    return {ending: endings.count(ending) for ending in ENDINGS}, errors
+
+'''
+    findLeftoverPeers(cycles)
+        Looks up one file of every churned client and returns how many of them the tracker still has a peer for.
+'''
+def findLeftoverPeers(cycles):
+    connection = TrackerConnection()
+    try:
+        results = connection.findFiles(["churn-" + str(cycle) + "-0.bin" for cycle in range(cycles)])
+    finally:
+        connection.close()
+    return sum(1 for fileSize, rootHash, peerAddresses in results.values() if peerAddresses)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Churns client connections through the server and checks it leaks no threads, sockets or tracker entries.")
+    parser.add_argument("--cycles", type = int, default = 5000, help = "client connections to churn")
+    parser.add_argument("--concurrency", type = int, default = 16, help = "clients connecting at once")
+    parser.add_argument("--files", type = int, default = 5, help = "files every client announces")
+    parser.add_argument("--async", dest = "asyncMode", action = "store_true", help = "run the server on its asyncio event loop")
+    parser.add_argument("--seed", type = int, default = None)
+    arguments = parser.parse_args()
+
+    random.seed(arguments.seed)
+    directory = tempfile.mkdtemp(prefix = "bench-churn-")
+    os.makedirs(os.path.join(directory, "tracked-files"))
+    serverArguments = ["--log-level", "WARNING", "--idle-timeout", str(IDLE_TIMEOUT), "--read-timeout", str(READ_TIMEOUT)] + (["--async"] if arguments.asyncMode else [])
+    server = startServer(directory, serverArguments)
+    heldSockets = []
+    leaks = []
+    try:
+        baseline = measureServer(server.pid)
+        startTime = time.perf_counter()
+        endings, errors = runChurn(arguments.cycles, arguments.concurrency, arguments.files, heldSockets)
+        churnTime = time.perf_counter() - startTime
+        peak = measureServer(server.pid)
+
+        # Wait for the reaper to drop the silent and stalled clients, which still hold their sockets open.
+        settleStart = time.perf_counter()
+        while True:
+            settled = measureServer(server.pid)
+            if all(settled[key] <= baseline[key] for key in ("threads", "descriptors", "connected", "records", "clients")): break
+            if time.perf_counter() - settleStart > SETTLE_TIMEOUT: break
+            time.sleep(0.25)
+        settleTime = time.perf_counter() - settleStart
+        leftoverPeers = findLeftoverPeers(arguments.cycles)
+
+        time.sleep(1) # A quiet second, the server should spend next to no CPU on it.
+        idle = measureServer(server.pid)
+        idleCpu = idle["cpu"] - settled["cpu"]
+
+        print(str(arguments.cycles) + " connections churned in " + str(round(churnTime, 2)) + "s (" + str(round(arguments.cycles / churnTime)) + "/s) by " + str(arguments.concurrency) + " clients at once, "
+            + ("async" if arguments.asyncMode else "threaded") + " server, " + str(IDLE_TIMEOUT) + "s idle and " + str(READ_TIMEOUT) + "s read timeouts:")
+        print("  endings: " + ", ".join(ending + " " + str(count) for ending, count in endings.items()) + (", " + str(len(errors)) + " client errors" if errors else ""))
+        print("  reaped in: " + str(round(settleTime, 2)) + "s after the churn, " + str(len(heldSockets)) + " silent or stalled sockets still open on the client side")
+        print("".ljust(14) + "baseline".rjust(10) + "peak".rjust(10) + "settled".rjust(10))
+        for key in ("threads", "descriptors", "connected", "records", "clients"):
+            print(("  " + key).ljust(14) + str(baseline[key]).rjust(10) + str(peak[key]).rjust(10) + str(settled[key]).rjust(10))
+            if settled[key] > baseline[key]: leaks.append(key)
+        print("  churned peers still returned by /findfiles: " + str(leftoverPeers))
+        print("  server CPU over a quiet second: " + str(round(idleCpu * 1000)) + "ms")
+        if leftoverPeers: leaks.append("peers")
+        print("FAIL, leaked " + ", ".join(leaks) if leaks else "PASS")
+    finally:
+        for heldSocket in heldSockets: heldSocket.close()
+        server.terminate()
+        server.wait()
+        shutil.rmtree(directory)
+    sys.exit(1 if leaks else 0)
@@ -0,0 +1,90 @@
+'''
+    Compression codec benchmark.
+
+    Reports the compression ratio and compress/decompress throughput of every file codec and level used by
+    /compress, and of every wire codec used for /fetchfile chunks, on a text-heavy payload and on the
+    sample mp3 in tracked-files/.
+
+    Usage:
+        #> python benchmarks/bench_compression.py [sizeMB]
+            [sizeMB]: Optional size of the generated text payload in MB, defaults to 32.
+'''
+
+import os
+import sys
+import random
+import shutil
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import shared
+import compression
+
+REPOSITORY_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+SAMPLE_MP3 = os.path.join(REPOSITORY_DIR, "tracked-files", "samplefile.mp3")
+WORDS = ["peer", "tracker", "piece", "segment", "swarm", "client", "server", "socket", "manifest", "hash", "file", "download"]
+
+'''
+    createTextFile(directory, sizeMB)
+        Writes a log-like text file of roughly the given size and returns its path.
+'''
+def createTextFile(directory, sizeMB):
+    filePath = os.path.join(directory, "payload.txt")
+    with open(filePath, "w") as file:
+        written = 0
+        while written < sizeMB * 1024 * 1024:
+            line = "[{}] {}:{} {}\n".format(random.randint(0, 10 ** 9), "127.0.0.1", random.randint(1, 65535), " ".join(random.choice(WORDS) for i in range(12)))
+            file.write(line)
+            written = written + len(line)
+    return filePath
+
+def benchmarkFileCodec(filePath, codec, level):
+    outputPath = filePath + compression.getCodecExtension(codec)
+    restoredPath = filePath + ".restored"
+    size = os.path.getsize(filePath)
+
+    startTime = time.perf_counter()
+    compression.compressFile(filePath, outputPath, codec, level)
+    compressTime = time.perf_counter() - startTime
+
+    startTime = time.perf_counter()
+    compression.decompressFile(outputPath, restoredPath, codec)
+    decompressTime = time.perf_counter() - startTime
+
+    ratio = os.path.getsize(outputPath) / size
+    os.remove(outputPath)
+    os.remove(restoredPath)
+    return ratio, size / 1048576 / compressTime, size / 1048576 / decompressTime
+
+def benchmarkWireCodec(filePath, codec, level):
+    with open(filePath, "rb") as file: data = file.read()
+    chunks = [data[offset:offset + shared.STREAM_CHUNK_SIZE] for offset in range(0, len(data), shared.STREAM_CHUNK_SIZE)]
+
+    startTime = time.perf_counter()
+    compressed = [compression.compressChunk(chunk, codec, level) for chunk in chunks]
+    compressTime = time.perf_counter() - startTime
+
+    startTime = time.perf_counter()
+    for chunk in compressed: compression.decompressChunk(chunk, codec)
+    decompressTime = time.perf_counter() - startTime
+
+    ratio = sum(len(chunk) for chunk in compressed) / len(data)
+    return ratio, len(data) / 1048576 / compressTime, len(data) / 1048576 / decompressTime
+
+if __name__ == "__main__":
+    sizeMB = int(sys.argv[1]) if len(sys.argv) > 1 else 32
+    print("{:>8} {:>6} {:>6} {:>6} {:>8} {:>16} {:>18}".format("Payload", "Mode", "Codec", "Level", "Ratio", "Compress (MB/s)", "Decompress (MB/s)"))
+    with tempfile.TemporaryDirectory() as directory:
+        mp3Path = os.path.join(directory, "sample.mp3") # Work on a copy so the tracked sample is never touched.
+        shutil.copyfile(SAMPLE_MP3, mp3Path)
+        payloads = [("text", createTextFile(directory, sizeMB)), ("mp3", mp3Path)]
+        for payloadName, filePath in payloads:
+            for codec, (extension, defaultLevel) in compression.FILE_CODECS.items():
+                for level in sorted(set([1, defaultLevel, 9 if codec != "zstd" else 19])):
+                    result = benchmarkFileCodec(filePath, codec, level)
+                    print("{:>8} {:>6} {:>6} {:>6} {:>8.3f} {:>16.1f} {:>18.1f}".format(payloadName, "file", codec, level, *result))
+            for codec, defaultLevel in compression.WIRE_CODECS.items():
+                for level in sorted(set([1, defaultLevel, 6])):
+                    result = benchmarkWireCodec(filePath, codec, level)
+                    print("{:>8} {:>6} {:>6} {:>6} {:>8.3f} {:>16.1f} {:>18.1f}".format(payloadName, "wire", codec, level, *result))
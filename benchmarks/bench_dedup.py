@@ -0,0 +1,169 @@
+'''
+    Deduplicated chunk store benchmark.
+
+    Builds a corpus of overlapping files spread over a few clients that share one working directory: base files,
+    exact copies under other names, versions with bytes inserted, versions with bytes overwritten, versions with
+    their start cut off and concatenations of two base files. Compares the disk space of keeping every client's
+    pieces on its own (the per-file segments of /split segments), of a store of fixed-size pieces and of the
+    content-defined chunk store, along with how fast files are chunked. Then downloads every variant from a
+    PeerServer on loopback into a client that only holds the base files, and compares the bytes fetched over the
+    network without a store, with a store of fixed-size pieces and with the chunk store. Every download is checked
+    against the original file.
+
+    Usage:
+        #> python benchmarks/bench_dedup.py [--file-size MB] [--base-files N] [--clients N] [--piece-size BYTES]
+'''
+
+import os
+import sys
+import argparse
+import hashlib
+import random
+import shutil
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import shared
+from manifest import createManifest, MANIFEST_NAME
+from chunkstore import ChunkStore, chunkFile, CHUNK_MAX_SIZE
+from swarm import PeerServer, SwarmDownload
+
+EDITS = 5 # Insertions or overwrites made in every edited variant.
+
+'''
+    createCorpus(random, fileSize, baseFiles)
+        Returns {file name: bytes} of the base files and their variants.
+'''
+def createCorpus(random, fileSize, baseFiles):
+    corpus = {}
+    for index in range(baseFiles):
+        corpus["base" + str(index) + ".bin"] = random.randbytes(fileSize)
+
+    for index in range(baseFiles):
+        data = corpus["base" + str(index) + ".bin"]
+        corpus["copy" + str(index) + ".bin"] = data
+
+        inserted = bytearray(data)
+        for offset in sorted(random.sample(range(fileSize), EDITS), reverse = True):
+            inserted[offset:offset] = random.randbytes(random.randint(1, 4096))
+        corpus["inserted" + str(index) + ".bin"] = bytes(inserted)
+
+        overwritten = bytearray(data)
+        for offset in random.sample(range(fileSize - 4096), EDITS):
+            overwritten[offset:offset + 64] = random.randbytes(64)
+        corpus["overwritten" + str(index) + ".bin"] = bytes(overwritten)
+
+        corpus["trimmed" + str(index) + ".bin"] = data[random.randint(1, 65536):]
+        corpus["joined" + str(index) + ".bin"] = data + corpus["base" + str((index + 1) % baseFiles) + ".bin"]
+    return corpus
+
+'''
+    measureStorage(directory, corpus, clients, pieceSize)
+        Spreads the corpus over the clients, every client holding the base files and a share of the variants, and
+        returns the bytes of per-client segments, of a fixed-size piece store and of the chunk store, along with
+        the seconds spent chunking.
+'''
+def measureStorage(directory, corpus, clients, pieceSize):
+    variants = [fileName for fileName in corpus if not fileName.startswith("base")]
+    holdings = []
+    for client in range(clients):
+        fileNames = [fileName for fileName in corpus if fileName.startswith("base")] + variants[client::clients]
+        holdings.append(fileNames)
+        clientDirectory = os.path.join(directory, str(7000 + client))
+        os.makedirs(clientDirectory)
+        for fileName in fileNames:
+            with open(os.path.join(clientDirectory, fileName), "wb") as file:
+                file.write(corpus[fileName])
+
+    segmentBytes = sum(len(corpus[fileName]) for fileNames in holdings for fileName in fileNames)
+    fixedPieces = {}
+    chunkStore = ChunkStore(os.path.join(directory, "chunks"))
+    chunkTime = 0
+    for client, fileNames in enumerate(holdings):
+        for fileName in fileNames:
+            filePath = os.path.join(directory, str(7000 + client), fileName)
+            manifest = createManifest(filePath, pieceSize)
+            for index, digest in enumerate(manifest.pieces): fixedPieces[digest] = manifest.getPieceRange(index)[1]
+
+            startTime = time.perf_counter()
+            chunkSizes = chunkFile(filePath)
+            chunkTime = chunkTime + time.perf_counter() - startTime
+            chunkStore.addFile(filePath, createManifest(filePath, CHUNK_MAX_SIZE, 1, chunkSizes))
+    return segmentBytes, sum(fixedPieces.values()), chunkStore.getStats(), chunkTime
+
+'''
+    measureTransfer(directory, corpus, mode, pieceSize)
+        Downloads every variant from a seeding PeerServer into a client holding only the base files, returns the
+        bytes fetched from the seeder and whether every download matched. The mode is "none" for no store, "fixed"
+        for a store of fixed-size pieces or "cdc" for the chunk store.
+'''
+def measureTransfer(directory, corpus, mode, pieceSize):
+    seedDirectory = os.path.join(directory, mode, "seed")
+    clientDirectory = os.path.join(directory, mode, "client")
+    os.makedirs(seedDirectory)
+    os.makedirs(clientDirectory)
+    chunkStore = ChunkStore(os.path.join(directory, mode, "chunks")) if mode != "none" else None
+
+    def splitFile(filePath, fileName, store):
+        if mode == "cdc": manifest = createManifest(filePath, CHUNK_MAX_SIZE, 1, chunkFile(filePath))
+        else: manifest = createManifest(filePath, pieceSize)
+        manifestDirectory = os.path.join(os.path.dirname(filePath), "raw", fileName)
+        os.makedirs(manifestDirectory, exist_ok = True)
+        manifest.save(os.path.join(manifestDirectory, MANIFEST_NAME))
+        if store: store.addFile(filePath, manifest)
+
+    for fileName, data in corpus.items():
+        with open(os.path.join(seedDirectory, fileName), "wb") as file:
+            file.write(data)
+        splitFile(os.path.join(seedDirectory, fileName), fileName, None)
+        if fileName.startswith("base"):
+            with open(os.path.join(clientDirectory, fileName), "wb") as file:
+                file.write(data)
+            splitFile(os.path.join(clientDirectory, fileName), fileName, chunkStore)
+
+    peerServer = PeerServer(seedDirectory, "127.0.0.1")
+    peerServer.start()
+    fetchedBytes = 0
+    matched = True
+    try:
+        for fileName, data in corpus.items():
+            if fileName.startswith("base"): continue
+            download = SwarmDownload(fileName, [peerServer.address], clientDirectory, None, None, chunkStore)
+            if not download.run(): return fetchedBytes, False
+            fetchedBytes = fetchedBytes + sum(bytesReceived for address, bytesReceived, throughput in download.getPeerStats())
+            with open(os.path.join(clientDirectory, fileName), "rb") as file:
+                matched = matched and hashlib.sha256(file.read()).digest() == hashlib.sha256(data).digest()
+    finally:
+        peerServer.close()
+    return fetchedBytes, matched
+
+def formatSize(size):
+    return str(round(size / 1048576, 2)) + " MB"
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Compares the disk space and transfer bytes of per-file segments, fixed-size pieces and content-defined chunks.")
+    parser.add_argument("--file-size", type = float, default = 4, help = "size of every base file in MB")
+    parser.add_argument("--base-files", type = int, default = 3, help = "base files every variant is made from")
+    parser.add_argument("--clients", type = int, default = 3, help = "clients sharing the working directory")
+    parser.add_argument("--piece-size", type = int, default = shared.PIECE_SIZE, help = "bytes per fixed-size piece")
+    parser.add_argument("--seed", type = int, default = 0)
+    arguments = parser.parse_args()
+
+    corpus = createCorpus(random.Random(arguments.seed), int(arguments.file_size * 1048576), arguments.base_files)
+    directory = tempfile.mkdtemp(prefix = "bench-dedup-")
+    try:
+        segmentBytes, fixedBytes, chunkStats, chunkTime = measureStorage(os.path.join(directory, "storage"), corpus, arguments.clients, arguments.piece_size)
+        print(str(len(corpus)) + " files (" + formatSize(sum(len(data) for data in corpus.values())) + ") over " + str(arguments.clients) + " clients, " + str(arguments.piece_size) + " byte fixed pieces:")
+        print("  per-client segments:   " + formatSize(segmentBytes).rjust(10))
+        print("  fixed-size piece store:" + formatSize(fixedBytes).rjust(10) + " (" + str(round(100 * fixedBytes / segmentBytes, 1)) + "%)")
+        print("  chunk store:           " + formatSize(chunkStats["bytes"]).rjust(10) + " (" + str(round(100 * chunkStats["bytes"] / segmentBytes, 1)) + "%, " + str(chunkStats["chunks"]) + " chunks)")
+        print("  chunked at " + str(round(segmentBytes / 1048576 / chunkTime, 1)) + " MB/s")
+
+        variantBytes = sum(len(data) for fileName, data in corpus.items() if not fileName.startswith("base"))
+        print("Downloading every variant (" + formatSize(variantBytes) + ") into a client holding the base files:")
+        for mode, label in (("none", "no store"), ("fixed", "fixed-size piece store"), ("cdc", "chunk store")):
+            fetchedBytes, matched = measureTransfer(os.path.join(directory, "transfer"), corpus, mode, arguments.piece_size)
+            print(("  " + label + ":").ljust(26) + formatSize(fetchedBytes).rjust(10) + " fetched (" + str(round(100 * fetchedBytes / variantBytes, 1)) + "%)" + ("" if matched else ", MISMATCH"))
+    finally:
+        shutil.rmtree(directory)
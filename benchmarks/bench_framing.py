@@ -0,0 +1,61 @@
+'''
+    Framed transfer throughput benchmark.
+
+    Streams payloads of increasing size through shared.sendFrame/shared.recvFrame over a loopback TCP
+    connection and reports the throughput of each transfer in MB/s.
+
+    Usage:
+        #> python benchmarks/bench_framing.py [sizes]
+            [sizes]: Optional list of payload sizes in MB, defaults to 1 16 128 1024.
+'''
+
+import os
+import sys
+import socket
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import shared
+
+DEFAULT_SIZES = [1, 16, 128, 1024] # Payload sizes to benchmark, in MB.
+
+'''
+    createLoopbackPair()
+        Returns a connected (sender, receiver) pair of TCP sockets on the loopback interface.
+'''
+def createLoopbackPair():
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.bind(("127.0.0.1", 0))
+    listener.listen(1)
+    sender = socket.create_connection(listener.getsockname())
+    receiver, _ = listener.accept()
+    listener.close()
+    return sender, receiver
+
+'''
+    benchmarkTransfer(sizeMB)
+        Sends a single frame of the given size and returns the elapsed time in seconds.
+'''
+def benchmarkTransfer(sizeMB):
+    payload = os.urandom(1024 * 1024) * sizeMB # Repeat a random block so generating the payload stays cheap.
+    sender, receiver = createLoopbackPair()
+
+    thread = threading.Thread(target = shared.sendFrame, args = (sender, shared.MSG_FILE, payload))
+    startTime = time.perf_counter()
+    thread.start()
+    messageType, received = shared.recvFrame(receiver)
+    elapsed = time.perf_counter() - startTime
+    thread.join()
+
+    sender.close()
+    receiver.close()
+    assert len(received) == len(payload)
+    return elapsed
+
+if __name__ == "__main__":
+    sizes = [int(size) for size in sys.argv[1:]] or DEFAULT_SIZES
+    print("{:>10} {:>12} {:>12}".format("Size (MB)", "Time (s)", "MB/s"))
+    for sizeMB in sizes:
+        elapsed = benchmarkTransfer(sizeMB)
+        print("{:>10} {:>12.3f} {:>12.1f}".format(sizeMB, elapsed, sizeMB / elapsed))
@@ -0,0 +1,38 @@
+'''
+    Piece hashing throughput benchmark.
+
+    Builds the piece manifest of files of increasing size with one thread and with several threads and
+    reports the hashing throughput in MB/s.
+
+    Usage:
+        #> python benchmarks/bench_hashing.py [sizes]
+            [sizes]: Optional list of file sizes in MB, defaults to 64 256 1024.
+'''
+
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import shared
+from manifest import hashPieces
+from bench_streaming import createTestFile
+
+DEFAULT_SIZES = [64, 256, 1024] # File sizes to benchmark, in MB.
+PIECE_SIZES = [shared.PIECE_SIZE, 1048576] # Piece sizes to benchmark, in bytes.
+THREAD_COUNTS = sorted(set([1, 2, 4, os.cpu_count() or 1]))
+
+if __name__ == "__main__":
+    sizes = [int(size) for size in sys.argv[1:]] or DEFAULT_SIZES
+    print("{:>10} {:>12} {:>8} {:>10}".format("Size (MB)", "Piece size", "Threads", "MB/s"))
+    with tempfile.TemporaryDirectory() as directory:
+        for sizeMB in sizes:
+            filePath = createTestFile(directory, sizeMB)
+            for pieceSize in PIECE_SIZES:
+                for threads in THREAD_COUNTS:
+                    startTime = time.perf_counter()
+                    hashPieces(filePath, pieceSize, threads)
+                    elapsed = time.perf_counter() - startTime
+                    print("{:>10} {:>12} {:>8} {:>10.1f}".format(sizeMB, pieceSize, threads, sizeMB / elapsed))
+            os.remove(filePath)
@@ -0,0 +1,113 @@
+'''
+    Server instrumentation overhead benchmark.
+
+    Starts a server with metrics off, with metrics on, with metrics on while being scraped every second and
+    with every request logged at DEBUG, then sends pipelined /findfile lookups to each and reports the lookups
+    per second and the server CPU time spent per lookup, with its overhead relative to the server without
+    metrics. The client shares the machine with the server, so on few cores the CPU time is the steadier
+    number. Each configuration is run several times and the best run is kept. The server is started on the
+    default address, which must be free, and its output is discarded.
+
+    Usage:
+        #> python benchmarks/bench_metrics.py [--commands N] [--depth N] [--rounds N]
+'''
+
+import os
+import sys
+import argparse
+import shutil
+import tempfile
+import threading
+import time
+import urllib.request
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from client import TrackerConnection
+from benchserver import startServer
+
+METRICS_PORT = 9187 # Local port of the Prometheus endpoint in the scraped configuration.
+TRACKED_FILES = 1000 # Files announced before the lookups so /findfile has something to find.
+
+CONFIGURATIONS = [ # (name, server arguments, scrape the endpoint)
+    ("metrics off", ["--no-metrics"], False),
+    ("metrics on", [], False),
+    ("metrics on, scraped", ["--metrics-port", str(METRICS_PORT)], True),
+    ("metrics on, DEBUG log", ["--log-level", "DEBUG"], False),
+]
+
+'''
+    scrapeMetrics(stopEvent)
+        Fetches the Prometheus endpoint once a second until the event is set, the way a real scraper would.
+'''
+def scrapeMetrics(stopEvent):
+    while not stopEvent.wait(1):
+        urllib.request.urlopen("http://127.0.0.1:" + str(METRICS_PORT) + "/metrics").read()
+
+'''
+    getCpuTime(pid)
+        Returns the user and system CPU seconds used by a process so far, or None where /proc is unavailable.
+'''
+def getCpuTime(pid):
+    try:
+        with open("/proc/" + str(pid) + "/stat") as file:
+            fields = file.read().rsplit(")", 1)[1].split()
+    except OSError:
+        return None
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+'''
+    measureRate(directory, serverArguments, scrape, commands, depth)
+        Runs the lookups against a freshly started server, returns (commands per second, server CPU seconds per
+        command), the latter None where it cannot be measured.
+'''
+def measureRate(directory, serverArguments, scrape, commands, depth):
+    server = startServer(directory, serverArguments)
+    stopEvent = threading.Event()
+    try:
+        connection = TrackerConnection()
+        try:
+            connection.pipeline(["/addfile bench-" + str(i) + ".mp3" for i in range(TRACKED_FILES)], depth)
+            if scrape: threading.Thread(target = scrapeMetrics, args = (stopEvent,), daemon = True).start()
+
+            startCpuTime = getCpuTime(server.pid)
+            startTime = time.perf_counter()
+            responses = connection.pipeline(commands, depth)
+            elapsed = time.perf_counter() - startTime
+            endCpuTime = getCpuTime(server.pid)
+            if len(responses) != len(commands): raise RuntimeError("Missing responses.")
+            return len(commands) / elapsed, None if startCpuTime is None else (endCpuTime - startCpuTime) / len(commands)
+        finally:
+            connection.close()
+    finally:
+        stopEvent.set()
+        server.terminate()
+        server.wait()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Measures the throughput cost of server metrics and logging.")
+    parser.add_argument("--commands", type = int, default = 50000, help = "lookups sent to every server")
+    parser.add_argument("--depth", type = int, default = 16, help = "commands kept in flight")
+    parser.add_argument("--rounds", type = int, default = 3, help = "runs of every configuration, the best is kept")
+    arguments = parser.parse_args()
+
+    commands = ["/findfile bench-" + str(i % TRACKED_FILES) + ".mp3" for i in range(arguments.commands)]
+    directory = tempfile.mkdtemp(prefix = "bench-metrics-")
+    try:
+        rates = {}
+        cpuTimes = {}
+        for attempt in range(arguments.rounds): # Interleave the configurations so drifting machine load hits them all alike.
+            for name, serverArguments, scrape in CONFIGURATIONS:
+                rate, cpuTime = measureRate(directory, serverArguments, scrape, commands, arguments.depth)
+                rates[name] = max(rates.get(name, 0), rate)
+                if cpuTime is not None: cpuTimes[name] = min(cpuTimes.get(name, cpuTime), cpuTime)
+
+        baseline = CONFIGURATIONS[0][0]
+        print(str(arguments.commands) + " pipelined /findfile lookups at depth " + str(arguments.depth) + ", best of " + str(arguments.rounds) + ":")
+        print("".ljust(28) + "commands/s".rjust(12) + "overhead".rjust(10) + "server CPU".rjust(14) + "overhead".rjust(10))
+        for name, serverArguments, scrape in CONFIGURATIONS:
+            line = "    " + name.ljust(24) + str(round(rates[name])).rjust(12) + (str(round((rates[baseline] - rates[name]) / rates[baseline] * 100, 1)) + "%").rjust(10)
+            if name in cpuTimes:
+                line = line + (str(round(cpuTimes[name] * 1000000, 1)) + "us/cmd").rjust(14) + (str(round((cpuTimes[name] - cpuTimes[baseline]) / cpuTimes[baseline] * 100, 1)) + "%").rjust(10)
+            print(line)
+    finally:
+        shutil.rmtree(directory)
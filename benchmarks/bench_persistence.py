@@ -0,0 +1,71 @@
+'''
+    Tracker persistence benchmark.
+
+    Announces a growing number of (peer, file) records to an in-memory and to a persisted tracker index and
+    reports the announce throughput of each, then the time taken to write a snapshot and to restart from the
+    log alone and from the snapshot alone.
+
+    Usage:
+        #> python benchmarks/bench_persistence.py [entries]
+            [entries]: Optional list of total record counts, defaults to 100000 1000000.
+'''
+
+import os
+import sys
+import shutil
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from tracker import TrackerIndex, PersistentTrackerIndex
+
+DEFAULT_ENTRIES = [100000, 1000000] # Total (peer, file) records to benchmark.
+FILES_PER_PEER = 1000 # Number of files announced by every fake peer, in one batch.
+
+'''
+    announceAll(index, entries)
+        Announces the given number of records in batches of FILES_PER_PEER, returns the records per second.
+'''
+def announceAll(index, entries):
+    startTime = time.perf_counter()
+    for peerNumber in range(max(1, entries // FILES_PER_PEER)):
+        peer = ("127.0.0.1", 20000 + peerNumber)
+        index.addFiles(peer, [("file-" + str(peerNumber) + "-" + str(i) + ".mp3", 1048576 + i, None) for i in range(FILES_PER_PEER)])
+        index.setServingAddress(peer, ("127.0.0.1", 40000 + peerNumber))
+    return entries / (time.perf_counter() - startTime)
+
+def timeReload(stateDirectory):
+    startTime = time.perf_counter()
+    index = PersistentTrackerIndex(stateDirectory)
+    elapsed = time.perf_counter() - startTime
+    index.logFile.close() # Leave the state exactly as it was.
+    return elapsed, len(index)
+
+if __name__ == "__main__":
+    entryCounts = [int(entries) for entries in sys.argv[1:]] or DEFAULT_ENTRIES
+
+    print("records".rjust(9) + "  memory/s".rjust(12) + "  logged/s".rjust(12) + "  snapshot".rjust(11) + "  replay log".rjust(12) + "  load snapshot".rjust(15))
+    for entries in entryCounts:
+        stateDirectory = tempfile.mkdtemp(prefix = "tracker-state-")
+        try:
+            memoryRate = announceAll(TrackerIndex(), entries)
+
+            index = PersistentTrackerIndex(stateDirectory)
+            loggedRate = announceAll(index, entries)
+            index.logFile.close()
+
+            replayTime, replayed = timeReload(stateDirectory) # Only the log exists so far.
+
+            index = PersistentTrackerIndex(stateDirectory)
+            startTime = time.perf_counter()
+            index.snapshot()
+            snapshotTime = time.perf_counter() - startTime
+            index.close()
+
+            loadTime, loaded = timeReload(stateDirectory)
+            if replayed != entries or loaded != entries: raise RuntimeError("Reloaded tracker is missing records.")
+
+            print(str(entries).rjust(9) + str(round(memoryRate)).rjust(12) + str(round(loggedRate)).rjust(12) + (str(round(snapshotTime, 2)) + "s").rjust(11)
+                + (str(round(replayTime, 2)) + "s").rjust(12) + (str(round(loadTime, 2)) + "s").rjust(15))
+        finally:
+            shutil.rmtree(stateDirectory)
@@ -0,0 +1,55 @@
+'''
+    Pipelined command benchmark.
+
+    Sends a stream of /findfile lookups to a running server over a single TrackerConnection and reports the
+    number of commands answered per second with 1, 8 and 64 commands in flight at once. Start the server
+    first with its output discarded, e.g. `python server.py > /dev/null`.
+
+    Usage:
+        #> python benchmarks/bench_pipeline.py [--commands N] [--depths D ..] [--host H] [--port P]
+'''
+
+import os
+import sys
+import argparse
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import shared
+from client import TrackerConnection
+
+DEFAULT_DEPTHS = [1, 8, 64] # Number of commands kept in flight.
+TRACKED_FILES = 1000 # Files announced before the lookups so /findfile has something to find.
+
+'''
+    runDepth(connection, commands, depth)
+        Sends every command keeping depth of them in flight, returns the number of commands per second.
+'''
+def runDepth(connection, commands, depth):
+    startTime = time.perf_counter()
+    responses = connection.pipeline(commands, depth)
+    elapsed = time.perf_counter() - startTime
+    if len(responses) != len(commands): raise RuntimeError("Missing responses.")
+    return len(commands) / elapsed
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Measures tracker commands per second at several pipeline depths.")
+    parser.add_argument("--commands", type = int, default = 20000, help = "lookups sent at every depth")
+    parser.add_argument("--depths", type = int, nargs = "+", default = DEFAULT_DEPTHS, help = "pipeline depths to measure")
+    parser.add_argument("--host", default = shared.SERVER_ADDRESS[0])
+    parser.add_argument("--port", type = int, default = shared.SERVER_ADDRESS[1])
+    arguments = parser.parse_args()
+
+    connection = TrackerConnection((arguments.host, arguments.port))
+    try:
+        connection.pipeline(["/addfile bench-" + str(i) + ".mp3" for i in range(TRACKED_FILES)], 64)
+        commands = ["/findfile bench-" + str(i % TRACKED_FILES) + ".mp3" for i in range(arguments.commands)]
+
+        print("Pipelined /findfile lookups, " + str(arguments.commands) + " per depth:")
+        baseline = None
+        for depth in arguments.depths:
+            rate = runDepth(connection, commands, depth)
+            if baseline is None: baseline = rate
+            print("    depth " + str(depth).rjust(3) + ": " + str(round(rate)).rjust(8) + " commands/s (" + str(round(rate / baseline, 1)) + "x)")
+    finally:
+        connection.close()
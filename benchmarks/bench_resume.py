@@ -0,0 +1,132 @@
+'''
+    Resumable transfer benchmark.
+
+    Downloads a file from a local server while dropping the connection at random points of the transfer, and
+    compares downloading it again from the start with /fetchfile against resuming it with /fetchrange and the
+    client's on-disk bitfield. Every drop point is drawn once and used for both, and every completed download
+    is checked against the server's copy. The bytes re-sent are the server's bytes out, read from /stats,
+    beyond those of a download without drops; with resuming they are bounded by the pieces that were in flight
+    when the connection dropped. The server is started on the default address, which must be free.
+
+    Usage:
+        #> python benchmarks/bench_resume.py [--file-size MB] [--drops N] [--trials N] [--codec zlib]
+'''
+
+import os
+import sys
+import argparse
+import hashlib
+import random
+import shutil
+import socket
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import shared
+from client import TrackerConnection
+from bench_cache import createTrackedFiles
+from benchserver import startServer
+
+'''
+    getBytesSent()
+        Returns the bytes the server has sent to every client so far, as reported by /stats. Waits until every
+        other connection is closed, as a connection only counts a file it streams once the stream has ended.
+'''
+def getBytesSent():
+    connection = TrackerConnection()
+    try:
+        while True:
+            messageType, payload = connection.request("/stats")
+            lines = payload.decode().split("\n")
+            if " 1 clients connected" in lines[0]: break
+            time.sleep(0.01)
+    finally:
+        connection.close()
+    for line in lines:
+        if line.startswith("Traffic: "): return int(line.split()[4])
+    raise RuntimeError("No traffic in /stats.")
+
+def hashFile(filePath):
+    with open(filePath, "rb") as file:
+        return hashlib.file_digest(file, "sha256").hexdigest()
+
+'''
+    download(directory, fileName, mode, codec, dropTimes)
+        Downloads the file into the directory, dropping the connection after each of the delays in turn until a
+        download attempt completes. Returns the number of drops that interrupted a transfer.
+'''
+def download(directory, fileName, mode, codec, dropTimes):
+    drops = 0
+    dropTimes = list(dropTimes)
+    while True:
+        connection = TrackerConnection(directory = directory)
+        timer = threading.Timer(dropTimes.pop(0), connection.socket.shutdown, (socket.SHUT_RDWR,)) if dropTimes else None
+        if timer: timer.start()
+        try:
+            if mode == "resume":
+                connection.fetchResumable(fileName, (codec,) if codec else ())
+            else:
+                connection.request("/fetchfile " + fileName + (" " + codec if codec else ""))
+            return drops
+        except (OSError, shared.ProtocolError):
+            drops = drops + 1
+        finally:
+            if timer: timer.cancel()
+            try:
+                connection.close()
+            except OSError:
+                pass
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Measures the bytes re-sent when interrupted downloads restart or resume.")
+    parser.add_argument("--file-size", dest = "fileSize", type = int, default = 256, help = "size of the downloaded file in MB")
+    parser.add_argument("--drops", type = int, default = 4, help = "connection drops attempted during every download")
+    parser.add_argument("--trials", type = int, default = 3, help = "downloads per mode, each with fresh drop points")
+    parser.add_argument("--codec", default = None, help = "wire codec to request, such as zlib, raw bytes by default")
+    parser.add_argument("--seed", type = int, default = None)
+    arguments = parser.parse_args()
+
+    random.seed(arguments.seed)
+    directory = tempfile.mkdtemp(prefix = "bench-resume-")
+    server = None
+    try:
+        fileName = createTrackedFiles(directory, 1, arguments.fileSize * 1048576)[0]
+        expectedHash = hashFile(os.path.join(directory, "tracked-files", fileName))
+        server = startServer(directory, ["--log-level", "WARNING"])
+
+        # Time a download without drops so the drop points can be spread over a whole transfer, the second one
+        # once the server has the file cached. Its bytes out are what a download costs without any drops.
+        clientDirectory = os.path.join(directory, "client")
+        os.makedirs(clientDirectory)
+        for attempt in range(2):
+            bytesSent = getBytesSent()
+            startTime = time.perf_counter()
+            download(clientDirectory, fileName, "restart", arguments.codec, [])
+            transferTime = time.perf_counter() - startTime
+            transferBytes = getBytesSent() - bytesSent
+            os.remove(os.path.join(clientDirectory, fileName))
+
+        results = {"restart": [0, 0, 0.0], "resume": [0, 0, 0.0]} # Mode -> [drops, bytes re-sent, seconds].
+        for trial in range(arguments.trials):
+            dropTimes = [random.uniform(0, transferTime) for drop in range(arguments.drops)]
+            for mode, result in results.items():
+                bytesSent = getBytesSent()
+                startTime = time.perf_counter()
+                result[0] = result[0] + download(clientDirectory, fileName, mode, arguments.codec, dropTimes)
+                result[2] = result[2] + time.perf_counter() - startTime
+                result[1] = result[1] + getBytesSent() - bytesSent - transferBytes
+                if hashFile(os.path.join(clientDirectory, fileName)) != expectedHash: raise RuntimeError(mode + " produced a corrupt file.")
+                os.remove(os.path.join(clientDirectory, fileName))
+
+        print(str(arguments.trials) + " downloads of a " + str(arguments.fileSize) + " MB file (" + (arguments.codec or "raw") + ", " + str(round(transferTime, 3)) + "s uninterrupted), up to " + str(arguments.drops) + " drops each, every file verified:")
+        print("".ljust(10) + "drops".rjust(8) + "MB re-sent".rjust(14) + "of a download".rjust(15) + "seconds".rjust(10))
+        for mode, (drops, bytesResent, elapsed) in results.items():
+            print(("  " + mode).ljust(10) + str(drops).rjust(8) + str(round(bytesResent / 1048576, 1)).rjust(14)
+                + (str(round(bytesResent / (transferBytes * arguments.trials) * 100, 1)) + "%").rjust(15) + str(round(elapsed, 2)).rjust(10))
+    finally:
+        if server:
+            server.terminate()
+            server.wait()
+        shutil.rmtree(directory)
@@ -0,0 +1,70 @@
+'''
+    Segment split and build benchmark.
+
+    Times splitting a file into segments and building it back with the segment store against the previous
+    approach: reading and writing every segment through Python buffers on split, and reopening the output
+    in append mode for every segment on build.
+
+    Usage:
+        #> python benchmarks/bench_segments.py [sizes]
+            [sizes]: Optional list of file sizes in MB, defaults to 100 1024.
+'''
+
+import os
+import sys
+import shutil
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import shared
+import segments
+from bench_streaming import createTestFile
+
+DEFAULT_SIZES = [100, 1024] # File sizes to benchmark, in MB.
+
+def legacySplit(filePath, outputDirectory, pieceSize):
+    fileName = os.path.basename(filePath)
+    index = 0
+    with open(filePath, "rb") as inputFile:
+        while True:
+            pieceData = inputFile.read(pieceSize)
+            if not pieceData: break
+            with open(os.path.join(outputDirectory, segments.getSegmentName(fileName, index)), "wb") as segmentFile:
+                segmentFile.write(pieceData)
+            index = index + 1
+
+def legacyBuild(segmentDirectory, fileName, outputPath):
+    for rawFile in sorted(os.listdir(segmentDirectory)):
+        with open(outputPath, "ab") as outputFile, open(os.path.join(segmentDirectory, rawFile), "rb") as inputFile:
+            outputFile.write(inputFile.read())
+
+def timeCall(function, *arguments):
+    startTime = time.perf_counter()
+    function(*arguments)
+    return time.perf_counter() - startTime
+
+if __name__ == "__main__":
+    sizes = [int(size) for size in sys.argv[1:]] or DEFAULT_SIZES
+    pieceSize = shared.PIECE_SIZE
+    print("{:>10} {:>10} {:>12} {:>12}".format("Size (MB)", "Method", "Split (s)", "Build (s)"))
+    with tempfile.TemporaryDirectory() as directory:
+        for sizeMB in sizes:
+            filePath = createTestFile(directory, sizeMB)
+            fileName = os.path.basename(filePath)
+            for method in ["legacy", "segments"]:
+                segmentDirectory = os.path.join(directory, "raw-" + method)
+                outputPath = os.path.join(directory, "built-" + method)
+                os.makedirs(segmentDirectory)
+
+                if method == "legacy":
+                    splitTime = timeCall(legacySplit, filePath, segmentDirectory, pieceSize)
+                    buildTime = timeCall(legacyBuild, segmentDirectory, fileName, outputPath)
+                else:
+                    splitTime = timeCall(segments.splitFile, filePath, segmentDirectory, pieceSize)
+                    buildTime = timeCall(segments.buildFile, segmentDirectory, fileName, outputPath)
+                print("{:>10} {:>10} {:>12.2f} {:>12.2f}".format(sizeMB, method, splitTime, buildTime))
+
+                shutil.rmtree(segmentDirectory)
+                os.remove(outputPath)
+            os.remove(filePath)
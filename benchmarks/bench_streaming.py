@@ -0,0 +1,99 @@
+'''
+    Streaming file transfer benchmark.
+
+    Compares the buffered transfer path (whole file read into memory and sent as one frame) against the
+    streaming path (sendfile on the sender, memory-mapped receive on the receiver). Each transfer runs in
+    a fresh process so the reported peak RSS belongs to that transfer alone.
+
+    Usage:
+        #> python benchmarks/bench_streaming.py [sizes]
+            [sizes]: Optional list of file sizes in MB, defaults to 16 128 512.
+'''
+
+import os
+import sys
+import resource
+import subprocess
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import shared
+from bench_framing import createLoopbackPair
+
+DEFAULT_SIZES = [16, 128, 512] # File sizes to benchmark, in MB.
+MODES = ["buffered", "streaming"]
+
+'''
+    createTestFile(directory, sizeMB)
+        Writes a file of the given size to disk in 1 MB blocks and returns its path.
+'''
+def createTestFile(directory, sizeMB):
+    filePath = os.path.join(directory, "input-" + str(sizeMB) + ".bin")
+    block = os.urandom(1024 * 1024)
+    with open(filePath, "wb") as file:
+        for i in range(sizeMB): file.write(block)
+    return filePath
+
+def sendBuffered(sender, filePath):
+    with open(filePath, "rb") as file:
+        fileData = file.read()
+    shared.sendFrame(sender, shared.MSG_FILE, fileData)
+
+def recvBuffered(receiver, outputPath):
+    messageType, payload = shared.recvFrame(receiver)
+    with open(outputPath, "wb") as file:
+        file.write(payload)
+
+def sendStreaming(sender, filePath):
+    with open(filePath, "rb") as file:
+        shared.sendFileStream(sender, file, os.fstat(file.fileno()).st_size)
+
+def recvStreaming(receiver, outputPath, size):
+    shared.recvFileStream(receiver, outputPath, size)
+
+'''
+    runTransfer(mode, filePath)
+        Performs a single transfer in the current process and prints "<seconds> <peak rss kb>".
+'''
+def runTransfer(mode, filePath):
+    size = os.path.getsize(filePath)
+    outputPath = filePath + ".out"
+    sender, receiver = createLoopbackPair()
+
+    if mode == "buffered":
+        thread = threading.Thread(target = sendBuffered, args = (sender, filePath))
+    else:
+        thread = threading.Thread(target = sendStreaming, args = (sender, filePath))
+
+    startTime = time.perf_counter()
+    thread.start()
+    if mode == "buffered":
+        recvBuffered(receiver, outputPath)
+    else:
+        recvStreaming(receiver, outputPath, size)
+    elapsed = time.perf_counter() - startTime
+    thread.join()
+
+    sender.close()
+    receiver.close()
+    assert os.path.getsize(outputPath) == size
+    os.remove(outputPath)
+    print(elapsed, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)
+
+if __name__ == "__main__":
+    if len(sys.argv) == 4 and sys.argv[1] == "--child":
+        runTransfer(sys.argv[2], sys.argv[3])
+        sys.exit(0)
+
+    sizes = [int(size) for size in sys.argv[1:]] or DEFAULT_SIZES
+    print("{:>10} {:>10} {:>10} {:>14}".format("Size (MB)", "Mode", "MB/s", "Peak RSS (MB)"))
+    with tempfile.TemporaryDirectory() as directory:
+        for sizeMB in sizes:
+            filePath = createTestFile(directory, sizeMB)
+            for mode in MODES:
+                output = subprocess.check_output([sys.executable, os.path.abspath(__file__), "--child", mode, filePath])
+                elapsed, peakRSS = output.split()
+                print("{:>10} {:>10} {:>10.1f} {:>14.1f}".format(sizeMB, mode, sizeMB / float(elapsed), int(peakRSS) / 1024))
+            os.remove(filePath)
@@ -0,0 +1,437 @@
+'''
+    End-to-end swarm simulation.
+
+    Starts the server and a swarm of headless clients on loopback, then runs scripted workloads against them
+    one after another:
+        announce    every client announces batches of files at once.
+        lookup      every client looks up files announced by random clients, some of which nobody has.
+        fetch       every client fetches each of the server's tracked files, of different sizes, with /fetchrange.
+        swarm       a few seeders share files of different sizes and every other client downloads them from the
+                    seeders in parallel.
+        churn       every client repeatedly connects a second time, announces a few files and leaves.
+    Every headless client is a TrackerConnection with a PeerServer, just like the interactive client. Clients run
+    on threads of the benchmark itself (--processes 0) or are spread over worker processes. For each workload
+    the report holds the throughput, the p50/p90/p99/max latency of every operation, the CPU the server and the
+    clients spent on it and the peak RSS of both, along with the commit and machine it was measured on.
+    --output writes the report as JSON, and --compare prints how a run differs from a report saved earlier,
+    such as one of the commit before a change. Reads the server's /proc entries for its CPU and memory, so those
+    are only reported on Linux. The server is started on the default address, which must be free.
+
+    Usage:
+        #> python benchmarks/bench_swarm.py [--clients N] [--processes N] [--workloads announce,lookup,..]
+               [--server-args="--async"] [--output report.json] [--compare baseline.json]
+'''
+
+import os
+import sys
+import argparse
+import json
+import multiprocessing
+import platform
+import random
+import resource
+import shlex
+import shutil
+import subprocess
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import shared
+from client import TrackerConnection
+from manifest import createManifest, MANIFEST_NAME
+from swarm import PeerServer, SwarmDownload
+from loadgen import percentile, raiseFileLimit
+from benchserver import startServer
+
+SERVER_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "server.py")
+WORKLOADS = ("announce", "lookup", "fetch", "swarm", "churn")
+CHURN_FILES = 5 # Files every churned connection announces.
+LOOKUP_MISSES = 0.1 # Fraction of lookups for files nobody has.
+
+'''
+    measureServer(pid)
+        Returns the CPU seconds and peak RSS in bytes of the server, together with its worker processes when it
+        runs with --workers, or None where /proc is not available.
+'''
+def measureServer(pid):
+    cpuSeconds = peakRss = 0
+    try:
+        for processId in [pid] + [int(entry) for entry in os.listdir("/proc") if entry.isdigit() and getParentId(entry) == pid]:
+            with open("/proc/" + str(processId) + "/stat") as file:
+                fields = file.read().rsplit(")", 1)[1].split()
+            cpuSeconds = cpuSeconds + (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK") # utime and stime.
+            with open("/proc/" + str(processId) + "/status") as file:
+                peakRss = peakRss + int(next(line for line in file if line.startswith("VmHWM:")).split()[1]) * 1024
+    except (OSError, StopIteration):
+        return None
+    return {"cpu": cpuSeconds, "peakRss": peakRss}
+
+def getParentId(processId):
+    try:
+        with open("/proc/" + processId + "/stat") as file:
+            return int(file.read().rsplit(")", 1)[1].split()[1])
+    except (OSError, ValueError, IndexError):
+        return None
+
+def getCommit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd = os.path.dirname(os.path.abspath(SERVER_PATH)), capture_output = True, text = True, check = True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+# ======================================================================================================================== #
+# Headless Clients
+# ======================================================================================================================== #
+
+'''
+    HeadlessClient(clientId, directory, seed)
+        A client without the command line: a connection to the server and a PeerServer serving its directory.
+'''
+class HeadlessClient:
+    def __init__(self, clientId, directory, seed):
+        self.clientId = clientId
+        self.directory = directory
+        self.random = random.Random(seed * 100003 + clientId)
+        self.connection = None
+        self.peerServer = None
+
+    def connect(self, parameters):
+        os.makedirs(self.directory, exist_ok = True)
+        self.connection = TrackerConnection(shared.SERVER_ADDRESS, None, self.directory)
+        self.connection.startHeartbeat()
+        self.peerServer = PeerServer(self.directory, "127.0.0.1")
+        self.peerServer.start()
+        self.connection.request("/serve " + str(self.peerServer.address[1]))
+        return {}
+
+    def close(self, parameters):
+        self.connection.close()
+        self.peerServer.close()
+        return {}
+
+    '''
+        seed(parameters)
+            Places every swarm file this client seeds in its directory, with the manifest /split would write so
+            the first download does not wait for it to be hashed, and announces them.
+    '''
+    def seed(self, parameters):
+        files = []
+        for fileName, (sourcePath, seeders) in parameters["files"].items():
+            if self.clientId not in seeders: continue
+            filePath = os.path.join(self.directory, fileName)
+            try:
+                os.link(sourcePath, filePath)
+            except OSError:
+                shutil.copyfile(sourcePath, filePath)
+            manifest = createManifest(filePath, shared.PIECE_SIZE)
+            os.makedirs(os.path.join(self.directory, "raw", fileName), exist_ok = True)
+            manifest.save(os.path.join(self.directory, "raw", fileName, MANIFEST_NAME))
+            files.append((fileName, manifest.fileSize, manifest.root))
+        if files: self.connection.announce(files)
+        return {}
+
+    def announce(self, parameters):
+        latencies = []
+        for batch in range(0, parameters["files"], parameters["batch"]):
+            fileNames = ["storm-" + str(self.clientId) + "-" + str(index) + ".bin" for index in range(batch, min(batch + parameters["batch"], parameters["files"]))]
+            startTime = time.perf_counter()
+            self.connection.announce(fileNames)
+            latencies.append(time.perf_counter() - startTime)
+        return {"latencies": latencies, "operations": parameters["files"]}
+
+    def lookup(self, parameters):
+        latencies = []
+        for lookup in range(parameters["lookups"]):
+            fileIndex = self.random.randrange(int(parameters["files"] / (1 - LOOKUP_MISSES)))
+            fileName = "storm-" + str(self.random.randrange(parameters["clients"])) + "-" + str(fileIndex) + ".bin"
+            startTime = time.perf_counter()
+            messageType, payload = self.connection.request("/findfile " + fileName)
+            latencies.append(time.perf_counter() - startTime)
+        return {"latencies": latencies, "operations": parameters["lookups"]}
+
+    def fetch(self, parameters):
+        latencies = []
+        fetchedBytes = 0
+        for fileName in self.random.sample(parameters["files"], len(parameters["files"])):
+            startTime = time.perf_counter()
+            resumedBytes, receivedBytes = self.connection.fetchResumable(fileName)
+            latencies.append(time.perf_counter() - startTime)
+            fetchedBytes = fetchedBytes + receivedBytes
+            os.remove(os.path.join(self.directory, fileName))
+        return {"latencies": latencies, "operations": len(latencies), "bytes": fetchedBytes}
+
+    def swarm(self, parameters):
+        fileNames = [fileName for fileName, (sourcePath, seeders) in parameters["files"].items() if self.clientId not in seeders]
+        if not fileNames: return {}
+        results = self.connection.findFiles(fileNames)
+
+        latencies = []
+        downloadedBytes = 0
+        for fileName in self.random.sample(fileNames, len(fileNames)):
+            fileSize, rootHash, peerAddresses = results[fileName]
+            startTime = time.perf_counter()
+            if not SwarmDownload(fileName, peerAddresses, self.directory).run(): raise RuntimeError("Download of '" + fileName + "' failed.")
+            latencies.append(time.perf_counter() - startTime)
+            downloadedBytes = downloadedBytes + fileSize
+            os.remove(os.path.join(self.directory, fileName))
+            shutil.rmtree(os.path.join(self.directory, "raw", fileName))
+        return {"latencies": latencies, "operations": len(latencies), "bytes": downloadedBytes}
+
+    def churn(self, parameters):
+        latencies = []
+        for cycle in range(parameters["cycles"]):
+            startTime = time.perf_counter()
+            connection = TrackerConnection()
+            connection.announce(["churn-" + str(self.clientId) + "-" + str(cycle) + "-" + str(index) + ".bin" for index in range(CHURN_FILES)])
+            connection.close()
+            latencies.append(time.perf_counter() - startTime)
+        return {"latencies": latencies, "operations": parameters["cycles"]}
+
+'''
+    ClientGroup(clientIds, directory, seed)
+        The headless clients of one process, every one of which runs an action on its own thread at once.
+'''
+class ClientGroup:
+    def __init__(self, clientIds, directory, seed):
+        self.clients = [HeadlessClient(clientId, os.path.join(directory, str(clientId)), seed) for clientId in clientIds]
+
+    '''
+        run(action, parameters)
+            Runs an action on every client and returns the latencies, operations, bytes and errors of all of them
+            along with the CPU seconds the process spent on it and its peak RSS.
+    '''
+    def run(self, action, parameters):
+        usage = resource.getrusage(resource.RUSAGE_SELF)
+        result = {"latencies": [], "operations": 0, "bytes": 0, "errors": 0, "error": None}
+        with ThreadPoolExecutor(max_workers = len(self.clients)) as executor:
+            futures = [executor.submit(getattr(client, action), parameters) for client in self.clients]
+            for future in futures:
+                try:
+                    clientResult = future.result()
+                except (OSError, shared.ProtocolError, RuntimeError, ValueError) as e:
+                    result["errors"] = result["errors"] + 1
+                    result["error"] = result["error"] or repr(e)
+                    continue
+                result["latencies"].extend(clientResult.get("latencies", []))
+                result["operations"] = result["operations"] + clientResult.get("operations", 0)
+                result["bytes"] = result["bytes"] + clientResult.get("bytes", 0)
+
+        finished = resource.getrusage(resource.RUSAGE_SELF)
+        result["cpu"] = finished.ru_utime + finished.ru_stime - usage.ru_utime - usage.ru_stime
+        result["peakRss"] = finished.ru_maxrss * 1024 # Kilobytes on Linux.
+        return result
+
+'''
+    LocalGroup(group)
+        Runs a ClientGroup in the benchmark's own process behind the same send and recv calls as a worker's pipe.
+'''
+class LocalGroup:
+    def __init__(self, group):
+        self.group = group
+        self.message = None
+
+    def send(self, message):
+        self.message = message
+
+    def recv(self):
+        return self.group.run(*self.message)
+
+def runWorker(connection, clientIds, directory, seed):
+    group = ClientGroup(clientIds, directory, seed)
+    while True:
+        message = connection.recv()
+        if message is None: return
+        connection.send(group.run(*message))
+
+'''
+    startGroups(clients, processes, directory, seed)
+        Spreads the clients over the given number of worker processes, or runs them all in this process for 0.
+        Returns the groups and the worker processes.
+'''
+def startGroups(clients, processes, directory, seed):
+    if processes == 0: return [LocalGroup(ClientGroup(range(clients), directory, seed))], []
+
+    context = multiprocessing.get_context("spawn")
+    groups, workers = [], []
+    for worker in range(min(processes, clients)):
+        parentConnection, childConnection = context.Pipe()
+        process = context.Process(target = runWorker, args = (childConnection, list(range(worker, clients, processes)), directory, seed), daemon = True)
+        process.start()
+        groups.append(parentConnection)
+        workers.append(process)
+    return groups, workers
+
+'''
+    broadcast(groups, action, parameters)
+        Runs an action on every group at once and returns their merged result.
+'''
+def broadcast(groups, action, parameters):
+    for group in groups: group.send((action, parameters))
+    results = [group.recv() for group in groups]
+    merged = {"latencies": [], "operations": 0, "bytes": 0, "errors": 0, "error": None, "cpu": 0, "peakRss": 0}
+    for result in results:
+        for key in ("latencies", "operations", "bytes", "errors", "cpu", "peakRss"): merged[key] = merged[key] + result[key]
+        merged["error"] = merged["error"] or result["error"]
+    return merged
+
+# ======================================================================================================================== #
+# Report
+# ======================================================================================================================== #
+
+'''
+    summariseWorkload(result, elapsed, serverBefore, serverAfter)
+        Returns the report entry of a workload from its merged result and the server's usage around it.
+'''
+def summariseWorkload(result, elapsed, serverBefore, serverAfter):
+    latencies = result["latencies"] or [0.0]
+    entry = {
+        "operations": result["operations"],
+        "seconds": round(elapsed, 4),
+        "operationsPerSecond": round(result["operations"] / elapsed, 1),
+        "bytesPerSecond": round(result["bytes"] / elapsed) if result["bytes"] else None,
+        "latency": {name: round(percentile(latencies, fraction) * 1000, 3) for name, fraction in (("p50", 0.5), ("p90", 0.9), ("p99", 0.99))},
+        "errors": result["errors"],
+        "clientCpu": round(result["cpu"], 3),
+        "clientPeakRss": result["peakRss"],
+        "serverCpu": round(serverAfter["cpu"] - serverBefore["cpu"], 3) if serverBefore and serverAfter else None,
+        "serverPeakRss": serverAfter["peakRss"] if serverAfter else None,
+    }
+    entry["latency"]["max"] = round(max(latencies) * 1000, 3)
+    if result["error"]: entry["error"] = result["error"]
+    return entry
+
+def formatThroughput(entry):
+    text = str(entry["operationsPerSecond"]) + "/s"
+    if entry["bytesPerSecond"]: text = text + " " + str(round(entry["bytesPerSecond"] / 1048576, 1)) + "MB/s"
+    return text
+
+def formatCpu(seconds):
+    return "-" if seconds is None else str(round(seconds, 2)) + "s"
+
+def formatRss(size):
+    return "-" if size is None else str(round(size / 1048576, 1)) + "MB"
+
+def printReport(report):
+    print(str(report["config"]["clients"]) + " clients in " + (str(report["config"]["processes"]) + " processes" if report["config"]["processes"] else "one process") + ", server " + (" ".join(report["config"]["serverArgs"]) or "threaded") + ", commit " + str(report["commit"]) + ":")
+    print("workload".ljust(10) + "ops".rjust(8) + "time".rjust(9) + "throughput".rjust(22) + "p50 ms".rjust(10) + "p90 ms".rjust(10) + "p99 ms".rjust(10) + "max ms".rjust(10) + "srv cpu".rjust(9) + "cli cpu".rjust(9) + "srv rss".rjust(9) + "errors".rjust(8))
+    for workload, entry in report["workloads"].items():
+        latency = entry["latency"]
+        print(workload.ljust(10) + str(entry["operations"]).rjust(8) + (str(round(entry["seconds"], 2)) + "s").rjust(9) + formatThroughput(entry).rjust(22)
+            + "".join(str(latency[name]).rjust(10) for name in ("p50", "p90", "p99", "max"))
+            + formatCpu(entry["serverCpu"]).rjust(9) + formatCpu(entry["clientCpu"]).rjust(9) + formatRss(entry["serverPeakRss"]).rjust(9) + str(entry["errors"]).rjust(8))
+        if entry.get("error"): print("  first error: " + entry["error"])
+
+'''
+    compareReports(baseline, report)
+        Prints the change in throughput, p99 latency and CPU of every workload both reports measured.
+'''
+def compareReports(baseline, report):
+    def change(old, new):
+        if old is None or new is None: return "-"
+        if old == 0: return "n/a"
+        return ("+" if new >= old else "") + str(round(100 * (new - old) / old, 1)) + "%"
+
+    print("Compared with commit " + str(baseline["commit"]) + ":")
+    print("workload".ljust(10) + "throughput /s".rjust(38) + "p99 ms".rjust(30) + "server cpu".rjust(28))
+    for workload, entry in report["workloads"].items():
+        old = baseline["workloads"].get(workload)
+        if old is None: continue
+        print(workload.ljust(10)
+            + (str(old["operationsPerSecond"]) + " -> " + str(entry["operationsPerSecond"]) + change(old["operationsPerSecond"], entry["operationsPerSecond"]).rjust(9)).rjust(38)
+            + (str(old["latency"]["p99"]) + " -> " + str(entry["latency"]["p99"]) + change(old["latency"]["p99"], entry["latency"]["p99"]).rjust(9)).rjust(30)
+            + (formatCpu(old["serverCpu"]) + " -> " + formatCpu(entry["serverCpu"]) + change(old["serverCpu"], entry["serverCpu"]).rjust(9)).rjust(28))
+
+def createFile(filePath, size, random):
+    with open(filePath, "wb") as file:
+        for offset in range(0, size, 1048576): file.write(random.randbytes(min(1048576, size - offset)))
+
+def parseSizes(sizes):
+    return [int(float(size) * 1048576) for size in sizes.split(",") if size]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Runs scripted workloads against the server and a swarm of headless clients on loopback and reports throughput, latency, CPU and memory.")
+    parser.add_argument("--clients", type = int, default = 16, help = "headless clients in the swarm")
+    parser.add_argument("--processes", type = int, default = 2, help = "worker processes the clients are spread over, 0 to run them in this process")
+    parser.add_argument("--workloads", default = ",".join(WORKLOADS), help = "comma separated workloads to run, in order")
+    parser.add_argument("--announce-files", type = int, default = 2000, help = "files every client announces")
+    parser.add_argument("--batch", type = int, default = 50, help = "files per announce command")
+    parser.add_argument("--lookups", type = int, default = 1000, help = "lookups every client makes")
+    parser.add_argument("--fetch-sizes", default = "0.0625,1,8", help = "sizes in MB of the server's tracked files every client fetches")
+    parser.add_argument("--swarm-sizes", default = "1,8", help = "sizes in MB of the files shared between clients")
+    parser.add_argument("--seeders", type = int, default = 2, help = "clients seeding every swarm file")
+    parser.add_argument("--churn-cycles", type = int, default = 50, help = "connections every client churns")
+    parser.add_argument("--server-args", default = "", help = "extra server arguments, such as --server-args=\"--workers 2\"")
+    parser.add_argument("--output", help = "write the report as JSON to this file")
+    parser.add_argument("--compare", help = "a JSON report of an earlier run to compare this run with")
+    parser.add_argument("--seed", type = int, default = 0)
+    arguments = parser.parse_args()
+
+    workloads = [workload for workload in arguments.workloads.split(",") if workload]
+    for workload in workloads:
+        if workload not in WORKLOADS: parser.error("unknown workload '" + workload + "', choose from " + ", ".join(WORKLOADS))
+
+    raiseFileLimit()
+    fileRandom = random.Random(arguments.seed)
+    directory = tempfile.mkdtemp(prefix = "bench-swarm-")
+    os.makedirs(os.path.join(directory, "server", "tracked-files"))
+    os.makedirs(os.path.join(directory, "corpus"))
+    fetchFiles = []
+    for index, size in enumerate(parseSizes(arguments.fetch_sizes)):
+        fetchFiles.append("fetch-" + str(index) + "-" + str(size) + ".bin")
+        createFile(os.path.join(directory, "server", "tracked-files", fetchFiles[-1]), size, fileRandom)
+    swarmFiles = {}
+    for index, size in enumerate(parseSizes(arguments.swarm_sizes)):
+        fileName = "swarm-" + str(index) + "-" + str(size) + ".bin"
+        createFile(os.path.join(directory, "corpus", fileName), size, fileRandom)
+        seeders = [(index * arguments.seeders + seeder) % arguments.clients for seeder in range(arguments.seeders)]
+        swarmFiles[fileName] = (os.path.join(directory, "corpus", fileName), seeders)
+
+    serverArguments = shlex.split(arguments.server_args)
+    server = startServer(os.path.join(directory, "server"), ["--log-level", "WARNING", *serverArguments])
+    groups, workers = startGroups(arguments.clients, arguments.processes, os.path.join(directory, "clients"), arguments.seed)
+    parameters = {
+        "announce": {"files": arguments.announce_files, "batch": arguments.batch},
+        "lookup": {"files": arguments.announce_files, "clients": arguments.clients, "lookups": arguments.lookups},
+        "fetch": {"files": fetchFiles},
+        "swarm": {"files": swarmFiles},
+        "churn": {"cycles": arguments.churn_cycles},
+    }
+    report = {
+        "commit": getCommit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "config": {"clients": arguments.clients, "processes": arguments.processes, "serverArgs": serverArguments, "seed": arguments.seed, "parameters": parameters},
+        "workloads": {},
+    }
+    try:
+        connected = broadcast(groups, "connect", {})
+        if connected["errors"]: raise RuntimeError("Clients failed to connect: " + connected["error"])
+        if "swarm" in workloads: broadcast(groups, "seed", parameters["swarm"])
+
+        for workload in workloads:
+            serverBefore = measureServer(server.pid)
+            startTime = time.perf_counter()
+            result = broadcast(groups, workload, parameters[workload])
+            elapsed = time.perf_counter() - startTime
+            report["workloads"][workload] = summariseWorkload(result, elapsed, serverBefore, measureServer(server.pid))
+        broadcast(groups, "close", {})
+    finally:
+        for group in groups:
+            if not isinstance(group, LocalGroup): group.send(None)
+        for worker in workers: worker.join(10)
+        server.terminate()
+        server.wait()
+        shutil.rmtree(directory)
+
+    printReport(report)
+    if arguments.output:
+        with open(arguments.output, "w") as file:
+            json.dump(report, file, indent = 4)
+        print("Report written to " + arguments.output)
+    if arguments.compare:
+        with open(arguments.compare) as file:
+            compareReports(json.load(file), report)
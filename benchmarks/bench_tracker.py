@@ -0,0 +1,74 @@
+'''
+    Tracker lookup benchmark.
+
+    Fills the tracker index with a growing number of (peer, file) records and measures the average cost of
+    looking up a file, compared with scanning every client's file list the way the tracker used to.
+
+    Usage:
+        #> python benchmarks/bench_tracker.py [entries]
+            [entries]: Optional list of total record counts, defaults to 10000 100000 1000000.
+'''
+
+import os
+import sys
+import random
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from tracker import TrackerIndex
+
+DEFAULT_ENTRIES = [10000, 100000, 1000000] # Total (peer, file) records to benchmark.
+FILES_PER_PEER = 1000 # Number of files announced by every fake peer.
+INDEX_LOOKUPS = 100000 # Lookups timed against the index.
+SCAN_LOOKUPS = 20 # Lookups timed against the linear scan, which is far slower.
+
+'''
+    buildTracker(entries)
+        Returns a (TrackerIndex, client file dictionary, file names) tuple holding the given number of records.
+        Every file is held by a handful of peers so lookups return realistic result sets.
+'''
+def buildTracker(entries):
+    index = TrackerIndex()
+    clientFiles = {}
+    peerCount = max(1, entries // FILES_PER_PEER)
+    distinctFiles = max(1, entries // 4)
+    fileNames = ["file-" + str(i) + ".mp3" for i in range(distinctFiles)]
+
+    for peerNumber in range(peerCount):
+        peer = ("127.0.0.1", 20000 + peerNumber)
+        peerFileList = clientFiles[peer] = []
+        for i in range(FILES_PER_PEER):
+            fileName = fileNames[(peerNumber * FILES_PER_PEER + i) % distinctFiles]
+            index.addFile(peer, fileName)
+            peerFileList.append(fileName)
+    return index, clientFiles, fileNames
+
+def scanLookup(clientFiles, fileName):
+    foundClients = []
+    for theClient in clientFiles:
+        for clientFile in clientFiles[theClient]:
+            if clientFile == fileName:
+                foundClients.append(theClient)
+    return foundClients
+
+if __name__ == "__main__":
+    entryCounts = [int(entries) for entries in sys.argv[1:]] or DEFAULT_ENTRIES
+    print("{:>10} {:>18} {:>18} {:>18}".format("Entries", "Index lookup (us)", "Prefix search (us)", "Linear scan (us)"))
+    for entries in entryCounts:
+        index, clientFiles, fileNames = buildTracker(entries)
+        queries = [random.choice(fileNames) for i in range(INDEX_LOOKUPS)]
+
+        startTime = time.perf_counter()
+        for fileName in queries: index.findPeers(fileName)
+        indexCost = (time.perf_counter() - startTime) / INDEX_LOOKUPS
+
+        index.searchPrefix("") # Build the sorted name list outside of the timed loop.
+        startTime = time.perf_counter()
+        for fileName in queries[:10000]: index.searchPrefix(fileName[:8], 10)
+        prefixCost = (time.perf_counter() - startTime) / 10000
+
+        startTime = time.perf_counter()
+        for fileName in queries[:SCAN_LOOKUPS]: scanLookup(clientFiles, fileName)
+        scanCost = (time.perf_counter() - startTime) / SCAN_LOOKUPS
+
+        print("{:>10} {:>18.2f} {:>18.2f} {:>18.2f}".format(len(index), indexCost * 1e6, prefixCost * 1e6, scanCost * 1e6))
@@ -0,0 +1,102 @@
+'''
+    Upload scheduler benchmark.
+
+    Starts the server with several upload scheduler settings and, while N client processes keep fetching a large
+    file as raw bytes, sends /ping from one more client at a steady pace and reports its p50, p99 and worst
+    round trip along with the bulk throughput. Without the scheduler every transfer streams at once and competes
+    with the control replies; upload slots and rate limits leave room for them. The server is started on the
+    default address, which must be free.
+
+    Usage:
+        #> python benchmarks/bench_upload.py [--transfers N] [--duration S] [--file-size MB] [--interval MS]
+'''
+
+import os
+import sys
+import argparse
+import multiprocessing
+import shutil
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from client import TrackerConnection
+from bench_cache import createTrackedFiles, fetchDiscard
+from benchserver import startServer
+
+CONFIGURATIONS = [ # (name, server arguments)
+    ("no scheduler", ["--upload-slots", "0"]),
+    ("4 slots (default)", []),
+    ("4 slots, 256 MB/s", ["--upload-rate", "256"]),
+    ("64 MB/s per client", ["--upload-slots", "0", "--peer-upload-rate", "64"]),
+]
+
+'''
+    runTransfers(fileName, endTime, results)
+        Client process, fetches the file over and over until the end time and reports the bytes received.
+'''
+def runTransfers(fileName, endTime, results):
+    connection = TrackerConnection()
+    try:
+        received = 0
+        while time.time() < endTime: received = received + fetchDiscard(connection, fileName, None)
+        results.put(received)
+    finally:
+        connection.close()
+
+def getPercentile(values, fraction):
+    return sorted(values)[min(len(values) - 1, int(fraction * len(values)))]
+
+'''
+    measureLatency(directory, serverArguments, fileName, transfers, duration, interval)
+        Runs the transfers against a freshly started server while timing pings, returns the ping round trips
+        in seconds and the bulk throughput in MB/s.
+'''
+def measureLatency(directory, serverArguments, fileName, transfers, duration, interval):
+    server = startServer(directory, ["--log-level", "WARNING", *serverArguments])
+    try:
+        results = multiprocessing.Queue()
+        endTime = time.time() + duration + 1
+        processes = [multiprocessing.Process(target = runTransfers, args = (fileName, endTime, results)) for transfer in range(transfers)]
+        for process in processes: process.start()
+
+        connection = TrackerConnection()
+        try:
+            time.sleep(1) # Let every transfer get going.
+            latencies = []
+            nextPing = time.perf_counter()
+            while time.time() < endTime:
+                startTime = time.perf_counter()
+                connection.request("/ping")
+                latencies.append(time.perf_counter() - startTime)
+                nextPing = max(nextPing + interval, time.perf_counter())
+                time.sleep(max(0, nextPing - time.perf_counter()))
+        finally:
+            connection.close()
+
+        received = sum(results.get(timeout = 60) for process in processes)
+        for process in processes: process.join()
+        return latencies, received / 1048576 / (duration + 1)
+    finally:
+        server.terminate()
+        server.wait()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Measures /ping latency while bulk transfers run under different upload scheduler settings.")
+    parser.add_argument("--transfers", type = int, default = 8, help = "client processes fetching the file at once")
+    parser.add_argument("--duration", type = float, default = 10, help = "seconds of pings per configuration")
+    parser.add_argument("--file-size", dest = "fileSize", type = int, default = 64, help = "size of the fetched file in MB")
+    parser.add_argument("--interval", type = float, default = 10, help = "milliseconds between pings")
+    arguments = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix = "bench-upload-")
+    try:
+        fileName = createTrackedFiles(directory, 1, arguments.fileSize * 1048576)[0]
+        print(str(arguments.transfers) + " bulk transfers of a " + str(arguments.fileSize) + " MB file, /ping every " + str(arguments.interval) + "ms for " + str(arguments.duration) + "s on " + str(os.cpu_count()) + " cores:")
+        print("".ljust(22) + "pings".rjust(7) + "p50".rjust(10) + "p99".rjust(10) + "max".rjust(10) + "bulk MB/s".rjust(11))
+        for name, serverArguments in CONFIGURATIONS:
+            latencies, throughput = measureLatency(directory, serverArguments, fileName, arguments.transfers, arguments.duration, arguments.interval / 1000)
+            print(("  " + name).ljust(22) + str(len(latencies)).rjust(7) + "".join((str(round(value * 1000, 2)) + "ms").rjust(10) for value in (getPercentile(latencies, 0.5), getPercentile(latencies, 0.99), max(latencies)))
+                + str(round(throughput)).rjust(11))
+    finally:
+        shutil.rmtree(directory)
@@ -0,0 +1,103 @@
+'''
+    Multi-process server scaling benchmark.
+
+    Starts the server with 1, 2, 4 and 8 worker processes (1 being the plain single process server) and
+    measures pipelined /findfile lookups per second and raw /fetchfile throughput with many client processes
+    at once, reporting the speedup over a single process. Clients run as separate processes so they are not
+    held back by one interpreter lock themselves; on a machine with fewer cores than workers plus clients the
+    numbers are bound by the cores, not the server. The server is started on the default address, which
+    must be free.
+
+    Usage:
+        #> python benchmarks/bench_workers.py [--workers N ..] [--clients N] [--duration S] [--file-size MB]
+'''
+
+import os
+import sys
+import argparse
+import multiprocessing
+import shutil
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from client import TrackerConnection
+from bench_cache import createTrackedFiles, fetchDiscard
+from benchserver import startServer
+
+DEFAULT_WORKERS = [1, 2, 4, 8]
+TRACKED_FILES = 1000 # Files announced before the lookups so /findfile has something to find.
+PIPELINE_DEPTH = 16 # Lookups every client keeps in flight.
+
+'''
+    runLookups(clientNumber, duration, results)
+        Client process, sends pipelined /findfile lookups for the duration and reports how many were answered.
+'''
+def runLookups(clientNumber, duration, results):
+    connection = TrackerConnection()
+    try:
+        if clientNumber == 0: connection.announce(["bench-" + str(i) + ".mp3" for i in range(TRACKED_FILES)])
+        commands = ["/findfile bench-" + str(i) + ".mp3" for i in range(TRACKED_FILES)]
+        answered = 0
+        endTime = time.perf_counter() + duration
+        while time.perf_counter() < endTime:
+            answered = answered + len(connection.pipeline(commands, PIPELINE_DEPTH))
+        results.put(answered)
+    finally:
+        connection.close()
+
+'''
+    runFetches(clientNumber, duration, fileNames, results)
+        Client process, fetches files as raw bytes for the duration and reports how many bytes arrived.
+'''
+def runFetches(clientNumber, duration, fileNames, results):
+    connection = TrackerConnection()
+    try:
+        received = 0
+        endTime = time.perf_counter() + duration
+        while time.perf_counter() < endTime:
+            received = received + fetchDiscard(connection, fileNames[clientNumber % len(fileNames)], None)
+        results.put(received)
+    finally:
+        connection.close()
+
+'''
+    runClients(clients, target, args, duration)
+        Runs the client processes at once, returns the sum of what they report per second.
+'''
+def runClients(clients, target, args, duration):
+    results = multiprocessing.Queue()
+    processes = [multiprocessing.Process(target = target, args = (clientNumber, duration, *args, results)) for clientNumber in range(clients)]
+    startTime = time.perf_counter()
+    for process in processes: process.start()
+    totals = [results.get(timeout = duration + 60) for process in processes]
+    for process in processes: process.join()
+    return sum(totals) / (time.perf_counter() - startTime)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Measures how server throughput scales with worker processes.")
+    parser.add_argument("--workers", type = int, nargs = "+", default = DEFAULT_WORKERS, help = "worker counts to measure")
+    parser.add_argument("--clients", type = int, default = 16, help = "client processes running at once")
+    parser.add_argument("--duration", type = float, default = 5, help = "seconds every measurement runs for")
+    parser.add_argument("--file-size", dest = "fileSize", type = int, default = 1, help = "size of the fetched files in MB")
+    arguments = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix = "bench-workers-")
+    try:
+        fileNames = createTrackedFiles(directory, 4, arguments.fileSize * 1048576)
+        print(str(os.cpu_count()) + " cores, " + str(arguments.clients) + " client processes, " + str(arguments.duration) + "s per measurement:")
+        print("workers".rjust(9) + "findfile/s".rjust(14) + "speedup".rjust(9) + "fetchfile MB/s".rjust(16) + "speedup".rjust(9))
+        baseline = None
+        for workers in arguments.workers:
+            server = startServer(directory, ["--workers", str(workers), "--log-level", "WARNING"], 100)
+            try:
+                lookupRate = runClients(arguments.clients, runLookups, (), arguments.duration)
+                fetchRate = runClients(arguments.clients, runFetches, (fileNames,), arguments.duration) / 1048576
+            finally:
+                server.terminate()
+                server.wait()
+            if baseline is None: baseline = (lookupRate, fetchRate)
+            print(str(workers).rjust(9) + str(round(lookupRate)).rjust(14) + (str(round(lookupRate / baseline[0], 2)) + "x").rjust(9)
+                + str(round(fetchRate)).rjust(16) + (str(round(fetchRate / baseline[1], 2)) + "x").rjust(9))
+    finally:
+        shutil.rmtree(directory)
@@ -0,0 +1,32 @@
+'''
+    Benchmark server helper.
+
+    Starts the server as a subprocess for the benchmarks that measure it end to end. The server listens on the
+    default address, which must be free.
+'''
+
+import os
+import sys
+import subprocess
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from client import TrackerConnection
+
+SERVER_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "server.py")
+
+'''
+    startServer(directory, serverArguments, attempts)
+        Starts the server in the given directory with the given arguments and waits until it accepts
+        connections, trying every 100 ms up to attempts times. Returns the server process.
+'''
+def startServer(directory, serverArguments, attempts = 50):
+    server = subprocess.Popen([sys.executable, os.path.abspath(SERVER_PATH), *serverArguments], cwd = directory, stdout = subprocess.DEVNULL, stderr = subprocess.DEVNULL)
+    for attempt in range(attempts):
+        try:
+            TrackerConnection().close()
+            return server
+        except ConnectionRefusedError:
+            time.sleep(0.1)
+    server.kill()
+    raise RuntimeError("Server did not start.")
@@ -0,0 +1,116 @@
+'''
+    Tracker load generator.
+
+    Opens N concurrent fake clients against a running server, reports the connection rate and then the
+    p50/p99 latency of /ping, /addfile and /findfile issued by every client at once. Start the server
+    first, e.g. `python server.py --async`.
+
+    Usage:
+        #> python benchmarks/loadgen.py [--clients N] [--rounds R] [--hold S]
+'''
+
+import os
+import sys
+import asyncio
+import argparse
+import hashlib
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+import shared
+
+'''
+    encodeCommand(command)
+        Encodes a command string the same way the interactive client does before it is framed.
+'''
+def encodeCommand(command):
+    return (hashlib.sha224(command.encode()).hexdigest() + ";HASH;" + command).encode()
+
+'''
+    percentile(samples, fraction)
+        Returns the sample at the given fraction (0.0 - 1.0) of the sorted samples.
+'''
+def percentile(samples, fraction):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * fraction))]
+
+def raiseFileLimit():
+    try:
+        import resource
+        softLimit, hardLimit = resource.getrlimit(resource.RLIMIT_NOFILE)
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hardLimit, hardLimit))
+    except (ImportError, ValueError, OSError):
+        pass
+
+class FakeClient:
+    def __init__(self, clientId):
+        self.clientId = clientId
+        self.reader = None
+        self.writer = None
+
+    async def connect(self, address):
+        self.reader, self.writer = await asyncio.open_connection(*address)
+
+    async def command(self, command):
+        startTime = time.perf_counter()
+        payload = encodeCommand(command)
+        self.writer.write(shared.packFrameHeader(shared.MSG_COMMAND, payload) + payload)
+        frame = await shared.recvFrameAsync(self.reader)
+        if frame is None: raise ConnectionError("Server closed the connection.")
+        return time.perf_counter() - startTime
+
+    async def close(self):
+        self.writer.close()
+        await self.writer.wait_closed()
+
+async def connectAll(clients, address, concurrency):
+    semaphore = asyncio.Semaphore(concurrency) # Avoid overflowing the server's accept backlog.
+
+    async def connectOne(client):
+        async with semaphore:
+            await client.connect(address)
+    await asyncio.gather(*(connectOne(client) for client in clients))
+
+async def runRound(clients, commandName):
+    if commandName == "ping":
+        commands = ["/ping" for client in clients]
+    elif commandName == "addfile":
+        commands = ["/addfile loadgen-" + str(client.clientId) + "-" + str(time.monotonic_ns()) + ".bin" for client in clients]
+    else:
+        commands = ["/findfile loadgen-" + str(client.clientId) + ".bin" for client in clients]
+    return await asyncio.gather(*(client.command(command) for client, command in zip(clients, commands)))
+
+async def main(arguments):
+    address = (arguments.host, arguments.port)
+    clients = [FakeClient(clientId) for clientId in range(arguments.clients)]
+
+    startTime = time.perf_counter()
+    await connectAll(clients, address, arguments.concurrency)
+    elapsed = time.perf_counter() - startTime
+    print("Connected {} clients in {:.2f}s ({:.0f} connections/s)".format(len(clients), elapsed, len(clients) / elapsed))
+
+    if arguments.hold > 0:
+        print("Holding {} idle connections for {}s..".format(len(clients), arguments.hold))
+        await asyncio.sleep(arguments.hold)
+
+    print("{:>10} {:>10} {:>12} {:>12} {:>12}".format("Command", "Requests", "Req/s", "p50 (ms)", "p99 (ms)"))
+    for commandName in ["ping", "addfile", "findfile"]:
+        latencies = []
+        startTime = time.perf_counter()
+        for i in range(arguments.rounds):
+            latencies.extend(await runRound(clients, commandName))
+        elapsed = time.perf_counter() - startTime
+        print("{:>10} {:>10} {:>12.0f} {:>12.2f} {:>12.2f}".format(commandName, len(latencies), len(latencies) / elapsed, percentile(latencies, 0.5) * 1000, percentile(latencies, 0.99) * 1000))
+
+    await asyncio.gather(*(client.close() for client in clients))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Concurrent fake client load generator for the tracker server.")
+    parser.add_argument("--clients", type = int, default = 1000, help = "number of concurrent fake clients")
+    parser.add_argument("--rounds", type = int, default = 5, help = "number of times every client issues each command")
+    parser.add_argument("--hold", type = float, default = 0, help = "seconds to hold all connections idle before issuing commands")
+    parser.add_argument("--concurrency", type = int, default = 512, help = "maximum number of connections being opened at once")
+    parser.add_argument("--host", default = shared.SERVER_ADDRESS[0])
+    parser.add_argument("--port", type = int, default = shared.SERVER_ADDRESS[1])
+    raiseFileLimit()
+    asyncio.run(main(parser.parse_args()))
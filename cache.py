@@ -0,0 +1,104 @@
+'''
+    @author  Skully (https://github.com/ImSkully)
+    @website https://skully.tech
+    @email   contact@skully.tech
+    @updated 13/12/21
+
+    A simple peer-to-peer file sharing torrenting network with encrypted payload transportation
+    and support for multiple clients over sockets with multi-threading.
+'''
+
+import threading
+from collections import OrderedDict
+
+# ======================================================================================================================== #
+# Chunk Cache
+# ======================================================================================================================== #
+
+DEFAULT_CACHE_SIZE = 268435456 # Bytes of encoded file chunks the server keeps in memory by default.
+MAX_FILE_FRACTION = 4 # Files larger than 1/MAX_FILE_FRACTION of the cache bypass it, so one big download cannot flush it.
+
+'''
+    ChunkCache(capacity)
+        Byte-budgeted least recently used cache of file chunks, safe to share between client threads.
+
+        entries = OrderedDict(
+            [(filePath, mtime, fileSize, offset, codec)] = (flags, payload),
+        )
+
+        The file's modification time and size are part of every key, so chunks of a file that changed on disk
+        are never served again and simply age out.
+'''
+class ChunkCache:
+    def __init__(self, capacity = DEFAULT_CACHE_SIZE):
+        self.capacity = capacity
+        self.lock = threading.Lock()
+        self.entries = OrderedDict() # Least recently used first.
+        self.size = 0 # Bytes of payload currently held.
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    '''
+        isCacheable(fileSize)
+            Returns True if a file is small enough to be worth caching.
+    '''
+    def isCacheable(self, fileSize):
+        return self.capacity > 0 and fileSize <= self.capacity // MAX_FILE_FRACTION
+
+    '''
+        get(key)
+            Returns the cached (flags, payload) for the key and marks it recently used, or None on a miss.
+    '''
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses = self.misses + 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits = self.hits + 1
+            return entry
+
+    '''
+        put(key, flags, payload)
+            Stores a chunk, evicting the least recently used chunks until it fits within the byte budget.
+    '''
+    def put(self, key, flags, payload):
+        if len(payload) > self.capacity: return
+        with self.lock:
+            previous = self.entries.pop(key, None)
+            if previous is not None: self.size = self.size - len(previous[1])
+
+            while self.entries and self.size + len(payload) > self.capacity:
+                evictedKey, evicted = self.entries.popitem(last = False)
+                self.size = self.size - len(evicted[1])
+                self.evictions = self.evictions + 1
+
+            self.entries[key] = (flags, payload)
+            self.size = self.size + len(payload)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+    '''
+        getStats()
+            Returns a dictionary of the cache counters.
+    '''
+    def getStats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self.entries),
+                "bytes": self.size,
+                "capacity": self.capacity,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hitRate": self.hits / lookups if lookups else 0.0,
+            }
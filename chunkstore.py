@@ -0,0 +1,204 @@
+'''
+    @author  Skully (https://github.com/ImSkully)
+    @website https://skully.tech
+    @email   contact@skully.tech
+    @updated 13/12/21
+
+    A simple peer-to-peer file sharing torrenting network with encrypted payload transportation
+    and support for multiple clients over sockets with multi-threading.
+'''
+
+import os
+import hashlib
+import threading
+import zlib
+from segments import copyRange
+
+# ======================================================================================================================== #
+# Content-Defined Chunking
+# ======================================================================================================================== #
+
+CHUNK_MIN_SIZE = 16384 # No chunk is cut shorter than this, except the last chunk of a file.
+CHUNK_MAX_SIZE = 262144 # Chunks are cut at this size where the content offers no cut point before it.
+CHUNK_WINDOW = 32 # Bytes before a position that decide whether a file is cut there.
+CUT_MASK = 127 # A position passing the filter is cut if the CRC-32 of its window has these bits clear.
+FILTER_WINDOW = 15 # Bytes seen by the filter, odd so that a run of a single byte value never passes it.
+FILTER_TABLE = hashlib.shake_256(b"p2p-chunk-filter").digest(256) # Fixed, every client must cut files the same way.
+FILTER_SHIFTS = [8 * offset + (3 * offset) % 8 for offset in range(FILTER_WINDOW)]
+SCAN_BUFFER_SIZE = 4194304 # Bytes of a file scanned for cut points at once.
+
+'''
+    findCandidates(buffer)
+        Yields the start of every window in the buffer that passes the filter, about one position in 256. Every
+        byte is mapped through FILTER_TABLE and the mapped buffer is XORed with itself shifted by FILTER_SHIFTS
+        bits, all as one big integer, so a position passes when its byte of the result is zero. This runs in C
+        over the whole buffer, where a rolling hash in Python would have to visit every byte.
+'''
+def findCandidates(buffer):
+    lanes = int.from_bytes(buffer.translate(FILTER_TABLE), "little")
+    mixed = lanes
+    for shift in FILTER_SHIFTS[1:]: mixed = mixed ^ (lanes >> shift)
+    mixed = mixed.to_bytes(len(buffer), "little")
+
+    lastPosition = len(buffer) - CHUNK_WINDOW
+    position = mixed.find(0)
+    while position != -1 and position <= lastPosition:
+        yield position
+        position = mixed.find(0, position + 1)
+
+'''
+    chunkFile(filePath)
+        Returns the sizes of the content-defined chunks of a file. A file is cut after a window of CHUNK_WINDOW
+        bytes whenever the window passes the filter and the CRC-32 check, so one cut in 32768 positions on
+        average, within CHUNK_MIN_SIZE and CHUNK_MAX_SIZE of the previous cut. As the cuts depend only on the
+        bytes around them, bytes inserted into or removed from a file only change the chunks they fall in, and
+        the same content is cut into the same chunks in every file that holds it.
+'''
+def chunkFile(filePath):
+    chunkSizes = []
+    chunkStart = 0
+    with open(filePath, "rb") as file:
+        bufferStart = 0
+        buffer = file.read(SCAN_BUFFER_SIZE)
+        while len(buffer) >= CHUNK_WINDOW:
+            for position in findCandidates(buffer):
+                cutPoint = bufferStart + position + CHUNK_WINDOW
+                if cutPoint - chunkStart < CHUNK_MIN_SIZE: continue
+                while cutPoint - chunkStart > CHUNK_MAX_SIZE: # No cut point was found in time.
+                    chunkSizes.append(CHUNK_MAX_SIZE)
+                    chunkStart = chunkStart + CHUNK_MAX_SIZE
+                if cutPoint - chunkStart < CHUNK_MIN_SIZE or zlib.crc32(buffer[position:position + CHUNK_WINDOW]) & CUT_MASK: continue
+                chunkSizes.append(cutPoint - chunkStart)
+                chunkStart = cutPoint
+
+            nextBuffer = file.read(SCAN_BUFFER_SIZE)
+            if not nextBuffer: break
+            bufferStart = bufferStart + len(buffer) - (CHUNK_WINDOW - 1) # Overlap so every window is scanned once.
+            buffer = buffer[-(CHUNK_WINDOW - 1):] + nextBuffer
+        fileSize = os.fstat(file.fileno()).st_size
+
+    while chunkStart < fileSize:
+        chunkSizes.append(min(CHUNK_MAX_SIZE, fileSize - chunkStart))
+        chunkStart = chunkStart + chunkSizes[-1]
+    return chunkSizes
+
+# ======================================================================================================================== #
+# Chunk Store
+# ======================================================================================================================== #
+
+'''
+[chunks]
+    > [ab]
+        > ab3f.. (a chunk, named by the SHA-256 of its bytes)
+'''
+
+'''
+    ChunkStore(directory)
+        Content-addressed store of file pieces, kept once however many files or clients hold them. Pieces are
+        stored under their hex SHA-256 digest, the same digest a Manifest lists them by, so a file is its
+        manifest plus the chunks it references. Clients started in the same directory share one store, chunks
+        are renamed into place once written so none of them ever reads half a chunk. Chunks are never removed,
+        delete the store's directory to reclaim the space.
+
+        store = ChunkStore("chunks")
+        store.addFile("7000/file.mp3", manifest)
+        store.buildFile(manifest, "7001/file.mp3")
+'''
+class ChunkStore:
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok = True)
+
+    def getChunkPath(self, digest):
+        return os.path.join(self.directory, digest[:2], digest)
+
+    def hasChunk(self, digest):
+        return os.path.exists(self.getChunkPath(digest))
+
+    '''
+        readChunk(digest)
+            Returns the bytes of a chunk, or None if the store does not hold it.
+    '''
+    def readChunk(self, digest):
+        try:
+            with open(self.getChunkPath(digest), "rb") as chunkFile:
+                return chunkFile.read()
+        except FileNotFoundError:
+            return None
+
+    '''
+        addChunk(digest, data)
+            Stores the bytes of a chunk under its digest unless the store already holds it, returns True if the
+            chunk was added. Callers make sure the digest is that of the bytes.
+    '''
+    def addChunk(self, digest, data):
+        chunkPath = self.getChunkPath(digest)
+        if os.path.exists(chunkPath): return False
+
+        os.makedirs(os.path.dirname(chunkPath), exist_ok = True)
+        temporaryPath = chunkPath + "." + str(os.getpid()) + "-" + str(threading.get_ident()) + ".tmp"
+        with open(temporaryPath, "wb") as chunkFile:
+            chunkFile.write(data)
+        os.replace(temporaryPath, chunkPath)
+        return True
+
+    '''
+        addFile(filePath, manifest)
+            Stores every piece of the file the manifest describes that the store does not hold yet, returns the
+            number of chunks and bytes added.
+    '''
+    def addFile(self, filePath, manifest):
+        chunksAdded = bytesAdded = 0
+        fileDescriptor = os.open(filePath, os.O_RDONLY)
+        try:
+            for index, digest in enumerate(manifest.pieces):
+                if self.hasChunk(digest): continue
+                offset, length = manifest.getPieceRange(index)
+                if self.addChunk(digest, os.pread(fileDescriptor, length, offset)):
+                    chunksAdded = chunksAdded + 1
+                    bytesAdded = bytesAdded + length
+        finally:
+            os.close(fileDescriptor)
+        return chunksAdded, bytesAdded
+
+    '''
+        getMissingPieces(manifest)
+            Returns the index of every piece of the manifest the store does not hold.
+    '''
+    def getMissingPieces(self, manifest):
+        return [index for index, digest in enumerate(manifest.pieces) if not self.hasChunk(digest)]
+
+    '''
+        buildFile(manifest, outputPath)
+            Writes the file the manifest describes from the store's chunks into a single preallocated output file,
+            returns its size. Raises FileNotFoundError if the store is missing a chunk.
+    '''
+    def buildFile(self, manifest, outputPath):
+        outputDescriptor = os.open(outputPath, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            if manifest.fileSize > 0 and hasattr(os, "posix_fallocate"):
+                os.posix_fallocate(outputDescriptor, 0, manifest.fileSize) # Reserve the space up front to avoid fragmentation.
+
+            for index, digest in enumerate(manifest.pieces):
+                offset, length = manifest.getPieceRange(index)
+                chunkDescriptor = os.open(self.getChunkPath(digest), os.O_RDONLY)
+                try:
+                    copyRange(chunkDescriptor, outputDescriptor, length, 0, offset)
+                finally:
+                    os.close(chunkDescriptor)
+        finally:
+            os.close(outputDescriptor)
+        return manifest.fileSize
+
+    '''
+        getStats()
+            Returns the number of chunks in the store and the bytes they hold.
+    '''
+    def getStats(self):
+        chunks = size = 0
+        for directoryPath, directoryNames, fileNames in os.walk(self.directory):
+            for fileName in fileNames:
+                if fileName.endswith(".tmp"): continue
+                chunks = chunks + 1
+                size = size + os.path.getsize(os.path.join(directoryPath, fileName))
+        return {"chunks": chunks, "bytes": size}
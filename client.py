@@ -1,246 +1,692 @@
-'''
-    @author  Skully (https://github.com/ImSkully)
-    @website https://skully.tech
-    @email   contact@skully.tech
-    @updated 13/12/21
-    
-    A simple peer-to-peer file sharing torrenting network with encrypted payload transportation
-    and support for multiple clients over sockets with multi-threading.
-
-    Usage:
-        #> python client.py <socket>
-            <socket>: If specified, the client will use the socket number given to connect to the server.
-'''
-
-import socket
-import sys
-import random
-import time
-import os
-import shutil
-import shared
-import gzip
-import hashlib
-import struct
-from fsplit.filesplit import FileSplit
-
-# ======================================================================================================================== #
-# Global Variable Definitions
-# ======================================================================================================================== #
-
-'''
-    COMMANDS = {
-        ["commandName"] = handlingFunction,
-    }
-'''
-COMMANDS = {} # Create command dictionary.
-
-CLIENT_SOCKET = random.randrange(1, 25565) # Generate a random socket number.
-if len(sys.argv) > 1: CLIENT_SOCKET = int(sys.argv[1]) # If socket ID was provided in command line, use that.
-
-DIRECTORY = str(CLIENT_SOCKET) # Each client places its file into a folder named after its socket number.
-
-CLIENT_ADDRESS = (shared.SERVER_ADDRESS[0], CLIENT_SOCKET) # Socket IP and port to establish a connection to.
-
-print("[CLIENT] Establishing connection to server..")
-SOCKET = socket.socket(socket.AF_INET, socket.SOCK_STREAM) # Create a TCP/IP socket.
-SOCKET.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-SOCKET.bind(CLIENT_ADDRESS)
-SOCKET.connect(shared.SERVER_ADDRESS) # Connect the socket to the port where the server is listening.
-
-
-# ======================================================================================================================== #
-# Client Functions
-# ======================================================================================================================== #
-
-'''
-[DIRECTORY : Socket]
-    > [raw]
-        > [fileName]
-            > fileName_X (where _X is the file partition)
-
-    > fileName.mp3
-'''
-
-'''
-    buildBinaryFile(fileName = False, fileBinary = False)
-        Starts building the binary file using the binary data provided and places it into the client's directory.
-'''
-def buildBinaryFile(fileName = False, fileBinary = False):
-    if not fileName or not fileBinary: return
-
-    print("[CLIENT] Start build of file '" + fileName + "'..")
-    newFile = open(DIRECTORY + "/" + fileName, "wb")
-    newFile.write(fileBinary.encode())
-    newFile.close()
-    print("[CLIENT] Done! (File location: " + DIRECTORY + "/" + fileName + ")")
-
-# ======================================================================================================================== #
-# Data Input Parsing
-# ======================================================================================================================== #
-
-def parseClientCommand(command):
-    commandParameters = command.split(' ') # Split the string using space as the delimiter.
-    theCommand = commandParameters[0] # The command name.
-    commandParameters.pop(0) # Remove the command itself from the list.
-
-    # Parameter debug outputs.
-    if shared.DEBUG:
-        i = 1
-        print("[DEBUG] Command: " + theCommand)
-        for parameter in commandParameters:
-            print("[DEBUG] Parameter #" + str(i) + ": " + parameter)
-            i = i + 1
-
-    if (theCommand in COMMANDS): # If the command exists.
-        handlingFunction = COMMANDS[theCommand] # Fetch the handling function to invoke.
-        handlingFunction(*commandParameters) # Invoke the respective function and pass all parameters.
-    else:
-        print("[CLIENT] Invalid command specified.")
-
-# ======================================================================================================================== #
-# Commands & Command Handlers
-# ======================================================================================================================== #
-
-"""
-    Command: /compress [File Name]
-        [File Name] - The path to the file to compress.
-"""
-def compressFile(fileName = False):
-    if not fileName:
-        print("SYNTAX: /compress [File Name]")
-        return
-
-    print("Starting compression..")
-    # Check to see if the client has the file to split.
-    if not os.path.exists(DIRECTORY + "/" + fileName):
-        print("ERROR: You do not have the full file!")
-        return
-
-    with open(DIRECTORY + "/" + fileName, "rb") as fileInput, open(DIRECTORY + "/" + fileName + ".gz", "wb") as fileOutput:
-        shutil.copyfileobj(fileInput, fileOutput)
-    print("Done! (File location: " + DIRECTORY + "/" + fileName + ".gz)")
-COMMANDS["compress"] = compressFile
-
-"""
-    Command: /decompress [File Name]
-        [File Name] - The path to the file to decompress.
-"""
-def decompressFile(fileName = False):
-    if not fileName:
-        print("SYNTAX: /decompress [File Name]")
-        return
-
-    print("Starting decompression..")
-    # Check to see if the client has the file to split.
-    if not os.path.exists(DIRECTORY + "/" + fileName + ".gz"):
-        print("ERROR: A compressed version of that file does not exist!")
-        return
-
-    with open(DIRECTORY + "/" + fileName + ".gz", "rb") as fileInput, open(DIRECTORY + "/" + fileName, "wb") as fileOutput:
-        shutil.copyfileobj(fileInput, fileOutput)
-    print("Done! (File location: " + DIRECTORY + "/" + fileName + ".gz)")
-COMMANDS["decompress"] = decompressFile
-
-"""
-    Command: /build [File Name]
-        [File Name] - The path to the file that should be built using segments that have been fetched.
-"""
-def constructFile(fileName):
-    print("Starting construct of file '" + fileName + "'..")
-    
-    # Check to see if the client already has the file constructed.
-    if os.path.exists(DIRECTORY + "/" + fileName):
-        print("ERROR: You already have this file constructed!")
-        return
-
-    # Check to see if the client has segments.
-    if not os.path.exists(DIRECTORY + "/raw/" + fileName):
-        print("ERROR: You don't have any segments of that file to build from!")
-        return
-
-    for rawFile in sorted(os.listdir(DIRECTORY + "/raw/" + fileName)):
-        # Iterating through each file, add them on to the output mp3 file.
-        with open(DIRECTORY + "/" + fileName, "ab") as outputFile, open(DIRECTORY + "/raw/" + fileName + "/" + rawFile, "rb") as inputFile:
-            outputFile.write(inputFile.read()) # Read the contents and add to output.
-    print("Done! (File location: " + DIRECTORY + "/" + fileName + ")")
-COMMANDS["build"] = constructFile
-
-"""
-    Command: /split [File Name]
-        [File Name] - The path to a file that should be split into specific bytes.
-"""
-def splitFile(fileName):
-    print("Starting split of file '" + fileName + "'..")
-
-    # Check to see if the client has the file to split.
-    if not os.path.exists(DIRECTORY + "/" + fileName):
-        print("ERROR: You do not have the full file!")
-        return
-
-    outputLocation = DIRECTORY + "/raw/" + fileName + "/"
-    if not os.path.exists(outputLocation): # If a directory for this client socket doesn't exist.
-        os.makedirs(outputLocation) # Create a directory.
-
-    FileSplit(file = DIRECTORY + "/" + fileName, splitsize = 50000, output_dir = outputLocation).split()
-    print("Done! (Raw Files: " + outputLocation + ")")
-COMMANDS["split"] = splitFile
-
-"""
-    Command: /help
-    Outputs all available commands to the CLI.
-"""
-def showHelpCommand():
-    print("[CLIENT] Available Commands:" + COMMAND_LIST)
-COMMANDS["help"] = showHelpCommand
-
-# Generate the command list.
-COMMAND_LIST = ""
-for commandName in COMMANDS: COMMAND_LIST = COMMAND_LIST + " /" + commandName + ","
-COMMAND_LIST = COMMAND_LIST[:-1]
-
-# ======================================================================================================================== #
-# Socket Data Input/Output
-# ======================================================================================================================== #
-
-try:
-    while True:
-        if not os.path.exists(DIRECTORY): # If a directory for this client socket doesn't exist.
-            os.makedirs(DIRECTORY) # Create a directory.
-
-        command = input("Please specify a command: ") # Get user input from command line.
-        if len(command) > 0: # If the client has provided an input.
-            if (command[0] == shared.COMMAND_PREFIX) or command == "exit": # If user is providing a server command.
-                rawCommand = command
-                command = hashlib.sha224(command.encode()).hexdigest() + ";HASH;" + command
-                command = command.encode() # Encode the command to byte code.
-                SOCKET.sendall(command) # Send the encoded command to the server.
-
-                if rawCommand == "exit": break # Exit command to quit.
-                
-                # Listen for a response from server.
-                serverResponse = SOCKET.recv(10000)
-
-                if serverResponse:
-                    serverResponse = str(serverResponse).replace("'", '').replace("\"", '') # Convert to string, remove apostrophes and quotations.
-                    serverResponse = serverResponse[1::] # Remove starting apostrophe and byte code prefix. [b]
-
-                    # Parse command specific responses from server.
-                    if "[ping]" in serverResponse:
-                        currentTime = time.time() # Get the current epoch time.
-                        serverResponse = serverResponse.replace("[ping]", '') # Remove the [ping] prefix.
-                        difference = currentTime - float(serverResponse) # Take the client's epoch from the servers to calculate difference in ms.
-                        print("Pong! (Response took " + str(round(difference, 4)) + "ms)")
-                    elif "[fetchfile]" in serverResponse:
-                        serverResponse = serverResponse.replace("[fetchfile]", '') # Remove the [fetchfile] prefix.
-                        responseData = serverResponse.split(";SEPARATOR;b") # Separate the file
-                        buildBinaryFile(responseData[0], responseData[1])
-                    else:
-                        # No command specific action, just print raw response.
-                        print("[SERVER] " + serverResponse)
-            else:
-                parseClientCommand(command)
-finally:
-    print('Closing connection to server..')
-    SOCKET.close()
-    print("Goodbye!")
\ No newline at end of file
+'''
+    @author  Skully (https://github.com/ImSkully)
+    @website https://skully.tech
+    @email   contact@skully.tech
+    @updated 13/12/21
+    
+    A simple peer-to-peer file sharing torrenting network with encrypted payload transportation
+    and support for multiple clients over sockets with multi-threading.
+
+    Usage:
+        #> python client.py <socket>
+            <socket>: If specified, the client will use the socket number given to connect to the server.
+'''
+
+import socket
+import sys
+import threading
+import random
+import time
+import os
+import shared
+import compression
+import hashlib
+from collections import deque
+from swarm import PeerServer, SwarmDownload, PartialFile, PARTIAL_EXTENSION, STATE_EXTENSION, connectPeer, isSafeFileName
+from manifest import createManifest, loadManifest, MANIFEST_NAME
+from chunkstore import ChunkStore, chunkFile, CHUNK_MAX_SIZE
+import segments
+
+# ======================================================================================================================== #
+# Global Variable Definitions
+# ======================================================================================================================== #
+
+'''
+    COMMANDS = {
+        ["commandName"] = handlingFunction,
+    }
+'''
+COMMANDS = {} # Create command dictionary.
+
+CLIENT_SOCKET = None # Socket number the interactive client binds to, chosen in startClient().
+DIRECTORY = None # Each client places its file into a folder named after its socket number.
+CLIENT_ADDRESS = None # Socket IP and port to establish a connection to.
+CONNECTION = None # TrackerConnection used by the interactive client.
+PEER_SERVER = None # PeerServer sharing this client's files with other clients.
+PEER_POOL = shared.ConnectionPool(connectPeer) # Idle peer connections kept open between downloads.
+CHUNK_STORE = None # ChunkStore shared with every client started in the same directory, see shared.CHUNK_STORE_DIRECTORY.
+RANGE_PIECE_SIZE = shared.STREAM_CHUNK_SIZE # Bytes recorded by each bit of a resumable fetch, aligned with the server's cached chunks.
+RANGE_PIPELINE_DEPTH = 4 # /fetchrange requests kept in flight while resuming a fetch with several missing ranges.
+
+# ======================================================================================================================== #
+# Client Functions
+# ======================================================================================================================== #
+
+'''
+[DIRECTORY : Socket]
+    > [raw]
+        > [fileName]
+            > fileName_X (where _X is the file partition, only for files split into segments)
+            > manifest.json (the pieces of the file, kept in the chunk store unless split into segments)
+
+    > fileName.mp3
+'''
+
+'''
+    receiveFile(theSocket, directory, fileName, fileSize, codec)
+        Receives a streamed binary file of the given size from the server directly into the given directory.
+        If the server chose a wire codec, the file arrives as individually compressed chunks instead.
+'''
+def receiveFile(theSocket, directory, fileName, fileSize, codec = False):
+    if not isSafeFileName(fileName):
+        raise shared.ProtocolError("Server sent a file with an unsafe name: " + fileName)
+
+    if codec:
+        compression.recvCompressedStream(theSocket, directory + "/" + fileName, fileSize, codec)
+    else:
+        shared.recvFileStream(theSocket, directory + "/" + fileName, fileSize)
+
+'''
+    parseFindFileResponse(serverResponse)
+        Parses a "[findfile]<file name>;<host:port> <host:port>" server response into (fileName, [(host, port)]).
+'''
+def parseFindFileResponse(serverResponse):
+    fileName, addresses = serverResponse.replace("[findfile]", '', 1).rsplit(";", 1)
+    peerAddresses = []
+    for address in addresses.split():
+        host, port = address.rsplit(":", 1)
+        peerAddresses.append((host, int(port)))
+    return fileName, peerAddresses
+
+'''
+    parseFindFilesResponse(serverResponse)
+        Parses a "[findfiles]" server response into {fileName: (fileSize, rootHash, [(host, port)])}.
+        Sizes and root hashes the tracker does not know are None, files nobody has have no addresses.
+'''
+def parseFindFilesResponse(serverResponse):
+    results = {}
+    for line in serverResponse.replace("[findfiles]", '', 1).split("\n"):
+        fileName, fileSize, rootHash, addresses = line.rsplit(";", 3)
+        peerAddresses = []
+        for address in addresses.split():
+            host, port = address.rsplit(":", 1)
+            peerAddresses.append((host, int(port)))
+        results[fileName] = (int(fileSize) if fileSize else None, rootHash or None, peerAddresses)
+    return results
+
+'''
+    formatAnnounceCommand(files)
+        Builds a single /announce command from a list of file names or (fileName, fileSize, rootHash) tuples.
+'''
+def formatAnnounceCommand(files):
+    fileEntries = []
+    for file in files:
+        if isinstance(file, str):
+            fileEntries.append(file)
+        else:
+            fileName, fileSize, rootHash = file
+            fileEntries.append(fileName + "\t" + str(fileSize) + ("\t" + rootHash if rootHash else ""))
+    return "/announce\n" + "\n".join(fileEntries)
+
+# ======================================================================================================================== #
+# Data Input Parsing
+# ======================================================================================================================== #
+
+def parseClientCommand(command):
+    commandParameters = command.split(' ') # Split the string using space as the delimiter.
+    theCommand = commandParameters[0] # The command name.
+    commandParameters.pop(0) # Remove the command itself from the list.
+
+    # Parameter debug outputs.
+    if shared.DEBUG:
+        i = 1
+        print("[DEBUG] Command: " + theCommand)
+        for parameter in commandParameters:
+            print("[DEBUG] Parameter #" + str(i) + ": " + parameter)
+            i = i + 1
+
+    if (theCommand in COMMANDS): # If the command exists.
+        handlingFunction = COMMANDS[theCommand] # Fetch the handling function to invoke.
+        handlingFunction(*commandParameters) # Invoke the respective function and pass all parameters.
+    else:
+        print("[CLIENT] Invalid command specified.")
+
+# ======================================================================================================================== #
+# Commands & Command Handlers
+# ======================================================================================================================== #
+
+"""
+    Command: /compress [File Name] [Codec] [Level]
+        [File Name] - The path to the file to compress.
+        [Codec] - Optional codec to compress with (gzip, bz2, lzma or zstd if installed), defaults to gzip.
+        [Level] - Optional compression level, defaults to the codec's own default.
+"""
+def compressFile(fileName = False, codec = compression.DEFAULT_CODEC, level = False):
+    if not fileName or codec not in compression.FILE_CODECS or (level and not level.isdigit()):
+        print("SYNTAX: /compress [File Name] [" + "|".join(compression.FILE_CODECS) + "] [Level]")
+        return
+
+    print("Starting compression..")
+    # Check to see if the client has the file to split.
+    if not os.path.exists(DIRECTORY + "/" + fileName):
+        print("ERROR: You do not have the full file!")
+        return
+
+    outputPath = DIRECTORY + "/" + fileName + compression.getCodecExtension(codec)
+    compression.compressFile(DIRECTORY + "/" + fileName, outputPath, codec, int(level) if level else None)
+    ratio = os.path.getsize(outputPath) / max(os.path.getsize(DIRECTORY + "/" + fileName), 1)
+    print("Done! (" + str(round(ratio * 100, 1)) + "% of original size, File location: " + outputPath + ")")
+COMMANDS["compress"] = compressFile
+
+"""
+    Command: /decompress [File Name] [Codec]
+        [File Name] - The path to the file to decompress.
+        [Codec] - Optional codec the file was compressed with, detected from the compressed file's extension if not given.
+"""
+def decompressFile(fileName = False, codec = False):
+    if not fileName or (codec and codec not in compression.FILE_CODECS):
+        print("SYNTAX: /decompress [File Name] [" + "|".join(compression.FILE_CODECS) + "]")
+        return
+
+    print("Starting decompression..")
+    if not codec: # Find which compressed version of the file exists.
+        for codecName in compression.FILE_CODECS:
+            if os.path.exists(DIRECTORY + "/" + fileName + compression.getCodecExtension(codecName)):
+                codec = codecName
+                break
+
+    # Check to see if the client has the compressed file.
+    if not codec or not os.path.exists(DIRECTORY + "/" + fileName + compression.getCodecExtension(codec)):
+        print("ERROR: A compressed version of that file does not exist!")
+        return
+
+    compression.decompressFile(DIRECTORY + "/" + fileName + compression.getCodecExtension(codec), DIRECTORY + "/" + fileName, codec)
+    print("Done! (File location: " + DIRECTORY + "/" + fileName + ")")
+COMMANDS["decompress"] = decompressFile
+
+"""
+    Command: /build [File Name]
+        [File Name] - The path to the file that should be built using segments that have been fetched.
+"""
+def constructFile(fileName):
+    print("Starting construct of file '" + fileName + "'..")
+    
+    # Check to see if the client already has the file constructed.
+    if os.path.exists(DIRECTORY + "/" + fileName):
+        print("ERROR: You already have this file constructed!")
+        return
+
+    # Check to see if the client has segments.
+    if not os.path.exists(DIRECTORY + "/raw/" + fileName):
+        print("ERROR: You don't have any segments of that file to build from!")
+        return
+
+    if segments.listSegments(DIRECTORY + "/raw/" + fileName, fileName):
+        segments.buildFile(DIRECTORY + "/raw/" + fileName, fileName, DIRECTORY + "/" + fileName) # Join the segments in numeric order.
+        print("Done! (File location: " + DIRECTORY + "/" + fileName + ")")
+        return
+
+    # Otherwise the file was split into the chunk store, rebuild it from the chunks its manifest lists.
+    manifest = loadManifest(DIRECTORY + "/raw/" + fileName + "/" + MANIFEST_NAME)
+    if manifest is None or not CHUNK_STORE:
+        print("ERROR: You don't have any segments of that file to build from!")
+        return
+
+    missingPieces = CHUNK_STORE.getMissingPieces(manifest)
+    if missingPieces:
+        print("ERROR: The chunk store is missing " + str(len(missingPieces)) + " of the " + str(len(manifest.pieces)) + " pieces of that file!")
+        return
+
+    CHUNK_STORE.buildFile(manifest, DIRECTORY + "/" + fileName)
+    print("Done! (File location: " + DIRECTORY + "/" + fileName + ")")
+COMMANDS["build"] = constructFile
+
+"""
+    Command: /split [File Name] [Piece Size] [Mode]
+        [File Name] - The path to a file that should be split into specific bytes.
+        [Piece Size] - Optional size of each segment in bytes, or "cdc" (the default) to cut the file into
+                       content-defined chunks, which line up with the same content in any other file.
+        [Mode] - Optional, "segments" writes every piece to its own numbered segment file and "virtual" only
+                 records the manifest and serves segments straight from the full file. By default the pieces are
+                 added to the chunk store, which keeps content shared with other files or clients only once.
+"""
+def splitFile(fileName = False, pieceSize = "cdc", mode = False):
+    if not fileName or (pieceSize != "cdc" and not pieceSize.isdigit()) or (mode and mode not in ("segments", "virtual")) or pieceSize == "0":
+        print("SYNTAX: split [File Name] [Piece Size|cdc] [segments|virtual]")
+        return
+
+    if not mode: mode = "store" if CHUNK_STORE else "segments"
+    if mode == "segments" and pieceSize == "cdc": pieceSize = str(shared.PIECE_SIZE) # Segment files are numbered by fixed offsets.
+    print("Starting split of file '" + fileName + "'..")
+
+    # Check to see if the client has the file to split.
+    if not os.path.exists(DIRECTORY + "/" + fileName):
+        print("ERROR: You do not have the full file!")
+        return
+
+    outputLocation = DIRECTORY + "/raw/" + fileName + "/"
+    if not os.path.exists(outputLocation): # If a directory for this client socket doesn't exist.
+        os.makedirs(outputLocation) # Create a directory.
+
+    # Record the hash of every segment so downloads can verify each one as it arrives.
+    if pieceSize == "cdc":
+        manifest = createManifest(DIRECTORY + "/" + fileName, CHUNK_MAX_SIZE, os.cpu_count() or 1, chunkFile(DIRECTORY + "/" + fileName))
+    else:
+        manifest = createManifest(DIRECTORY + "/" + fileName, int(pieceSize), os.cpu_count() or 1)
+
+    if mode == "segments":
+        segments.splitFile(DIRECTORY + "/" + fileName, outputLocation, manifest.pieceSize)
+    manifest.save(outputLocation + MANIFEST_NAME)
+
+    if mode == "store":
+        chunksAdded, bytesAdded = CHUNK_STORE.addFile(DIRECTORY + "/" + fileName, manifest)
+        print("Done! (" + str(chunksAdded) + " of " + str(len(manifest.pieces)) + " pieces were new, " + str(bytesAdded) + " of " + str(manifest.fileSize) + " bytes added to the chunk store, Root Hash: " + manifest.root + ")")
+        return
+    print("Done! (Raw Files: " + outputLocation + ", Root Hash: " + manifest.root + ")")
+COMMANDS["split"] = splitFile
+
+"""
+    Command: download [File Name]
+        [File Name] - The name of a file to download in parallel from every client that has it.
+"""
+def downloadFile(fileName = False):
+    if not fileName:
+        print("SYNTAX: download [File Name]")
+        return
+
+    if os.path.exists(DIRECTORY + "/" + fileName):
+        print("ERROR: You already have this file!")
+        return
+
+    frame = sendServerCommand("/findfile " + fileName)
+    if frame is None or "[findfile]" not in frame[1].decode():
+        print("ERROR: No clients have the file '" + fileName + "'.")
+        return
+
+    fileName, peerAddresses = parseFindFileResponse(frame[1].decode())
+    peerAddresses = [address for address in peerAddresses if address != PEER_SERVER.address] # Never download from ourselves.
+    print("Starting download of '" + fileName + "' from " + str(len(peerAddresses)) + " peer(s)..")
+
+    startTime = time.perf_counter()
+    download = SwarmDownload(fileName, peerAddresses, DIRECTORY, PEER_SERVER, PEER_POOL, CHUNK_STORE)
+    if not download.run():
+        print("ERROR: Download of '" + fileName + "' could not be completed.")
+        return
+
+    elapsed = time.perf_counter() - startTime
+    fileSize = os.path.getsize(DIRECTORY + "/" + fileName)
+    if download.resumedBytes: print("    Resumed with " + str(download.resumedBytes) + " bytes already downloaded.")
+    if download.storedBytes: print("    Copied " + str(download.storedBytes) + " bytes already held in the chunk store.")
+    for address, bytesReceived, throughput in download.getPeerStats():
+        print("    [{}:{}]".format(*address) + " sent " + str(bytesReceived) + " bytes at " + str(round(throughput / 1048576, 2)) + " MB/s")
+    print("Done! (" + str(round(fileSize / 1048576 / max(elapsed, 1e-9), 2)) + " MB/s, File location: " + DIRECTORY + "/" + fileName + ")")
+
+    sendServerCommand("/addfile " + fileName) # Let other clients download the file from us too.
+COMMANDS["download"] = downloadFile
+
+"""
+    Command: fetch [File Name]
+        [File Name] - The name of a file on the server to download in ranges. A fetch that was interrupted
+                      continues from the last piece it completed.
+"""
+def fetchFile(fileName = False):
+    if not fileName:
+        print("SYNTAX: fetch [File Name]")
+        return
+
+    if os.path.exists(DIRECTORY + "/" + fileName):
+        print("ERROR: You already have this file!")
+        return
+
+    startTime = time.perf_counter()
+    try:
+        resumedBytes, fetchedBytes = CONNECTION.fetchResumable(fileName, compression.WIRE_CODECS if shared.WIRE_COMPRESSION else ())
+    except shared.ProtocolError as e:
+        print("ERROR: " + str(e))
+        return
+    except ConnectionError:
+        print("ERROR: Lost connection to the server, run fetch again to resume the download.")
+        return
+
+    elapsed = time.perf_counter() - startTime
+    if resumedBytes: print("    Resumed with " + str(resumedBytes) + " bytes already downloaded.")
+    print("Done! (" + str(fetchedBytes) + " bytes at " + str(round(fetchedBytes / 1048576 / max(elapsed, 1e-9), 2)) + " MB/s, File location: " + DIRECTORY + "/" + fileName + ")")
+COMMANDS["fetch"] = fetchFile
+
+"""
+    Command: announce
+    Adds every file in the client's directory to the server tracker in one batch, along with its size and
+    the root hash of its manifest if it has been split. Files split into the chunk store are announced
+    even once the full file is gone, as long as the store holds every piece.
+"""
+def announceFiles():
+    files = []
+    for fileName in os.listdir(DIRECTORY):
+        filePath = DIRECTORY + "/" + fileName
+        if not os.path.isfile(filePath) or fileName.endswith((PARTIAL_EXTENSION, STATE_EXTENSION)): continue
+        manifest = loadManifest(DIRECTORY + "/raw/" + fileName + "/" + MANIFEST_NAME)
+        files.append((fileName, os.path.getsize(filePath), manifest.root if manifest else None))
+
+    if CHUNK_STORE and os.path.isdir(DIRECTORY + "/raw"):
+        for fileName in os.listdir(DIRECTORY + "/raw"):
+            if os.path.exists(DIRECTORY + "/" + fileName): continue # Already announced.
+            manifest = loadManifest(DIRECTORY + "/raw/" + fileName + "/" + MANIFEST_NAME)
+            if manifest and manifest.isValid() and not CHUNK_STORE.getMissingPieces(manifest): files.append((fileName, manifest.fileSize, manifest.root))
+
+    if not files:
+        print("ERROR: You do not have any files to announce!")
+        return
+
+    frame = sendServerCommand(formatAnnounceCommand(files))
+    if frame is None or not frame[1].decode().startswith("[announce]"):
+        print("ERROR: The server rejected the announcement.")
+        return
+    added, duplicates = frame[1].decode().replace("[announce]", '', 1).split(";")
+    print("Done! (" + added + " new files added to the server tracker, " + duplicates + " already recorded)")
+COMMANDS["announce"] = announceFiles
+
+"""
+    Command: /help
+    Outputs all available commands to the CLI.
+"""
+def showHelpCommand():
+    print("[CLIENT] Available Commands:" + COMMAND_LIST)
+COMMANDS["help"] = showHelpCommand
+
+# Generate the command list.
+COMMAND_LIST = ""
+for commandName in COMMANDS: COMMAND_LIST = COMMAND_LIST + " /" + commandName + ","
+COMMAND_LIST = COMMAND_LIST[:-1]
+
+# ======================================================================================================================== #
+# Client API
+# ======================================================================================================================== #
+
+'''
+    TrackerConnection(serverAddress, bindAddress, directory)
+        Programmatic connection to the tracker server. Every command is tagged with a request ID so many commands
+        can be in flight on the one connection at once; the server answers them in order and each reply is
+        matched back to its request. Files sent by /fetchfile are received into the given directory.
+        A connection must only be used by one thread at a time, share them between threads with a pool.
+        Connections left idle for longer than the server's idle timeout are closed by the server unless they
+        send heartbeats, see startHeartbeat().
+
+        connection = TrackerConnection()
+        messageType, payload = connection.request("/findfile file_1.mp3")
+        responses = connection.pipeline(["/findfile file_" + str(i) + ".mp3" for i in range(1000)], depth = 64)
+
+        pool = shared.ConnectionPool(TrackerConnection)
+        with pool.connection(shared.SERVER_ADDRESS) as connection:
+            ..
+'''
+class TrackerConnection:
+    def __init__(self, serverAddress = shared.SERVER_ADDRESS, bindAddress = None, directory = "."):
+        self.directory = directory
+        self.nextRequestId = 1
+        self.outstanding = deque() # Request IDs sent and not yet answered, oldest first.
+        self.partialFiles = {} # File name -> PartialFile of every fetchResumable download in progress.
+        self.sendLock = threading.Lock() # Keeps heartbeats from being written in the middle of a command.
+        self.closed = threading.Event() # Stops the heartbeats.
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM) # Create a TCP/IP socket.
+        self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1) # Pipelined commands are small, send them immediately.
+        if bindAddress:
+            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            self.socket.bind(bindAddress)
+        self.socket.connect(serverAddress) # Connect the socket to the port where the server is listening.
+
+    '''
+        send(command)
+            Sends a command without waiting for its reply and returns the request ID it was tagged with.
+    '''
+    def send(self, command):
+        requestId = self.nextRequestId
+        self.nextRequestId = self.nextRequestId % 0xFFFFFFFF + 1 # Request IDs wrap around and never use 0.
+
+        payload = hashlib.sha224(command.encode()).hexdigest() + ";HASH;" + command
+        with self.sendLock:
+            shared.sendFrame(self.socket, shared.MSG_COMMAND, payload.encode(), shared.FLAG_NONE, requestId)
+        if command != "exit": self.outstanding.append(requestId) # The server never answers exit.
+        return requestId
+
+    '''
+        receive()
+            Waits for the reply to the oldest outstanding command and returns a (messageType, payload) tuple.
+            For MSG_FILE replies the file has already been received into the connection's directory, and for
+            MSG_RANGE replies the range has been written into the file being fetched.
+    '''
+    def receive(self):
+        if not self.outstanding: raise shared.ProtocolError("No command is waiting for a reply.")
+
+        frame = shared.recvFrame(self.socket, withHeader = True)
+        if frame is None: raise ConnectionError("Server closed the connection.")
+        messageType, payload, flags, requestId = frame
+        expectedId = self.outstanding.popleft()
+        if requestId != expectedId:
+            raise shared.ProtocolError("Expected the reply to request " + str(expectedId) + ", received " + str(requestId) + ".")
+
+        if messageType == shared.MSG_FILE:
+            fileHeader = payload.decode().split("\0") # File name, size and optional codec are separated by null bytes.
+            receiveFile(self.socket, self.directory, fileHeader[0], int(fileHeader[1]), fileHeader[2] if len(fileHeader) > 2 else False)
+        elif messageType == shared.MSG_RANGE:
+            self.receiveRange(payload)
+        return messageType, payload
+
+    def request(self, command):
+        self.send(command)
+        return self.receive()
+
+    '''
+        pipeline(commands, depth)
+            Sends every command keeping up to depth of them in flight, returns their replies in order.
+    '''
+    def pipeline(self, commands, depth = 8):
+        responses = []
+        for command in commands:
+            if len(self.outstanding) >= depth: responses.append(self.receive())
+            self.send(command)
+        while self.outstanding: responses.append(self.receive())
+        return responses
+
+    '''
+        announce(files)
+            Adds a batch of file names, or (fileName, fileSize, rootHash) tuples, to the tracker in one command.
+            Returns a (new records, already recorded) tuple.
+    '''
+    def announce(self, files):
+        messageType, payload = self.request(formatAnnounceCommand(files))
+        response = payload.decode()
+        if not response.startswith("[announce]"): raise shared.ProtocolError("Announce failed: " + response)
+        added, duplicates = response.replace("[announce]", '', 1).split(";")
+        return int(added), int(duplicates)
+
+    '''
+        findFiles(fileNames)
+            Looks up a batch of files in one command, see parseFindFilesResponse for the result.
+    '''
+    def findFiles(self, fileNames):
+        messageType, payload = self.request("/findfiles\n" + "\n".join(fileNames))
+        response = payload.decode()
+        if not response.startswith("[findfiles]"): raise shared.ProtocolError("Lookup failed: " + response)
+        return parseFindFilesResponse(response)
+
+    '''
+        fetchResumable(fileName, acceptedCodecs, pieceSize)
+            Downloads a file from the server with /fetchrange into the connection's directory, recording every
+            completed piece in a PartialFile. If an earlier fetch of the same version of the file was interrupted,
+            only its missing pieces are requested. Returns (bytes resumed from disk, bytes fetched now).
+    '''
+    def fetchResumable(self, fileName, acceptedCodecs = (), pieceSize = RANGE_PIECE_SIZE):
+        if not isSafeFileName(fileName): raise shared.ProtocolError("Unsafe file name: " + fileName)
+        codecs = " " + ",".join(acceptedCodecs) if acceptedCodecs else ""
+
+        messageType, payload = self.request("/fetchrange " + fileName + " 0 0") # Only the file's size and version.
+        if messageType != shared.MSG_RANGE: raise shared.ProtocolError("Fetch failed: " + payload.decode())
+        fileSize, modifiedTime = shared.RANGE_HEADER.unpack_from(payload)[:2]
+
+        partialFile = PartialFile(os.path.join(self.directory, fileName), fileSize, pieceSize, "server:" + str(fileSize) + ":" + str(modifiedTime))
+        resumedBytes = partialFile.getCompletedBytes()
+        self.partialFiles[fileName] = partialFile
+        try:
+            commands = ["/fetchrange " + fileName + " " + str(offset) + " " + str(length) + codecs for offset, length in partialFile.getMissingRanges()]
+            for messageType, payload in self.pipeline(commands, RANGE_PIPELINE_DEPTH):
+                if messageType != shared.MSG_RANGE: raise shared.ProtocolError("Fetch failed: " + payload.decode())
+        finally:
+            del self.partialFiles[fileName]
+            partialFile.close()
+
+        if not partialFile.bitfield.isComplete(): raise shared.ProtocolError("The server sent fewer bytes than the file holds.")
+        partialFile.finish()
+        return resumedBytes, fileSize - resumedBytes
+
+    '''
+        receiveRange(payload)
+            Receives the bytes of a MSG_RANGE reply into the PartialFile being fetched, recording every piece as
+            soon as its last byte is written so a connection lost mid-range keeps the pieces that did arrive.
+    '''
+    def receiveRange(self, payload):
+        fileSize, modifiedTime, offset, length = shared.RANGE_HEADER.unpack_from(payload)
+        if length == 0: return
+        rangeHeader = bytes(payload[shared.RANGE_HEADER.size:]).decode().split("\0") # File name and optional codec.
+        partialFile = self.partialFiles.get(rangeHeader[0])
+        if partialFile is None or partialFile.identity != "server:" + str(fileSize) + ":" + str(modifiedTime):
+            raise shared.ProtocolError("Received a range of '" + rangeHeader[0] + "' that is not being fetched, or the file changed on the server.")
+        if offset % partialFile.pieceSize or offset + length > fileSize:
+            raise shared.ProtocolError("Server sent a range outside the file's pieces.")
+
+        nextPiece = offset // partialFile.pieceSize
+        def recordProgress(received):
+            nonlocal nextPiece
+            while nextPiece < partialFile.pieceCount and min((nextPiece + 1) * partialFile.pieceSize, fileSize) <= offset + received:
+                partialFile.markComplete(nextPiece)
+                nextPiece = nextPiece + 1
+
+        if len(rangeHeader) > 1:
+            compression.recvCompressedRange(self.socket, partialFile.fileDescriptor, offset, length, rangeHeader[1], recordProgress)
+        else:
+            shared.recvRangeStream(self.socket, partialFile.fileDescriptor, offset, length, recordProgress)
+
+    '''
+        startHeartbeat(interval)
+            Sends a heartbeat every interval seconds from a background thread until the connection is closed, so
+            the server keeps the connection open however long it stays idle, such as while a user types.
+    '''
+    def startHeartbeat(self, interval = shared.HEARTBEAT_INTERVAL):
+        threading.Thread(target = self.sendHeartbeats, args = (interval,), daemon = True).start()
+
+    def sendHeartbeats(self, interval):
+        while not self.closed.wait(interval):
+            try:
+                with self.sendLock:
+                    shared.sendFrame(self.socket, shared.MSG_HEARTBEAT)
+            except OSError:
+                return # Disconnected, the next command reports it.
+
+    def close(self):
+        self.closed.set()
+        try:
+            self.send("exit")
+        except OSError:
+            pass # Already disconnected.
+        self.socket.close()
+
+# ======================================================================================================================== #
+# Socket Data Input/Output
+# ======================================================================================================================== #
+
+'''
+    sendServerCommand(command)
+        Sends a command from the interactive client to the server. Returns the (messageType, payload) frame the
+        server responded with, or None if the command was "exit" or the connection was lost.
+'''
+def sendServerCommand(command):
+    if command == "exit":
+        CONNECTION.send(command)
+        return None
+    try:
+        return CONNECTION.request(command)
+    except ConnectionError:
+        return None
+    except shared.ProtocolError as e: # The connection is out of step with the server and cannot be used again.
+        print("[CLIENT] Received an invalid reply from the server: " + str(e))
+        return None
+
+'''
+    startClient(clientSocket)
+        Connects the interactive client to the server and starts sharing its directory with other clients.
+'''
+def startClient(clientSocket):
+    global CLIENT_SOCKET, DIRECTORY, CLIENT_ADDRESS, CONNECTION, PEER_SERVER, CHUNK_STORE
+    CLIENT_SOCKET = clientSocket
+    DIRECTORY = str(CLIENT_SOCKET)
+    CLIENT_ADDRESS = (shared.SERVER_ADDRESS[0], CLIENT_SOCKET)
+
+    if not os.path.exists(DIRECTORY): # If a directory for this client socket doesn't exist.
+        os.makedirs(DIRECTORY) # Create a directory.
+
+    print("[CLIENT] Establishing connection to server..")
+    CONNECTION = TrackerConnection(shared.SERVER_ADDRESS, CLIENT_ADDRESS, DIRECTORY)
+    CONNECTION.startHeartbeat() # Stay connected while waiting for the user's next command.
+
+    # Start serving pieces of our files to other clients and let the server know where to find them.
+    if shared.CHUNK_STORE_DIRECTORY: CHUNK_STORE = ChunkStore(shared.CHUNK_STORE_DIRECTORY)
+    PEER_SERVER = PeerServer(DIRECTORY, CLIENT_ADDRESS[0], chunkStore = CHUNK_STORE)
+    PEER_SERVER.start()
+    sendServerCommand("/serve " + str(PEER_SERVER.address[1]))
+
+'''
+    runClient()
+        Reads commands from the command line until the user exits.
+'''
+def runClient():
+    try:
+        while True:
+            if not os.path.exists(DIRECTORY): # If a directory for this client socket doesn't exist.
+                os.makedirs(DIRECTORY) # Create a directory.
+
+            command = input("Please specify a command: ") # Get user input from command line.
+            if len(command) > 0: # If the client has provided an input.
+                if (command[0] == shared.COMMAND_PREFIX) or command == "exit": # If user is providing a server command.
+                    if shared.WIRE_COMPRESSION and command.startswith("/fetchfile ") and command.count(" ") == 1:
+                        command = command + " " + ",".join(compression.WIRE_CODECS) # Offer the codecs we can decode.
+                    frame = sendServerCommand(command)
+                    if command == "exit": break # Exit command to quit.
+
+                    if frame is None:
+                        print("[CLIENT] Lost connection to the server.")
+                        break
+
+                    messageType, serverResponse = frame
+                    if messageType == shared.MSG_FILE:
+                        fileName = serverResponse.decode().split("\0")[0]
+                        print("[CLIENT] Done! (File location: " + DIRECTORY + "/" + fileName + ")")
+                    elif messageType == shared.MSG_RESPONSE:
+                        serverResponse = serverResponse.decode()
+
+                        # Parse command specific responses from server.
+                        if "[ping]" in serverResponse:
+                            currentTime = time.time() # Get the current epoch time.
+                            serverResponse = serverResponse.replace("[ping]", '') # Remove the [ping] prefix.
+                            difference = currentTime - float(serverResponse) # Take the client's epoch from the servers to calculate difference in ms.
+                            print("Pong! (Response took " + str(round(difference, 4)) + "ms)")
+                        elif serverResponse.startswith("[findfiles]"):
+                            for fileName, (fileSize, rootHash, peerAddresses) in parseFindFilesResponse(serverResponse).items():
+                                if peerAddresses:
+                                    print("[SERVER] " + fileName + ": " + " ".join("[{}:{}]".format(*address) for address in peerAddresses))
+                                else:
+                                    print("[SERVER] " + fileName + ": No clients have this file.")
+                        elif serverResponse.startswith("[announce]"):
+                            added, duplicates = serverResponse.replace("[announce]", '', 1).split(";")
+                            print("[SERVER] You have added " + added + " new files to the server tracker (" + duplicates + " already recorded).")
+                        elif serverResponse.startswith("[stats]"):
+                            print("[SERVER] Server statistics:\n  " + serverResponse.replace("[stats]", '', 1).replace("\n", "\n  "))
+                        elif "[findfile]" in serverResponse:
+                            fileName, peerAddresses = parseFindFileResponse(serverResponse)
+                            print("[SERVER] The following clients have that file: " + " ".join("[{}:{}]".format(*address) for address in peerAddresses))
+                        else:
+                            # No command specific action, just print raw response.
+                            print("[SERVER] " + serverResponse)
+                else:
+                    parseClientCommand(command)
+    finally:
+        print('Closing connection to server..')
+        PEER_SERVER.close()
+        PEER_POOL.close()
+        CONNECTION.closed.set()
+        CONNECTION.socket.close()
+        print("Goodbye!")
+
+if __name__ == "__main__":
+    clientSocket = random.randrange(1, 25565) # Generate a random socket number.
+    if len(sys.argv) > 1: clientSocket = int(sys.argv[1]) # If socket ID was provided in command line, use that.
+    startClient(clientSocket)
+    runClient()
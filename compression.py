@@ -0,0 +1,214 @@
+'''
+    @author  Skully (https://github.com/ImSkully)
+    @website https://skully.tech
+    @email   contact@skully.tech
+    @updated 13/12/21
+
+    A simple peer-to-peer file sharing torrenting network with encrypted payload transportation
+    and support for multiple clients over sockets with multi-threading.
+'''
+
+import bz2
+import gzip
+import lzma
+import zlib
+import os
+import shutil
+import shared
+
+try:
+    import zstandard # Optional, enables the zstd codec when installed.
+except ImportError:
+    zstandard = None
+
+# ======================================================================================================================== #
+# Compression Variable Definitions
+# ======================================================================================================================== #
+
+'''
+    FILE_CODECS = {
+        ["codecName"] = (file extension, default level),
+    }
+'''
+FILE_CODECS = {
+    "gzip": (".gz", 6),
+    "bz2": (".bz2", 9),
+    "lzma": (".xz", 6),
+}
+if zstandard: FILE_CODECS["zstd"] = (".zst", 3)
+
+'''
+    WIRE_CODECS = {
+        ["codecName"] = default level,
+    }
+    In order of preference when negotiating a transfer.
+'''
+WIRE_CODECS = {}
+if zstandard: WIRE_CODECS["zstd"] = 3
+WIRE_CODECS["zlib"] = 1
+
+DEFAULT_CODEC = "gzip" # Codec used by /compress when none is given.
+COMPRESSIBLE_RATIO = 0.9 # Data is only sent compressed when it shrinks to at most this fraction of its size.
+SAMPLE_SIZE = 65536 # Bytes sampled from the start of a file to decide whether a transfer is worth compressing.
+COPY_BUFFER_SIZE = 1048576 # Bytes read at a time while streaming a file through a codec.
+
+# ======================================================================================================================== #
+# File Compression
+# ======================================================================================================================== #
+
+'''
+    getCodecExtension(codec)
+        Returns the file extension used for files compressed with the codec.
+'''
+def getCodecExtension(codec):
+    return FILE_CODECS[codec][0]
+
+'''
+    compressFile(inputPath, outputPath, codec, level)
+        Streams a file through the codec into the output path without holding it in memory.
+'''
+def compressFile(inputPath, outputPath, codec = DEFAULT_CODEC, level = None):
+    if level is None: level = FILE_CODECS[codec][1]
+
+    with open(inputPath, "rb") as fileInput:
+        if codec == "zstd":
+            with open(outputPath, "wb") as fileOutput:
+                zstandard.ZstdCompressor(level = level).copy_stream(fileInput, fileOutput)
+            return
+
+        if codec == "gzip":
+            fileOutput = gzip.open(outputPath, "wb", compresslevel = level)
+        elif codec == "bz2":
+            fileOutput = bz2.open(outputPath, "wb", compresslevel = level)
+        else:
+            fileOutput = lzma.open(outputPath, "wb", preset = level)
+        with fileOutput:
+            shutil.copyfileobj(fileInput, fileOutput, COPY_BUFFER_SIZE)
+
+'''
+    decompressFile(inputPath, outputPath, codec)
+        Streams a compressed file back through the codec into the output path.
+'''
+def decompressFile(inputPath, outputPath, codec = DEFAULT_CODEC):
+    with open(outputPath, "wb") as fileOutput:
+        if codec == "zstd":
+            with open(inputPath, "rb") as fileInput:
+                zstandard.ZstdDecompressor().copy_stream(fileInput, fileOutput)
+            return
+
+        if codec == "gzip":
+            fileInput = gzip.open(inputPath, "rb")
+        elif codec == "bz2":
+            fileInput = bz2.open(inputPath, "rb")
+        else:
+            fileInput = lzma.open(inputPath, "rb")
+        with fileInput:
+            shutil.copyfileobj(fileInput, fileOutput, COPY_BUFFER_SIZE)
+
+# ======================================================================================================================== #
+# Wire Compression
+# ======================================================================================================================== #
+
+def compressChunk(data, codec, level = None):
+    if level is None: level = WIRE_CODECS[codec]
+    if codec == "zstd": return zstandard.ZstdCompressor(level = level).compress(data)
+    return zlib.compress(data, level)
+
+def decompressChunk(data, codec):
+    # Senders never compress more than one stream chunk at a time, so cap the output at that size.
+    if codec == "zstd": return zstandard.ZstdDecompressor().decompress(data, max_output_size = shared.STREAM_CHUNK_SIZE)
+    return zlib.decompressobj().decompress(data, shared.STREAM_CHUNK_SIZE)
+
+'''
+    negotiateCodec(acceptedCodecs)
+        Returns the most preferred wire codec that the other side also accepts, or None if there is none.
+'''
+def negotiateCodec(acceptedCodecs):
+    for codec in WIRE_CODECS:
+        if codec in acceptedCodecs: return codec
+    return None
+
+'''
+    isCompressible(sample, codec)
+        Returns True if a sample of the data shrinks enough to be worth compressing, so already compressed
+        content such as mp3 files is sent as-is.
+'''
+def isCompressible(sample, codec):
+    if not sample: return False
+    return len(compressChunk(sample, codec)) <= len(sample) * COMPRESSIBLE_RATIO
+
+'''
+    encodeChunk(chunk, codec)
+        Returns the (flags, payload) of the MSG_CHUNK frame carrying the chunk. The chunk is compressed and
+        flagged with FLAG_COMPRESSED unless compressing it would not save enough to be worth it.
+'''
+def encodeChunk(chunk, codec):
+    compressed = compressChunk(chunk, codec)
+    if len(compressed) <= len(chunk) * COMPRESSIBLE_RATIO: return shared.FLAG_COMPRESSED, compressed
+    return shared.FLAG_NONE, chunk
+
+'''
+    iterCompressedChunks(fileObject, count, codec)
+        Reads count bytes of an open binary file a chunk at a time and yields the (flags, payload) of the MSG_CHUNK
+        frame carrying each one, see encodeChunk. Only one chunk is held in memory at a time.
+'''
+def iterCompressedChunks(fileObject, count, codec):
+    remaining = count
+    while remaining > 0:
+        chunk = fileObject.read(min(remaining, shared.STREAM_CHUNK_SIZE))
+        if not chunk:
+            raise ConnectionError("File ended with " + str(remaining) + " bytes left to stream.")
+        remaining = remaining - len(chunk)
+        yield encodeChunk(chunk, codec)
+
+'''
+    sendCompressedStream(theSocket, fileObject, count, codec, requestId)
+        Streams count bytes of an open binary file as a series of MSG_CHUNK frames. Each chunk is compressed
+        on its own and flagged with FLAG_COMPRESSED, unless compressing it would not save enough to be worth it.
+'''
+def sendCompressedStream(theSocket, fileObject, count, codec, requestId = 0):
+    for flags, payload in iterCompressedChunks(fileObject, count, codec):
+        shared.sendFrame(theSocket, shared.MSG_CHUNK, payload, flags, requestId)
+
+'''
+    recvCompressedStream(theSocket, filePath, size, codec)
+        Receives MSG_CHUNK frames until size bytes of file data have been written to the output path.
+'''
+def recvCompressedStream(theSocket, filePath, size, codec):
+    with open(filePath, "wb") as outputFile:
+        written = 0
+        while written < size:
+            frame = shared.recvFrame(theSocket, withHeader = True)
+            if frame is None:
+                raise ConnectionError("Connection closed with " + str(size - written) + " bytes outstanding.")
+
+            messageType, payload, flags, requestId = frame
+            if messageType != shared.MSG_CHUNK:
+                raise shared.ProtocolError("Expected a file chunk, received message type " + str(messageType) + ".")
+            if flags & shared.FLAG_COMPRESSED: payload = decompressChunk(payload, codec)
+            if len(payload) > size - written:
+                raise shared.ProtocolError("Server sent more bytes than the file holds.")
+            outputFile.write(payload)
+            written = written + len(payload)
+
+'''
+    recvCompressedRange(theSocket, fileDescriptor, offset, length, codec, progress)
+        Receives MSG_CHUNK frames until length bytes of file data have been written into an open file starting at
+        offset. If given, progress(received) is called after every chunk, see shared.recvRangeStream.
+'''
+def recvCompressedRange(theSocket, fileDescriptor, offset, length, codec, progress = None):
+    received = 0
+    while received < length:
+        frame = shared.recvFrame(theSocket, withHeader = True)
+        if frame is None:
+            raise ConnectionError("Connection closed with " + str(length - received) + " bytes outstanding.")
+
+        messageType, payload, flags, requestId = frame
+        if messageType != shared.MSG_CHUNK:
+            raise shared.ProtocolError("Expected a file chunk, received message type " + str(messageType) + ".")
+        if flags & shared.FLAG_COMPRESSED: payload = decompressChunk(payload, codec)
+        if len(payload) > length - received:
+            raise shared.ProtocolError("Server sent more bytes than the range holds.")
+        os.pwrite(fileDescriptor, payload, offset + received)
+        received = received + len(payload)
+        if progress: progress(received)
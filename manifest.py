@@ -0,0 +1,177 @@
+'''
+    @author  Skully (https://github.com/ImSkully)
+    @website https://skully.tech
+    @email   contact@skully.tech
+    @updated 13/12/21
+
+    A simple peer-to-peer file sharing torrenting network with encrypted payload transportation
+    and support for multiple clients over sockets with multi-threading.
+'''
+
+import os
+import json
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+
+# ======================================================================================================================== #
+# Piece Manifest
+# ======================================================================================================================== #
+
+MANIFEST_NAME = "manifest.json" # Name of the manifest file written alongside a file's segments.
+
+'''
+    MANIFEST = {
+        "fileName": "file_1.mp3",
+        "fileSize": 2754116,
+        "pieceSize": 50000,
+        "pieces": ["<sha256 of piece 0>", "<sha256 of piece 1>", ..],
+        "root": "<sha256 of every piece digest concatenated in order>",
+        "chunkSizes": [61440, 23816, ..], (only for content-defined chunks, see chunkstore.chunkFile)
+    }
+
+    Pieces are pieceSize bytes each but the last, unless the manifest lists the size of every piece in chunkSizes,
+    in which case pieceSize is the largest a piece may be.
+'''
+class Manifest:
+    def __init__(self, fileName, fileSize, pieceSize, pieces, root = None, chunkSizes = None):
+        self.fileName = fileName
+        self.fileSize = fileSize
+        self.pieceSize = pieceSize
+        self.pieces = pieces # Hex SHA-256 digest of every piece, in order.
+        self.root = root if root is not None else getRootHash(pieces)
+        self.chunkSizes = chunkSizes
+        self.chunkOffsets = None # Offset of every piece and the file size, for pieces of varying size.
+        if chunkSizes is not None:
+            self.chunkOffsets = [0]
+            for chunkSize in chunkSizes: self.chunkOffsets.append(self.chunkOffsets[-1] + chunkSize)
+
+    '''
+        isValid()
+            Checks the manifest is internally consistent: the piece list matches the file size and the root hash.
+    '''
+    def isValid(self):
+        if self.pieceSize <= 0: return False
+        if self.chunkSizes is not None:
+            if len(self.chunkSizes) != len(self.pieces) or self.chunkOffsets[-1] != self.fileSize: return False
+            if any(chunkSize <= 0 or chunkSize > self.pieceSize for chunkSize in self.chunkSizes): return False
+        elif len(self.pieces) != (self.fileSize + self.pieceSize - 1) // self.pieceSize:
+            return False
+        return getRootHash(self.pieces) == self.root
+
+    '''
+        getPieceRange(index)
+            Returns the (offset, length) of the piece at the given index within the file.
+    '''
+    def getPieceRange(self, index):
+        if self.chunkOffsets is not None: return self.chunkOffsets[index], self.chunkSizes[index]
+        offset = index * self.pieceSize
+        return offset, min(self.pieceSize, self.fileSize - offset)
+
+    '''
+        verifyPiece(index, pieceData)
+            Returns True if the given bytes are the expected contents of the piece.
+    '''
+    def verifyPiece(self, index, pieceData):
+        return hashlib.sha256(pieceData).hexdigest() == self.pieces[index]
+
+    def toBytes(self):
+        manifest = {
+            "fileName": self.fileName,
+            "fileSize": self.fileSize,
+            "pieceSize": self.pieceSize,
+            "pieces": self.pieces,
+            "root": self.root,
+        }
+        if self.chunkSizes is not None: manifest["chunkSizes"] = self.chunkSizes
+        return json.dumps(manifest).encode()
+
+    @classmethod
+    def fromBytes(cls, data):
+        manifest = json.loads(data)
+        return cls(manifest["fileName"], manifest["fileSize"], manifest["pieceSize"], manifest["pieces"], manifest["root"], manifest.get("chunkSizes"))
+
+    def save(self, manifestPath):
+        with open(manifestPath, "wb") as manifestFile:
+            manifestFile.write(self.toBytes())
+
+'''
+    loadManifest(manifestPath)
+        Reads a manifest from disk, returns None if it does not exist or cannot be parsed.
+'''
+def loadManifest(manifestPath):
+    try:
+        with open(manifestPath, "rb") as manifestFile:
+            return Manifest.fromBytes(manifestFile.read())
+    except (OSError, ValueError, KeyError):
+        return None
+
+'''
+    getRootHash(pieces)
+        Returns the whole-file root hash for a list of hex piece digests.
+'''
+def getRootHash(pieces):
+    rootHash = hashlib.sha256()
+    for pieceHash in pieces: rootHash.update(bytes.fromhex(pieceHash))
+    return rootHash.hexdigest()
+
+'''
+    hashPieces(filePath, pieceSize, threads)
+        Returns the hex SHA-256 digest of every piece of the file. Pieces are read one at a time so the file is
+        never fully resident; with more than one thread, pieces are hashed in parallel since hashlib releases
+        the GIL while digesting.
+'''
+def hashPieces(filePath, pieceSize, threads = 1):
+    fileSize = os.path.getsize(filePath)
+    pieceCount = (fileSize + pieceSize - 1) // pieceSize
+
+    if threads <= 1:
+        pieces = []
+        buffer = bytearray(pieceSize)
+        view = memoryview(buffer)
+        with open(filePath, "rb", buffering = 0) as file:
+            for index in range(pieceCount):
+                read = file.readinto(buffer)
+                pieces.append(hashlib.sha256(view[:read]).hexdigest())
+        return pieces
+
+    fileDescriptor = os.open(filePath, os.O_RDONLY)
+    try:
+        def hashPiece(index):
+            return hashlib.sha256(os.pread(fileDescriptor, pieceSize, index * pieceSize)).hexdigest()
+
+        with ThreadPoolExecutor(max_workers = threads) as executor:
+            return list(executor.map(hashPiece, range(pieceCount)))
+    finally:
+        os.close(fileDescriptor)
+
+'''
+    hashChunks(filePath, chunkSizes, threads)
+        Returns the hex SHA-256 digest of every chunk of the file, where chunk X is the chunkSizes[X] bytes that
+        follow the chunks before it. Hashed in parallel like hashPieces.
+'''
+def hashChunks(filePath, chunkSizes, threads = 1):
+    chunkRanges = []
+    offset = 0
+    for chunkSize in chunkSizes:
+        chunkRanges.append((offset, chunkSize))
+        offset = offset + chunkSize
+
+    fileDescriptor = os.open(filePath, os.O_RDONLY)
+    try:
+        def hashChunk(chunkRange):
+            return hashlib.sha256(os.pread(fileDescriptor, chunkRange[1], chunkRange[0])).hexdigest()
+
+        with ThreadPoolExecutor(max_workers = max(threads, 1)) as executor:
+            return list(executor.map(hashChunk, chunkRanges))
+    finally:
+        os.close(fileDescriptor)
+
+'''
+    createManifest(filePath, pieceSize, threads, chunkSizes)
+        Hashes a file on disk and returns its Manifest, split into pieces of pieceSize bytes or, if chunkSizes
+        is given, into chunks of those sizes of at most pieceSize bytes each.
+'''
+def createManifest(filePath, pieceSize, threads = 1, chunkSizes = None):
+    if chunkSizes is not None:
+        return Manifest(os.path.basename(filePath), os.path.getsize(filePath), pieceSize, hashChunks(filePath, chunkSizes, threads), chunkSizes = chunkSizes)
+    return Manifest(os.path.basename(filePath), os.path.getsize(filePath), pieceSize, hashPieces(filePath, pieceSize, threads))
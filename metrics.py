@@ -0,0 +1,244 @@
+'''
+    @author  Skully (https://github.com/ImSkully)
+    @website https://skully.tech
+    @email   contact@skully.tech
+    @updated 13/12/21
+
+    A simple peer-to-peer file sharing torrenting network with encrypted payload transportation
+    and support for multiple clients over sockets with multi-threading.
+'''
+
+import bisect
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# ======================================================================================================================== #
+# Metric Types
+# ======================================================================================================================== #
+
+LATENCY_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10) # Seconds.
+
+class Counter:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.value = 0
+
+    def inc(self, amount = 1):
+        with self.lock:
+            self.value = self.value + amount
+
+    def get(self):
+        return self.value
+
+class Gauge(Counter):
+    def dec(self, amount = 1):
+        self.inc(-amount)
+
+    def set(self, value):
+        self.value = value
+
+'''
+    GaugeFunction(function)
+        Gauge whose value is read from a function whenever it is collected, for values the server already keeps.
+'''
+class GaugeFunction:
+    def __init__(self, function):
+        self.function = function
+
+    def get(self):
+        return self.function()
+
+'''
+    Histogram(buckets)
+        Counts observations into fixed buckets, each counting the values up to and including its upper bound.
+'''
+class Histogram:
+    def __init__(self, buckets = LATENCY_BUCKETS):
+        self.lock = threading.Lock()
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1) # The last bucket holds values above every bound.
+        self.sum = 0.0
+
+    @property
+    def count(self):
+        return sum(self.counts)
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    '''
+        merge(histogram)
+            Adds every observation of another histogram with the same buckets to this one, returns this histogram.
+    '''
+    def merge(self, histogram):
+        counts = list(histogram.counts)
+        with self.lock:
+            for index, bucketCount in enumerate(counts):
+                self.counts[index] += bucketCount
+            self.sum += histogram.sum
+        return self
+
+    '''
+        percentile(fraction)
+            Estimates the value at the fraction (0.0 - 1.0) of observations as the upper bound of its bucket.
+    '''
+    def percentile(self, fraction):
+        with self.lock:
+            counts = list(self.counts)
+        count = sum(counts)
+        if count == 0: return 0.0
+
+        target = fraction * count
+        seen = 0
+        for index, bucketCount in enumerate(counts):
+            seen = seen + bucketCount
+            if seen >= target and bucketCount: return self.buckets[index] if index < len(self.buckets) else float("inf")
+        return float("inf")
+
+'''
+    LocalHistogram(buckets)
+        Histogram that is only ever updated by the thread that owns it, such as the one serving a connection, so
+        observations skip the lock. Other threads can still read it or merge it into a shared Histogram.
+'''
+class LocalHistogram(Histogram):
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+# ======================================================================================================================== #
+# Metrics Registry
+# ======================================================================================================================== #
+
+'''
+    Metric(name, helpText, metricType, labelName, factory, collector)
+        A named metric, optionally split by the value of one label into a child metric per value. A metric with
+        a collector function has no children of its own, the collector returns them whenever it is rendered.
+'''
+class Metric:
+    def __init__(self, name, helpText, metricType, labelName, factory, collector = None):
+        self.name = name
+        self.helpText = helpText
+        self.metricType = metricType
+        self.labelName = labelName
+        self.factory = factory
+        self.collector = collector
+        self.lock = threading.Lock()
+        self.children = {} if labelName or collector else {None: factory()}
+
+    def labels(self, labelValue):
+        child = self.children.get(labelValue)
+        if child is None:
+            with self.lock:
+                child = self.children.setdefault(labelValue, self.factory())
+        return child
+
+    def collect(self):
+        return self.collector() if self.collector else dict(self.children)
+
+'''
+    Registry()
+        Holds every metric of a process and renders them in the Prometheus text format.
+
+        registry = Registry()
+        requests = registry.counter("p2p_requests_total", "Requests handled.", "command")
+        requests.labels("ping").inc()
+'''
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+        self.startTime = time.time()
+
+    '''
+        register(name, helpText, metricType, labelName, factory)
+            Adds a metric and returns it, or for a metric without a label its only child, ready to update.
+    '''
+    def register(self, name, helpText, metricType, labelName, factory):
+        metric = self.metrics[name] = Metric(name, helpText, metricType, labelName, factory)
+        return metric if labelName else metric.children[None]
+
+    def counter(self, name, helpText, labelName = None):
+        return self.register(name, helpText, "counter", labelName, Counter)
+
+    def gauge(self, name, helpText, labelName = None):
+        return self.register(name, helpText, "gauge", labelName, Gauge)
+
+    def gaugeFunction(self, name, helpText, function):
+        return self.register(name, helpText, "gauge", None, lambda: GaugeFunction(function))
+
+    def counterFunction(self, name, helpText, function):
+        return self.register(name, helpText, "counter", None, lambda: GaugeFunction(function))
+
+    def histogram(self, name, helpText, labelName = None, buckets = LATENCY_BUCKETS):
+        return self.register(name, helpText, "histogram", labelName, lambda: Histogram(buckets))
+
+    '''
+        histogramFunction(name, helpText, labelName, function)
+            Adds a histogram whose {labelValue: Histogram} children are returned by a function when rendered.
+    '''
+    def histogramFunction(self, name, helpText, labelName, function):
+        metric = self.metrics[name] = Metric(name, helpText, "histogram", labelName, None, function)
+        return metric
+
+    '''
+        render()
+            Returns every metric in the Prometheus text exposition format.
+    '''
+    def render(self):
+        lines = []
+        for metric in self.metrics.values():
+            lines.append("# HELP " + metric.name + " " + metric.helpText)
+            lines.append("# TYPE " + metric.name + " " + metric.metricType)
+            for labelValue, child in sorted(metric.collect().items(), key = lambda item: str(item[0])):
+                labels = [] if labelValue is None else [metric.labelName + '="' + str(labelValue) + '"']
+                if metric.metricType != "histogram":
+                    lines.append(metric.name + formatLabels(labels) + " " + formatValue(child.get()))
+                    continue
+
+                cumulative = 0
+                for bound, bucketCount in zip(child.buckets + (float("inf"),), list(child.counts)):
+                    cumulative = cumulative + bucketCount
+                    lines.append(metric.name + "_bucket" + formatLabels(labels + ['le="' + formatValue(bound) + '"']) + " " + str(cumulative))
+                lines.append(metric.name + "_sum" + formatLabels(labels) + " " + formatValue(child.sum))
+                lines.append(metric.name + "_count" + formatLabels(labels) + " " + str(child.count))
+        return "\n".join(lines) + "\n"
+
+def formatLabels(labels):
+    return "{" + ",".join(labels) + "}" if labels else ""
+
+def formatValue(value):
+    if value == float("inf"): return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+# ======================================================================================================================== #
+# Metrics Endpoint
+# ======================================================================================================================== #
+
+'''
+    serveMetrics(registry, address)
+        Serves the registry over HTTP at /metrics in a background thread so Prometheus can scrape it.
+        Returns the HTTP server, call shutdown() on it to stop serving.
+'''
+def serveMetrics(registry, address):
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = registry.render().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass # Scrapes are frequent, keep them out of the server log.
+
+    httpServer = ThreadingHTTPServer(address, MetricsHandler)
+    httpServer.daemon_threads = True
+    threading.Thread(target = httpServer.serve_forever, daemon = True).start()
+    return httpServer
@@ -0,0 +1,170 @@
+'''
+    @author  Skully (https://github.com/ImSkully)
+    @website https://skully.tech
+    @email   contact@skully.tech
+    @updated 13/12/21
+
+    A simple peer-to-peer file sharing torrenting network with encrypted payload transportation
+    and support for multiple clients over sockets with multi-threading.
+'''
+
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+
+# ======================================================================================================================== #
+# Upload Scheduler
+# ======================================================================================================================== #
+
+UPLOAD_SLICE = 4194304 # Most bytes of a file sent between two checks with the scheduler, fewer with tight rate limits.
+MIN_UPLOAD_SLICE = 65536
+UPLOAD_BURST = 1048576 # Bytes an idle token bucket lets through at once before the rate applies.
+CHOKE_INTERVAL = 1 # Seconds an uploading peer keeps its slot while other peers wait for one.
+CHOKE_POLL = 0.02 # Seconds a choked peer waits before asking for a slot again.
+
+'''
+    TokenBucket(rate, burst)
+        Allows rate bytes per second on average and bursts of up to burst bytes. Sending more than the bucket
+        holds puts it in debt, which later senders wait out. Not locked, the UploadScheduler guards its buckets.
+'''
+class TokenBucket:
+    def __init__(self, rate, burst = UPLOAD_BURST):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    '''
+        reserve(count, now)
+            Takes count bytes from the bucket, returns the seconds to wait before sending them.
+    '''
+    def reserve(self, count, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate) - count
+        self.updated = now
+        return -self.tokens / self.rate if self.tokens < 0 else 0.0
+
+'''
+    UploadScheduler(rate, peerRate, slots, chokeInterval)
+        Paces bulk uploads such as file transfers and pieces, shared by every connection of a server. Control
+        replies never pass through it, so they are not queued behind bulk data.
+
+        rate     - Bytes per second every upload may use together, 0 for no limit.
+        peerRate - Bytes per second each peer may be sent, 0 for no limit.
+        slots    - Peers that may be uploaded to at once, 0 for no limit. Once every slot is taken, further peers
+                   are choked until one is free, and every chokeInterval the peer that has held its slot longest is
+                   choked in favour of the peer that has waited longest, so every downloader gets its turn.
+
+        Peers are any hashable object standing for one downloader, such as its connection. Transfers are sent in
+        slices of up to sliceSize bytes, each once wait(peer, count) returns, and release(peer) frees the slot
+        when the transfer ends.
+'''
+class UploadScheduler:
+    def __init__(self, rate = 0, peerRate = 0, slots = 0, chokeInterval = CHOKE_INTERVAL):
+        self.lock = threading.Lock()
+        self.rate = rate
+        self.peerRate = peerRate
+        self.slots = slots
+        self.chokeInterval = chokeInterval
+        self.enabled = bool(rate or peerRate or slots)
+        self.sliceSize = max(MIN_UPLOAD_SLICE, min([UPLOAD_SLICE] + [limit // 10 for limit in (rate, peerRate) if limit])) # Ten slices a second at the tightest limit.
+        self.bucket = TokenBucket(rate, max(UPLOAD_BURST, rate // 10)) if rate else None
+        self.peerBuckets = {} # Peer -> TokenBucket of its own rate limit.
+        self.unchoked = OrderedDict() # Peer -> monotonic time it was given its slot, earliest first.
+        self.waiting = OrderedDict() # Peer -> monotonic time it started waiting, earliest first.
+        self.lastActive = {} # Peer -> monotonic time it last asked to send, or will once its delay has passed.
+        self.bytesScheduled = 0
+        self.chokes = 0 # Peers choked to hand their slot to a waiting peer.
+
+    '''
+        reserve(peer, count)
+            Returns the seconds to wait before sending count bytes to the peer, or None if the peer is choked and
+            must ask again later.
+    '''
+    def reserve(self, peer, count):
+        with self.lock:
+            now = time.monotonic()
+            self.lastActive[peer] = now
+            if self.slots:
+                if peer not in self.unchoked and peer not in self.waiting: self.waiting[peer] = now
+                self.rechoke(now)
+                if peer not in self.unchoked: return None
+
+            delay = self.bucket.reserve(count, now) if self.bucket else 0.0
+            if self.peerRate:
+                peerBucket = self.peerBuckets.get(peer)
+                if peerBucket is None: peerBucket = self.peerBuckets[peer] = TokenBucket(self.peerRate, max(self.sliceSize, self.peerRate // 10))
+                delay = max(delay, peerBucket.reserve(count, now))
+            self.lastActive[peer] = now + delay # A peer sleeping off its rate limit has not stopped sending.
+            self.bytesScheduled = self.bytesScheduled + count
+            return delay
+
+    '''
+        rechoke(now)
+            Hands free slots to the peers waiting longest, freeing the slots of peers that stopped sending, and
+            rotates slots held for a whole chokeInterval to waiting peers. Called with the lock held.
+    '''
+    def rechoke(self, now):
+        for peer, since in list(self.unchoked.items()):
+            if now - self.lastActive[peer] > self.chokeInterval: self.forget(peer) # Stopped sending without releasing.
+        for peer, since in list(self.waiting.items()):
+            if now - self.lastActive[peer] > self.chokeInterval: self.forget(peer)
+
+        rotations = len(self.waiting) # Peers choked below go to the back of the queue and wait for the next round.
+        while self.waiting and rotations > 0:
+            if len(self.unchoked) >= self.slots:
+                peer, since = next(iter(self.unchoked.items()))
+                if now - since < self.chokeInterval: break
+                del self.unchoked[peer]
+                self.waiting[peer] = now
+                self.chokes = self.chokes + 1
+            peer, since = self.waiting.popitem(last = False)
+            self.unchoked[peer] = now
+            rotations = rotations - 1
+
+    def forget(self, peer):
+        self.unchoked.pop(peer, None)
+        self.waiting.pop(peer, None)
+        self.lastActive.pop(peer, None)
+        self.peerBuckets.pop(peer, None)
+
+    '''
+        wait(peer, count)
+            Blocks the calling thread until count bytes may be sent to the peer.
+    '''
+    def wait(self, peer, count):
+        while True:
+            delay = self.reserve(peer, count)
+            if delay is not None: break
+            time.sleep(CHOKE_POLL)
+        if delay > 0: time.sleep(delay)
+
+    async def waitAsync(self, peer, count):
+        while True:
+            delay = self.reserve(peer, count)
+            if delay is not None: break
+            await asyncio.sleep(CHOKE_POLL)
+        if delay > 0: await asyncio.sleep(delay)
+
+    '''
+        release(peer)
+            Ends the peer's transfer, handing its slot to the next waiting peer.
+    '''
+    def release(self, peer):
+        if not self.enabled: return
+        with self.lock:
+            self.forget(peer)
+
+    '''
+        getStats()
+            Returns a dictionary of the scheduler's state and counters.
+    '''
+    def getStats(self):
+        with self.lock:
+            if self.slots: self.rechoke(time.monotonic()) # Count peers that stopped sending as gone.
+            return {
+                "unchoked": len(self.unchoked),
+                "waiting": len(self.waiting),
+                "chokes": self.chokes,
+                "bytes": self.bytesScheduled,
+            }
@@ -0,0 +1,115 @@
+'''
+    @author  Skully (https://github.com/ImSkully)
+    @website https://skully.tech
+    @email   contact@skully.tech
+    @updated 13/12/21
+
+    A simple peer-to-peer file sharing torrenting network with encrypted payload transportation
+    and support for multiple clients over sockets with multi-threading.
+'''
+
+import os
+import re
+
+# ======================================================================================================================== #
+# Segment Store
+# ======================================================================================================================== #
+
+'''
+[raw]
+    > [fileName]
+        > fileName_1.mp3, fileName_2.mp3, .. (segment number X is the bytes at offset (X - 1) * pieceSize)
+        > manifest.json
+'''
+
+COPY_CHUNK_SIZE = 1048576 # Bytes copied per call when the kernel copy path is not available.
+
+'''
+    getSegmentName(fileName, index)
+        Returns the name of the segment file holding the piece at the given zero-based index.
+'''
+def getSegmentName(fileName, index):
+    stem, extension = os.path.splitext(fileName)
+    return stem + "_" + str(index + 1) + extension
+
+'''
+    listSegments(segmentDirectory, fileName)
+        Returns the segment file names of a file in numeric order, so fileName_10 comes after fileName_2.
+'''
+def listSegments(segmentDirectory, fileName):
+    stem, extension = os.path.splitext(fileName)
+    pattern = re.compile(re.escape(stem) + r"_(\d+)" + re.escape(extension) + "$")
+
+    segments = []
+    for segmentName in os.listdir(segmentDirectory):
+        match = pattern.match(segmentName)
+        if match: segments.append((int(match.group(1)), segmentName))
+    return [segmentName for number, segmentName in sorted(segments)]
+
+'''
+    copyRange(sourceDescriptor, destinationDescriptor, count, sourceOffset, destinationOffset)
+        Copies bytes between two open files at explicit offsets. Uses copy_file_range so the data never leaves
+        the kernel where it is supported, falling back to pread/pwrite otherwise.
+'''
+def copyRange(sourceDescriptor, destinationDescriptor, count, sourceOffset, destinationOffset):
+    while count > 0:
+        try:
+            copied = os.copy_file_range(sourceDescriptor, destinationDescriptor, count, sourceOffset, destinationOffset)
+        except (AttributeError, OSError):
+            copied = os.pwrite(destinationDescriptor, os.pread(sourceDescriptor, min(count, COPY_CHUNK_SIZE), sourceOffset), destinationOffset)
+        if copied == 0:
+            raise EOFError("Source file ended with " + str(count) + " bytes left to copy.")
+        count = count - copied
+        sourceOffset = sourceOffset + copied
+        destinationOffset = destinationOffset + copied
+
+'''
+    splitFile(filePath, outputDirectory, pieceSize)
+        Writes every piece of the file to its own segment in the output directory, returns the segment count.
+'''
+def splitFile(filePath, outputDirectory, pieceSize):
+    fileName = os.path.basename(filePath)
+    fileSize = os.path.getsize(filePath)
+    segmentCount = (fileSize + pieceSize - 1) // pieceSize
+
+    for segmentName in listSegments(outputDirectory, fileName): # Drop segments left over from an earlier split.
+        os.remove(os.path.join(outputDirectory, segmentName))
+
+    sourceDescriptor = os.open(filePath, os.O_RDONLY)
+    try:
+        for index in range(segmentCount):
+            segmentSize = min(pieceSize, fileSize - index * pieceSize)
+            segmentDescriptor = os.open(os.path.join(outputDirectory, getSegmentName(fileName, index)), os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+            try:
+                copyRange(sourceDescriptor, segmentDescriptor, segmentSize, index * pieceSize, 0)
+            finally:
+                os.close(segmentDescriptor)
+    finally:
+        os.close(sourceDescriptor)
+    return segmentCount
+
+'''
+    buildFile(segmentDirectory, fileName, outputPath)
+        Joins a file's segments into the output path using a single preallocated output file, returns its size.
+'''
+def buildFile(segmentDirectory, fileName, outputPath):
+    segmentPaths = [os.path.join(segmentDirectory, segmentName) for segmentName in listSegments(segmentDirectory, fileName)]
+    segmentSizes = [os.path.getsize(segmentPath) for segmentPath in segmentPaths]
+    fileSize = sum(segmentSizes)
+
+    outputDescriptor = os.open(outputPath, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+    try:
+        if fileSize > 0 and hasattr(os, "posix_fallocate"):
+            os.posix_fallocate(outputDescriptor, 0, fileSize) # Reserve the space up front to avoid fragmentation.
+
+        offset = 0
+        for segmentPath, segmentSize in zip(segmentPaths, segmentSizes):
+            segmentDescriptor = os.open(segmentPath, os.O_RDONLY)
+            try:
+                copyRange(segmentDescriptor, outputDescriptor, segmentSize, 0, offset)
+            finally:
+                os.close(segmentDescriptor)
+            offset = offset + segmentSize
+    finally:
+        os.close(outputDescriptor)
+    return fileSize
@@ -1,236 +1,1166 @@
-'''
-    @author  Skully (https://github.com/ImSkully)
-    @website https://skully.tech
-    @email   contact@skully.tech
-    @updated 13/12/21
-    
-    A simple peer-to-peer file sharing torrenting network with encrypted payload transportation
-    and support for multiple clients over sockets with multi-threading.
-'''
-
-import socket
-import sys
-import os
-import time
-import threading
-import shared
-import hashlib
-from _thread import *
-
-# ======================================================================================================================== #
-# Global Variable Definitions
-# ======================================================================================================================== #
-
-'''
-    COMMANDS = {
-        ["commandName"] = handlingFunction,
-    }
-'''
-COMMANDS = {} # Create command dictionary.
-
-'''
-    CLIENT_FILES = {
-        [(clientAddress)] = (
-            "file_1.mp3",
-            "file_2.mp3",
-        ),
-    }
-'''
-CLIENT_FILES = {} # Create dictionary to maintain what client has which files.
-CONNECTIONS = [] # List of all clients currently connected.
-SERVER_DIR = "tracked-files" # Name of the directory containing all server files.
-
-# ======================================================================================================================== #
-# Server Functions
-# ======================================================================================================================== #
-
-'''
-    sendClientMessage(clientAddress, clientSocket, message)
-        Sends the given message to the specified client socket.
-'''
-def sendClientMessage(clientAddress, clientSocket, message = False):
-    if not message:
-        message = "Something went wrong, please try again."
-
-    clientSocket.sendto(message.encode(), clientAddress)
-
-# ======================================================================================================================== #
-# Data Input Parsing
-# ======================================================================================================================== #
-
-def parseInput(clientAddress = False, clientSocket = False, inputCommand = False):
-    if not clientAddress or not clientSocket: return
-    if not inputCommand:
-        sendClientMessage(clientAddress, clientSocket, "Invalid command specified.")
-        return
-
-    print("[CLIENT] [{}:{}]".format(*clientAddress) + ": Input received: " + inputCommand)
-
-    # If the input is a command.
-    if (inputCommand[0] == shared.COMMAND_PREFIX):
-        inputCommand = inputCommand[1::] # Remove the command prefix.
-        commandParameters = inputCommand.split(' ') # Split the string using space as the delimiter.
-        theCommand = commandParameters[0] # The command name.
-        commandParameters.pop(0) # Remove the command itself from the list.
-
-        # Parameter debug outputs.
-        if shared.DEBUG:
-            i = 1
-            print("[DEBUG] Command: " + theCommand)
-            for parameter in commandParameters:
-                print("[DEBUG] Parameter #" + str(i) + ": " + parameter)
-                i = i + 1
-
-        if (theCommand in COMMANDS): # If the command exists.
-            handlingFunction = COMMANDS[theCommand] # Fetch the handling function to invoke.
-            handlingFunction(clientAddress, clientSocket, *commandParameters) # Invoke the respective function and pass all parameters.
-        else:
-            sendClientMessage(clientAddress, clientSocket, "Invalid command specified.")
-    else:
-        sendClientMessage(clientAddress, clientSocket, "Invalid command specified.")
-
-# ======================================================================================================================== #
-# Commands & Command Handlers
-# ======================================================================================================================== #
-
-def pingCommand(clientAddress, clientSocket):
-    currentTime = time.time() # Get current epoch time.
-    sendClientMessage(clientAddress, clientSocket, "[ping]" + str(currentTime)) # Send response to client with server's epoch.
-COMMANDS["ping"] = pingCommand
-
-def addFileCommand(clientAddress, clientSocket, fileName = False):
-    if not fileName:
-        sendClientMessage(clientAddress, clientSocket, "SYNTAX: /addfile [File Name]")
-        return
-
-    if (fileName not in CLIENT_FILES[clientAddress]):
-        CLIENT_FILES[clientAddress].append(fileName)
-        print("[SERVER] Added new file record for client {}:{}".format(*clientAddress) + ", file: " + fileName)
-        sendClientMessage(clientAddress, clientSocket, "You have added the file '" + fileName + "' to the server tracker.")
-    else:
-        print("[SERVER] Client {}:{}".format(*clientAddress) + " attempted to add file '" + fileName + "' though already recorded they have this file, ignoring request.")
-        sendClientMessage(clientAddress, clientSocket, "ERROR: You have already added the file '" + fileName + "' to the server tracker.")
-COMMANDS["addfile"] = addFileCommand
-
-def findFileCommand(clientAddress, clientSocket, fileName = False):
-    if not fileName:
-        sendClientMessage(clientAddress, clientSocket, "SYNTAX: /findfile [File Name]")
-        return
-
-    foundClients = [] # Array to hold all our clients that have the file.
-    for theClient in CLIENT_FILES: # Loop through every client.
-        for clientFiles in CLIENT_FILES[theClient]: # Loop through this specific client's files.
-            if clientFiles == fileName: # If this file matches the file name we want.
-                foundClients.append(theClient) # Add this client to the array since they have the file.
-
-    if (foundClients): # If we found the file.
-        clientsString = ""
-        for client in foundClients:
-            clientsString = clientsString + "[{}:{}".format(*client) + "] "
-            print("[SERVER] File has been found on client: {}:{}".format(*client))
-        sendClientMessage(clientAddress, clientSocket, "The following clients have that file: " + clientsString)
-    else: # File was not found.
-        print("[SERVER] The file '" + fileName + "' does not exist on server.")
-        sendClientMessage(clientAddress, clientSocket, "The file '" + fileName + "' does not exist on the server.")
-COMMANDS["findfile"] = findFileCommand
-
-def fetchFileCommand(clientAddress, clientSocket, fileName = False):
-    if not fileName:
-        sendClientMessage(clientAddress, clientSocket, "SYNTAX: /fetchfile [File Name]")
-        return
-
-    # Check to see if the server has the file available.
-    if not os.path.exists(SERVER_DIR + "/" + fileName):
-        sendClientMessage(clientAddress, clientSocket, "ERROR: No file with the name '" + fileName + "' available on the server.")
-        return
-
-    print("[SERVER] [{}:{}]".format(*clientAddress) + ": Request to download file '" + fileName + "', starting..")
-    
-    #theFile = open(SERVER_DIR + "/" + fileName, 'rb') # Open file in binary.
-    #fileData = theFile.read() # Read the contents of the file.
-
-    with open(SERVER_DIR + "/" + fileName, mode = 'rb') as file: # b is important -> binary
-        fileData = file.read()
-    #theFile.close() # Close file input stream.
-
-    sendClientMessage(clientAddress, clientSocket, "[fetchfile]" + fileName + ";SEPARATOR;" + str(fileData)) # Send data to client.
-    print("[SERVER] [{}:{}]".format(*clientAddress) + ": Finished sending file!")
-COMMANDS["fetchfile"] = fetchFileCommand
-
-def showHelpCommand(clientAddress, clientSocket):
-    sendClientMessage(clientAddress, clientSocket, "Available Commands:" + COMMAND_LIST)
-COMMANDS["help"] = showHelpCommand
-
-# Generate the command list.
-COMMAND_LIST = ""
-for commandName in COMMANDS: COMMAND_LIST = COMMAND_LIST + " /" + commandName + ","
-COMMAND_LIST = COMMAND_LIST[:-1]
-
-# ======================================================================================================================== #
-# Socket Data Input/Output
-# ======================================================================================================================== #
-
-'''
-    closeSockets()
-        Closes all active socket connections that are still open.
-'''
-def closeSockets():
-    for client in CONNECTIONS:
-        print("[SERVER] Dropping connection for client {}:{}".format(*client[1]))
-        client[0].close()
-
-'''
-    handleClient(clientSocket, clientAddress) : Threaded
-        Function that is called whenever a new client connects and is run in a separate thread, handles client input.
-'''
-def handleClient(clientSocket = False, clientAddress = False):
-    if not clientSocket or not clientAddress:
-        print("[ERROR] @handleClient: clientSocket or clientAddress not received.")
-        return
-
-    if (clientAddress not in CLIENT_FILES):
-            print("[SERVER] First time this client is connecting, initializing a file dictionary for them.")
-            CLIENT_FILES[clientAddress] = list() # Initialize a new dictionary of client file definitions for this client.
-
-    while True:
-        data = clientSocket.recv(10000)
-       
-        if data:
-            payload = data.decode().split(";HASH;") # Client payload.
-            payloadHashed = hashlib.sha224(payload[1].encode()).hexdigest() # Serverside hash.
-
-            if not (payload[0] == payloadHashed): # Check clients hash with the server's hash.
-                print("[SERVER] Hash mismatch from client {}:{}!".format(*clientAddress))
-                print("[SERVER] Ignoring request: '" + payload[1] + "'")
-            else:
-                if shared.DEBUG:
-                    print("[DEBUG] [HASH] {}:{}".format(*clientAddress) + " sent verified payload.")
-
-            if payload[1] == "exit": break # If client is quitting.
-            parseInput(clientAddress, clientSocket, payload[1])
-    # Actions to conduct when client disconnects.
-    print("[SERVER] Closing connection for client {}:{}".format(*clientAddress))
-    clientSocket.close() # Close this client's connection.
-    CONNECTIONS.remove((clientSocket, clientAddress)) # Remove client from array.
-    del(CLIENT_FILES[clientAddress]) # Clear the client's recorded files.
-
-# Create a TCP/IP socket.
-print('[SERVER] Opening server socket on {}:{}..'.format(*shared.SERVER_ADDRESS))
-SOCKET = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-SOCKET.bind(shared.SERVER_ADDRESS) # Bind the socket to the port.
-SOCKET.listen(5) # Listen for incoming connections.
-
-while True:
-    try:
-        if not os.path.exists(SERVER_DIR): # If a directory for the server files doesn't exist.
-            os.makedirs(SERVER_DIR) # Create the directory.
-
-        clientSocket, clientAddress = SOCKET.accept() # Wait and accept connections.
-        print('[SERVER] Incoming client connection from {}:{}..'.format(*clientAddress))
-        CONNECTIONS.append((clientSocket, clientAddress)) # Add this client to the connection list.
-        threading._start_new_thread(handleClient, (clientSocket, clientAddress)) # Start new thread for this client.
-    except KeyboardInterrupt as e:
-        print("Shutting down the server..")
-        break
-closeSockets()
-SOCKET.close()
+'''
+    @author  Skully (https://github.com/ImSkully)
+    @website https://skully.tech
+    @email   contact@skully.tech
+    @updated 13/12/21
+    
+    A simple peer-to-peer file sharing torrenting network with encrypted payload transportation
+    and support for multiple clients over sockets with multi-threading.
+'''
+
+import socket
+import sys
+import os
+import time
+import threading
+import asyncio
+import argparse
+import multiprocessing
+import signal
+import inspect
+import shared
+import hashlib
+import compression
+import logging
+import metrics
+from tracker import TrackerIndex, PersistentTrackerIndex, TrackerService, ReplicatedTrackerIndex
+from cache import ChunkCache, DEFAULT_CACHE_SIZE
+from scheduler import UploadScheduler
+from swarm import isSafeFileName
+from contextlib import contextmanager
+
+# ======================================================================================================================== #
+# Global Variable Definitions
+# ======================================================================================================================== #
+
+'''
+    COMMANDS = {
+        ["commandName"] = handlingFunction,
+    }
+'''
+COMMANDS = {} # Create command dictionary.
+
+'''
+    CLIENT_FILES = TrackerIndex(
+        [(clientAddress)] = {
+            "file_1.mp3",
+            "file_2.mp3",
+        },
+        ["file_1.mp3"] = {(clientAddress), ..},
+    )
+'''
+CLIENT_FILES = TrackerIndex() # Inverted index maintaining what client has which files.
+CONNECTIONS = [] # List of all clients currently connected.
+SERVER_DIR = "tracked-files" # Name of the directory containing all server files.
+SERVER_BACKLOG = 4096 # Maximum number of pending connections queued on the server socket.
+SEARCH_LIMIT = 50 # Maximum number of file names returned by a single /search.
+CONNECTIONS_LOCK = threading.Lock() # Guards CONNECTIONS against concurrent client threads.
+PEER_LEASE_TTL = 0 # Seconds a disconnected client's files stay tracked in case it reconnects, 0 drops them at once.
+DEFAULT_LEASE_TTL = 120 # Lease used when the tracker state is persisted and no --lease-ttl is given.
+MAINTENANCE_INTERVAL = 1 # Seconds between expiring leases and checking whether a snapshot is due.
+DEFAULT_IDLE_TIMEOUT = 120 # Seconds a client may stay silent between commands unless --idle-timeout is given.
+DEFAULT_READ_TIMEOUT = 30 # Seconds a client may take to finish sending a frame unless --read-timeout is given.
+IDLE_TIMEOUT = DEFAULT_IDLE_TIMEOUT
+READ_TIMEOUT = DEFAULT_READ_TIMEOUT
+REAP_INTERVAL = 1 # Seconds between checks for connections that have timed out.
+BUSY_TIMEOUT = 600 # Seconds a command may go without sending anything before its connection is taken as stuck, 0 for no limit.
+REAP_GRACE = 10 # Seconds a dropped connection has to close itself before reapConnections() reclaims it.
+FILE_CACHE = ChunkCache(DEFAULT_CACHE_SIZE) # Recently sent file chunks, shared by every client.
+METRICS_PORT = 9100 # Default local port of the Prometheus endpoint enabled with --metrics-port.
+DEFAULT_UPLOAD_SLOTS = 4 # Clients a file is streamed to at once unless --upload-slots is given, the rest take turns.
+UPLOAD_SCHEDULER = UploadScheduler(slots = DEFAULT_UPLOAD_SLOTS) # Paces file transfers, see --upload-rate.
+REUSE_PORT = False # Lets several worker processes listen on the server address at once, see --workers.
+WORKER_NUMBER = 0 # Number of this worker process from 1 up, 0 when the server runs as a single process.
+WORKER_COUNT = 1
+TRACKER_SERVICE = None # Serves the tracker to the worker processes when running with --workers.
+LOG = logging.getLogger("server")
+
+# ======================================================================================================================== #
+# Server Metrics
+# ======================================================================================================================== #
+
+METRICS_ENABLED = True # Toggles metric collection on the request path, see --no-metrics.
+METRICS = metrics.Registry()
+CLOSED_COMMAND_LATENCY = {} # Command latencies of connections that have closed, guarded by CONNECTIONS_LOCK.
+METRICS.histogramFunction("p2p_command_seconds", "Time spent handling each command, by command.", "command", lambda: getCommandLatencies())
+CLOSED_TRAFFIC = METRICS.counter("p2p_closed_connection_bytes_total", "Bytes received and sent by connections that have closed, by direction.", "direction")
+METRICS.counterFunction("p2p_received_bytes_total", "Bytes received from clients, including frame headers.", lambda: getTrafficTotals()[0])
+METRICS.counterFunction("p2p_sent_bytes_total", "Bytes sent to clients, including streamed files.", lambda: getTrafficTotals()[1])
+CONNECTIONS_ACCEPTED = METRICS.counter("p2p_connections_total", "Client connections accepted.")
+CONNECTIONS_REAPED = METRICS.counter("p2p_connections_reaped_total", "Client connections closed for going silent, by timeout.", "timeout")
+FILES_SENT = METRICS.counter("p2p_files_sent_total", "Files streamed to clients by /fetchfile.")
+RANGES_SENT = METRICS.counter("p2p_ranges_sent_total", "File ranges streamed to clients by /fetchrange.")
+TRANSFER_RATE = METRICS.histogram("p2p_transfer_bytes_per_second", "Throughput of every /fetchfile and /fetchrange transfer.", buckets = tuple(1048576 * 2 ** power for power in range(-4, 14)))
+METRICS.gaugeFunction("p2p_active_connections", "Clients currently connected.", lambda: len(CONNECTIONS))
+METRICS.gaugeFunction("p2p_tracker_records", "(client, file) records in the tracker index.", lambda: len(CLIENT_FILES))
+METRICS.gaugeFunction("p2p_tracker_files", "Distinct file names in the tracker index.", lambda: len(CLIENT_FILES.fileLookup))
+METRICS.gaugeFunction("p2p_tracker_peers", "Clients known to the tracker index, including leased ones.", lambda: len(CLIENT_FILES.peerFiles))
+METRICS.counterFunction("p2p_cache_hits_total", "Compressed-chunk cache lookups that found the chunk.", lambda: FILE_CACHE.hits)
+METRICS.counterFunction("p2p_cache_misses_total", "Compressed-chunk cache lookups that missed.", lambda: FILE_CACHE.misses)
+METRICS.counterFunction("p2p_cache_evictions_total", "Chunks evicted from the compressed-chunk cache to make room.", lambda: FILE_CACHE.evictions)
+METRICS.gaugeFunction("p2p_cache_bytes", "Bytes of chunks held in the compressed-chunk cache.", lambda: FILE_CACHE.size)
+METRICS.gaugeFunction("p2p_upload_unchoked", "Clients a file is being streamed to.", lambda: len(UPLOAD_SCHEDULER.unchoked))
+METRICS.gaugeFunction("p2p_upload_waiting", "Clients choked while waiting for an upload slot.", lambda: len(UPLOAD_SCHEDULER.waiting))
+METRICS.counterFunction("p2p_upload_chokes_total", "Transfers paused to hand their upload slot to a waiting client.", lambda: UPLOAD_SCHEDULER.chokes)
+
+# ======================================================================================================================== #
+# Server Functions
+# ======================================================================================================================== #
+
+'''
+    sendClientMessage(clientAddress, clientSocket, message)
+        Sends the given message to the specified client socket.
+'''
+def sendClientMessage(clientAddress, clientSocket, message = False):
+    if not message:
+        message = "Something went wrong, please try again."
+
+    shared.sendFrame(clientSocket, shared.MSG_RESPONSE, message.encode(), shared.FLAG_NONE, clientSocket.requestId)
+
+'''
+    sendClientFile(clientAddress, clientSocket, fileName, filePath, acceptedCodecs)
+        Streams a file from disk to the specified client socket without loading it into memory. If the client
+        accepts a wire codec and the start of the file compresses well, the file is sent as compressed chunks.
+        Returns the size of the file sent.
+'''
+def sendClientFile(clientAddress, clientSocket, fileName, filePath, acceptedCodecs = ()):
+    with open(filePath, mode = 'rb') as file:
+        fileStat = os.fstat(file.fileno())
+        fileSize = fileStat.st_size
+        cacheKey = (filePath, fileStat.st_mtime_ns, fileSize) if FILE_CACHE.isCacheable(fileSize) else None
+
+        codec = compression.negotiateCodec(acceptedCodecs)
+        if codec and not isFileCompressible(file, codec, cacheKey):
+            codec = None # Already compressed content such as mp3 files is sent as-is.
+        file.seek(0)
+
+        if not codec: # Raw bytes go out with zero-copy sendfile, straight from the operating system's page cache.
+            shared.sendFrame(clientSocket, shared.MSG_FILE, fileName.encode() + b"\0" + str(fileSize).encode(), shared.FLAG_NONE, clientSocket.requestId)
+            with bulkTransfer(clientSocket):
+                shared.sendFileStream(clientSocket, file, fileSize)
+        else:
+            shared.sendFrame(clientSocket, shared.MSG_FILE, fileName.encode() + b"\0" + str(fileSize).encode() + b"\0" + codec.encode(), shared.FLAG_NONE, clientSocket.requestId)
+            with bulkTransfer(clientSocket):
+                if cacheKey:
+                    clientSocket.sendChunks(file, lambda file: iterCachedChunks(file, fileSize, codec, cacheKey))
+                else:
+                    clientSocket.sendChunks(file, lambda file: compression.iterCompressedChunks(file, fileSize, codec))
+    return fileSize
+
+'''
+    sendClientRange(clientAddress, clientSocket, fileName, filePath, offset, length, acceptedCodecs)
+        Streams length bytes of a file from the given offset, as MSG_RANGE followed by the bytes, the same way
+        sendClientFile streams a whole file. The header carries the file's size and modification time so the
+        client can tell whether the ranges it already holds belong to the same version of the file. The range is
+        cut short at the end of the file. Returns the number of bytes sent.
+'''
+def sendClientRange(clientAddress, clientSocket, fileName, filePath, offset, length, acceptedCodecs = ()):
+    with open(filePath, mode = 'rb') as file:
+        fileStat = os.fstat(file.fileno())
+        fileSize = fileStat.st_size
+        offset = min(offset, fileSize)
+        length = min(length, fileSize - offset)
+        cacheKey = (filePath, fileStat.st_mtime_ns, fileSize) if FILE_CACHE.isCacheable(fileSize) else None
+
+        codec = compression.negotiateCodec(acceptedCodecs) if length else None
+        if codec and not isFileCompressible(file, codec, cacheKey):
+            codec = None
+        file.seek(offset)
+
+        rangeHeader = shared.RANGE_HEADER.pack(fileSize, fileStat.st_mtime_ns, offset, length) + fileName.encode()
+        if not codec:
+            shared.sendFrame(clientSocket, shared.MSG_RANGE, rangeHeader, shared.FLAG_NONE, clientSocket.requestId)
+            if length:
+                with bulkTransfer(clientSocket):
+                    shared.sendFileStream(clientSocket, file, length)
+        else:
+            shared.sendFrame(clientSocket, shared.MSG_RANGE, rangeHeader + b"\0" + codec.encode(), shared.FLAG_NONE, clientSocket.requestId)
+            end = offset + length
+            with bulkTransfer(clientSocket):
+                if cacheKey and offset % shared.STREAM_CHUNK_SIZE == 0 and (end % shared.STREAM_CHUNK_SIZE == 0 or end == fileSize):
+                    clientSocket.sendChunks(file, lambda file: iterCachedChunks(file, fileSize, codec, cacheKey, offset, end)) # Aligned ranges share the cached chunks.
+                else:
+                    clientSocket.sendChunks(file, lambda file: compression.iterCompressedChunks(file, length, codec))
+    return length
+
+'''
+    bulkTransfer(clientSocket)
+        Context in which everything sent to the client is bulk file data, paced by UPLOAD_SCHEDULER. Replies sent
+        outside of it, to this client or any other, skip the scheduler.
+'''
+@contextmanager
+def bulkTransfer(clientSocket):
+    if not UPLOAD_SCHEDULER.enabled:
+        yield
+        return
+    clientSocket.bulk = True
+    try:
+        yield
+    finally:
+        clientSocket.endBulk()
+
+'''
+    isFileCompressible(file, codec, cacheKey)
+        Samples the start of the file to decide whether it is worth compressing with the codec. The decision is
+        cached alongside the file's chunks (at offset -1) so popular files are only sampled once.
+'''
+def isFileCompressible(file, codec, cacheKey):
+    if cacheKey:
+        entry = FILE_CACHE.get(cacheKey + (-1, codec))
+        if entry is not None: return entry[0] == shared.FLAG_COMPRESSED
+
+    compressible = compression.isCompressible(file.read(compression.SAMPLE_SIZE), codec)
+    if cacheKey: FILE_CACHE.put(cacheKey + (-1, codec), shared.FLAG_COMPRESSED if compressible else shared.FLAG_NONE, b"")
+    return compressible
+
+'''
+    iterCachedChunks(file, fileSize, codec, cacheKey, start, end)
+        Equivalent of compression.iterCompressedChunks that keeps every encoded chunk in the file cache, so
+        popular files are neither read nor compressed again for each client that fetches them. Yields the chunks
+        from start, which must be a multiple of shared.STREAM_CHUNK_SIZE, up to end, or the whole file.
+'''
+def iterCachedChunks(file, fileSize, codec, cacheKey, start = 0, end = None):
+    for offset in range(start, fileSize if end is None else end, shared.STREAM_CHUNK_SIZE):
+        entry = FILE_CACHE.get(cacheKey + (offset, codec))
+        if entry is None:
+            chunkSize = min(shared.STREAM_CHUNK_SIZE, fileSize - offset)
+            chunk = os.pread(file.fileno(), chunkSize, offset)
+            if len(chunk) < chunkSize:
+                raise ConnectionError("File ended with " + str(fileSize - offset - len(chunk)) + " bytes left to stream.")
+            entry = compression.encodeChunk(chunk, codec)
+            FILE_CACHE.put(cacheKey + (offset, codec), *entry)
+        yield entry
+
+'''
+    getStatsSummary()
+        Returns a readable summary of the server metrics for the /stats command.
+'''
+def getStatsSummary():
+    bytesReceived, bytesSent = getTrafficTotals()
+    lines = ["Uptime: " + str(round(time.time() - METRICS.startTime)) + "s, " + str(len(CONNECTIONS)) + " clients connected, " + str(CONNECTIONS_ACCEPTED.get()) + " connections accepted."]
+    if WORKER_NUMBER: lines.append("Worker " + str(WORKER_NUMBER) + " of " + str(WORKER_COUNT) + ", connections and traffic are this worker's only.")
+    if not METRICS_ENABLED: lines.append("Request metrics are disabled (--no-metrics).")
+
+    for commandName, latency in sorted(getCommandLatencies().items()):
+        if latency.count == 0: continue # The /stats command being handled right now.
+        lines.append("/" + commandName + ": " + str(latency.count) + " handled, p50 <= " + formatSeconds(latency.percentile(0.5)) + ", p99 <= " + formatSeconds(latency.percentile(0.99)))
+
+    lines.append("Traffic: " + str(bytesReceived) + " bytes in, " + str(bytesSent) + " bytes out.")
+    if FILES_SENT.get() or RANGES_SENT.get():
+        lines.append("Transfers: " + str(FILES_SENT.get()) + " files and " + str(RANGES_SENT.get()) + " ranges sent, median rate <= " + str(round(TRANSFER_RATE.percentile(0.5) / 1048576, 2)) + " MB/s.")
+    idleReaped, readReaped, busyReaped = (CONNECTIONS_REAPED.labels(timeout).get() for timeout in ("idle", "read", "busy"))
+    if idleReaped or readReaped or busyReaped:
+        lines.append("Timeouts: " + str(idleReaped) + " idle, " + str(readReaped) + " stalled and " + str(busyReaped) + " stuck connections closed.")
+    lines.append("Tracker: " + str(len(CLIENT_FILES)) + " records, " + str(len(CLIENT_FILES.fileLookup)) + " files, " + str(len(CLIENT_FILES.peerFiles)) + " clients.")
+
+    if UPLOAD_SCHEDULER.enabled:
+        uploadStats = UPLOAD_SCHEDULER.getStats()
+        lines.append("Uploads: " + str(uploadStats["unchoked"]) + " streaming, " + str(uploadStats["waiting"]) + " waiting for a slot, " + str(uploadStats["chokes"]) + " chokes.")
+
+    cacheStats = FILE_CACHE.getStats()
+    lines.append("Compressed-chunk cache: " + str(cacheStats["entries"]) + " chunks, " + str(cacheStats["bytes"]) + "/" + str(cacheStats["capacity"]) + " bytes, hit rate " + str(round(cacheStats["hitRate"] * 100, 1)) + "%.")
+    return "\n".join(lines)
+
+'''
+    getTrafficTotals()
+        Returns the (received, sent) bytes of every connection so far. Open connections count their own traffic
+        without locking, which keeps the cost off the request path, and hand it to CLOSED_TRAFFIC as they close.
+'''
+def getTrafficTotals():
+    with CONNECTIONS_LOCK:
+        received = CLOSED_TRAFFIC.labels("received").get() + sum(client[0].bytesReceived for client in CONNECTIONS)
+        sent = CLOSED_TRAFFIC.labels("sent").get() + sum(client[0].bytesSent for client in CONNECTIONS)
+    return received, sent
+
+'''
+    getCommandLatencies()
+        Returns {commandName: Histogram} of every command handled so far, merging the latencies each open
+        connection records on its own with those of the connections that have closed.
+'''
+def getCommandLatencies():
+    with CONNECTIONS_LOCK:
+        sources = [dict(CLOSED_COMMAND_LATENCY)] + [dict(client[0].commandLatency) for client in CONNECTIONS]
+    latencies = {}
+    for source in sources:
+        for commandName, latency in source.items():
+            latencies.setdefault(commandName, metrics.Histogram()).merge(latency)
+    return latencies
+
+def formatSeconds(seconds):
+    if seconds == float("inf"): return "inf"
+    return str(round(seconds * 1000, 3)) + "ms"
+
+# ======================================================================================================================== #
+# Data Input Parsing
+# ======================================================================================================================== #
+
+BATCH_COMMANDS = ("announce", "findfiles") # Commands that take one entry per line after the command.
+TRACKER_COMMANDS = ("addfile", "announce", "serve") # Commands that change the tracker, see callTrackerChange().
+
+'''
+    getMaxParameters(handlingFunction)
+        Returns how many parameters a command handler takes after the client address and socket, or None if it
+        takes any number of them.
+'''
+def getMaxParameters(handlingFunction):
+    code = handlingFunction.__code__
+    if code.co_flags & inspect.CO_VARARGS: return None
+    return code.co_argcount - 2
+
+def parseInput(clientAddress = False, clientSocket = False, inputCommand = False):
+    if not clientAddress or not clientSocket: return
+    if not inputCommand:
+        sendClientMessage(clientAddress, clientSocket, "Invalid command specified.")
+        return
+
+    inputCommand, *batchEntries = inputCommand.split("\n") # Batch commands carry one entry per line after the command.
+    LOG.debug("[%s:%s] Input received: %s (%d batch entries)", *clientAddress, inputCommand, len(batchEntries))
+
+    # If the input is a command, which after splitting off batch entries may be empty.
+    if inputCommand.startswith(shared.COMMAND_PREFIX):
+        inputCommand = inputCommand[1::] # Remove the command prefix.
+        commandParameters = inputCommand.split(' ') # Split the string using space as the delimiter.
+        theCommand = commandParameters[0] # The command name.
+        commandParameters.pop(0) # Remove the command itself from the list.
+
+        if (theCommand in COMMANDS): # If the command exists.
+            handlingFunction = COMMANDS[theCommand] # Fetch the handling function to invoke.
+            if theCommand not in BATCH_COMMANDS:
+                if any(batchEntries):
+                    sendClientMessage(clientAddress, clientSocket, "ERROR: /" + theCommand + " does not take entries on separate lines.")
+                    return
+                batchEntries = [] # Only trailing newlines.
+
+            maxParameters = getMaxParameters(handlingFunction)
+            if maxParameters is not None and len(commandParameters) > maxParameters:
+                sendClientMessage(clientAddress, clientSocket, "ERROR: /" + theCommand + " takes at most " + str(maxParameters) + " parameters.")
+                return
+            if not METRICS_ENABLED:
+                handlingFunction(clientAddress, clientSocket, *commandParameters, *batchEntries) # Invoke the respective function and pass all parameters.
+                return
+
+            latency = clientSocket.commandLatency.get(theCommand)
+            if latency is None: latency = clientSocket.commandLatency[theCommand] = metrics.LocalHistogram()
+
+            startTime = time.perf_counter()
+            try:
+                handlingFunction(clientAddress, clientSocket, *commandParameters, *batchEntries)
+            finally:
+                clientSocket.whenSent(lambda: latency.observe(time.perf_counter() - startTime)) # Once the reply is out.
+        else:
+            sendClientMessage(clientAddress, clientSocket, "Invalid command specified.")
+    else:
+        sendClientMessage(clientAddress, clientSocket, "Invalid command specified.")
+
+# ======================================================================================================================== #
+# Commands & Command Handlers
+# ======================================================================================================================== #
+
+def pingCommand(clientAddress, clientSocket):
+    currentTime = time.time() # Get current epoch time.
+    sendClientMessage(clientAddress, clientSocket, "[ping]" + str(currentTime)) # Send response to client with server's epoch.
+COMMANDS["ping"] = pingCommand
+
+def addFileCommand(clientAddress, clientSocket, fileName = False):
+    if not fileName:
+        sendClientMessage(clientAddress, clientSocket, "SYNTAX: /addfile [File Name]")
+        return
+
+    if (CLIENT_FILES.addFile(clientAddress, fileName)):
+        LOG.debug("Added new file record for client %s:%s, file: %s", *clientAddress, fileName)
+        sendClientMessage(clientAddress, clientSocket, "You have added the file '" + fileName + "' to the server tracker.")
+    else:
+        LOG.debug("Client %s:%s attempted to add file '%s' though already recorded they have this file, ignoring request.", *clientAddress, fileName)
+        sendClientMessage(clientAddress, clientSocket, "ERROR: You have already added the file '" + fileName + "' to the server tracker.")
+COMMANDS["addfile"] = addFileCommand
+
+'''
+    /announce [File Name] [File Name] ..
+    /announce
+    <file name>\t<file size>\t<root hash>
+    ..
+        Records every listed file for the client in one step, with an optional size and manifest root hash.
+        The batch is validated as a whole and only applied if every entry is well formed and agrees with the
+        size and root hash other clients announced for the same file.
+'''
+def announceCommand(clientAddress, clientSocket, *fileEntries):
+    files = []
+    for fileEntry in fileEntries:
+        if not fileEntry: continue
+        fields = fileEntry.split("\t")
+        if len(fields) > 3 or (len(fields) > 1 and not fields[1].isdigit()):
+            sendClientMessage(clientAddress, clientSocket, "ERROR: Malformed announce entry '" + fileEntry + "', no files were added.")
+            return
+        files.append((fields[0], int(fields[1]) if len(fields) > 1 else None, fields[2] if len(fields) > 2 else None))
+
+    if not files:
+        sendClientMessage(clientAddress, clientSocket, "SYNTAX: /announce [File Name] [File Name] ..")
+        return
+
+    try:
+        added = CLIENT_FILES.addFiles(clientAddress, files)
+    except ValueError as e: # Another client announced one of the files with a different size or root hash.
+        sendClientMessage(clientAddress, clientSocket, "ERROR: " + str(e) + " No files were added.")
+        return
+    LOG.info("Client %s:%s announced %d files, %d new.", *clientAddress, len(files), added)
+    sendClientMessage(clientAddress, clientSocket, "[announce]" + str(added) + ";" + str(len(files) - added))
+COMMANDS["announce"] = announceCommand
+
+def findFileCommand(clientAddress, clientSocket, fileName = False):
+    if not fileName:
+        sendClientMessage(clientAddress, clientSocket, "SYNTAX: /findfile [File Name]")
+        return
+
+    foundClients = CLIENT_FILES.findPeers(fileName) # All clients that have the file.
+
+    if (foundClients): # If we found the file.
+        servingAddresses = []
+        for client in foundClients:
+            servingAddresses.append("{}:{}".format(*CLIENT_FILES.getServingAddress(client)))
+            LOG.debug("File has been found on client: %s:%s", *client)
+        sendClientMessage(clientAddress, clientSocket, "[findfile]" + fileName + ";" + " ".join(servingAddresses))
+    else: # File was not found.
+        LOG.debug("The file '%s' does not exist on server.", fileName)
+        sendClientMessage(clientAddress, clientSocket, "The file '" + fileName + "' does not exist on the server.")
+COMMANDS["findfile"] = findFileCommand
+
+'''
+    /findfiles [File Name] [File Name] ..
+        Looks up every listed file at once (names may also follow the command one per line). Responds with one
+        "<file name>;<file size>;<root hash>;<host:port> <host:port>" line per file, in the order asked.
+'''
+def findFilesCommand(clientAddress, clientSocket, *fileNames):
+    fileNames = [fileName for fileName in fileNames if fileName]
+    if not fileNames:
+        sendClientMessage(clientAddress, clientSocket, "SYNTAX: /findfiles [File Name] [File Name] ..")
+        return
+
+    results = []
+    for fileName, fileSize, rootHash, servingAddresses in CLIENT_FILES.findFiles(fileNames):
+        results.append(fileName + ";" + ("" if fileSize is None else str(fileSize)) + ";" + (rootHash or "") + ";" + " ".join("{}:{}".format(*address) for address in servingAddresses))
+    sendClientMessage(clientAddress, clientSocket, "[findfiles]" + "\n".join(results))
+COMMANDS["findfiles"] = findFilesCommand
+
+def serveCommand(clientAddress, clientSocket, servingPort = False):
+    if not servingPort or not servingPort.isdigit():
+        sendClientMessage(clientAddress, clientSocket, "SYNTAX: /serve [Port]")
+        return
+
+    CLIENT_FILES.setServingAddress(clientAddress, (clientAddress[0], int(servingPort)))
+    LOG.debug("Client %s:%s is serving pieces on port %s", *clientAddress, servingPort)
+    sendClientMessage(clientAddress, clientSocket, "Other clients will now download your files from port " + servingPort + ".")
+COMMANDS["serve"] = serveCommand
+
+def searchFileCommand(clientAddress, clientSocket, searchTerm = False):
+    if not searchTerm:
+        sendClientMessage(clientAddress, clientSocket, "SYNTAX: /search [Term] (end the term with * for a prefix search)")
+        return
+
+    if searchTerm.endswith("*"): # Prefix search.
+        foundFiles = CLIENT_FILES.searchPrefix(searchTerm[:-1], SEARCH_LIMIT)
+    else: # Substring search.
+        foundFiles = CLIENT_FILES.searchSubstring(searchTerm, SEARCH_LIMIT)
+
+    if (foundFiles):
+        sendClientMessage(clientAddress, clientSocket, "The following files match '" + searchTerm + "': " + ", ".join(foundFiles))
+    else:
+        sendClientMessage(clientAddress, clientSocket, "No files matching '" + searchTerm + "' exist on the server.")
+COMMANDS["search"] = searchFileCommand
+
+def fetchFileCommand(clientAddress, clientSocket, fileName = False, acceptedCodecs = False):
+    if not fileName:
+        sendClientMessage(clientAddress, clientSocket, "SYNTAX: /fetchfile [File Name] [Accepted Codecs]")
+        return
+
+    if not isSafeFileName(fileName): # Names such as ../server.py would reach outside the server directory.
+        sendClientMessage(clientAddress, clientSocket, "ERROR: '" + fileName + "' is not a valid file name.")
+        return
+
+    # Check to see if the server has the file available.
+    if not os.path.isfile(SERVER_DIR + "/" + fileName):
+        sendClientMessage(clientAddress, clientSocket, "ERROR: No file with the name '" + fileName + "' available on the server.")
+        return
+
+    LOG.info("[%s:%s] Request to download file '%s', starting..", *clientAddress, fileName)
+    
+    acceptedCodecs = acceptedCodecs.split(",") if acceptedCodecs else () # Comma separated wire codecs the client can decode.
+    startTime = time.perf_counter()
+    fileSize = sendClientFile(clientAddress, clientSocket, fileName, SERVER_DIR + "/" + fileName, acceptedCodecs) # Stream the file to client.
+
+    def fileSent():
+        elapsed = time.perf_counter() - startTime
+        if METRICS_ENABLED:
+            FILES_SENT.inc()
+            TRANSFER_RATE.observe(fileSize / elapsed if elapsed > 0 else 0)
+        LOG.info("[%s:%s] Finished sending file '%s' (%d bytes in %.3fs).", *clientAddress, fileName, fileSize, elapsed)
+    clientSocket.whenSent(fileSent)
+COMMANDS["fetchfile"] = fetchFileCommand
+
+'''
+    /fetchrange [File Name] [Offset] [Length] [Accepted Codecs]
+        Sends part of a file, so an interrupted download can fetch only the bytes it is missing. A length of 0
+        returns just the file's size and modification time.
+'''
+def fetchRangeCommand(clientAddress, clientSocket, fileName = False, offset = False, length = False, acceptedCodecs = False):
+    if not fileName or not offset or not length or not offset.isdigit() or not length.isdigit():
+        sendClientMessage(clientAddress, clientSocket, "SYNTAX: /fetchrange [File Name] [Offset] [Length] [Accepted Codecs]")
+        return
+
+    if not isSafeFileName(fileName): # Names such as ../server.py would reach outside the server directory.
+        sendClientMessage(clientAddress, clientSocket, "ERROR: '" + fileName + "' is not a valid file name.")
+        return
+
+    if not os.path.isfile(SERVER_DIR + "/" + fileName):
+        sendClientMessage(clientAddress, clientSocket, "ERROR: No file with the name '" + fileName + "' available on the server.")
+        return
+
+    acceptedCodecs = acceptedCodecs.split(",") if acceptedCodecs else ()
+    startTime = time.perf_counter()
+    length = sendClientRange(clientAddress, clientSocket, fileName, SERVER_DIR + "/" + fileName, int(offset), int(length), acceptedCodecs)
+
+    def rangeSent():
+        elapsed = time.perf_counter() - startTime
+        if length and METRICS_ENABLED:
+            RANGES_SENT.inc()
+            TRANSFER_RATE.observe(length / elapsed if elapsed > 0 else 0)
+        LOG.debug("[%s:%s] Sent %d bytes of file '%s' from offset %s in %.3fs.", *clientAddress, length, fileName, offset, elapsed)
+    clientSocket.whenSent(rangeSent)
+COMMANDS["fetchrange"] = fetchRangeCommand
+
+def statsCommand(clientAddress, clientSocket):
+    sendClientMessage(clientAddress, clientSocket, "[stats]" + getStatsSummary())
+COMMANDS["stats"] = statsCommand
+
+def showHelpCommand(clientAddress, clientSocket):
+    sendClientMessage(clientAddress, clientSocket, "Available Commands:" + COMMAND_LIST)
+COMMANDS["help"] = showHelpCommand
+
+# Generate the command list.
+COMMAND_LIST = ""
+for commandName in COMMANDS: COMMAND_LIST = COMMAND_LIST + " /" + commandName + ","
+COMMAND_LIST = COMMAND_LIST[:-1]
+
+# ======================================================================================================================== #
+# Socket Data Input/Output
+# ======================================================================================================================== #
+
+'''
+    closeSockets()
+        Closes all active socket connections that are still open.
+'''
+def closeSockets():
+    with CONNECTIONS_LOCK:
+        connections = list(CONNECTIONS)
+    for client in connections:
+        LOG.info("Dropping connection for client %s:%s", *client[1])
+        client[0].close()
+
+'''
+    registerClient(clientSocket, clientAddress)
+        Records a newly connected client in the connection list and initializes its file records.
+'''
+def registerClient(clientSocket, clientAddress):
+    LOG.info("Incoming client connection from %s:%s..", *clientAddress)
+    CONNECTIONS_ACCEPTED.inc()
+    with CONNECTIONS_LOCK:
+        CONNECTIONS.append((clientSocket, clientAddress)) # Add this client to the connection list.
+    if (CLIENT_FILES.addPeer(clientAddress)):
+        LOG.debug("First time client %s:%s is connecting, initializing a file dictionary for them.", *clientAddress)
+
+'''
+    unregisterClient(clientSocket, clientAddress)
+        Removes a disconnected client from the connection list and clears its recorded files, or with a lease
+        keeps them until the lease runs out in case the client reconnects. Does nothing if the client has already
+        been unregistered, such as by reapConnections() reclaiming its connection.
+'''
+def unregisterClient(clientSocket, clientAddress):
+    with CONNECTIONS_LOCK: # Hand over the connection's metrics in the same step, so collection never counts them twice.
+        if (clientSocket, clientAddress) not in CONNECTIONS: return
+        CONNECTIONS.remove((clientSocket, clientAddress)) # Remove client from array.
+        CLOSED_TRAFFIC.labels("received").inc(clientSocket.bytesReceived)
+        CLOSED_TRAFFIC.labels("sent").inc(clientSocket.bytesSent)
+        for commandName, latency in clientSocket.commandLatency.items():
+            CLOSED_COMMAND_LATENCY.setdefault(commandName, metrics.Histogram()).merge(latency)
+    if PEER_LEASE_TTL > 0:
+        CLIENT_FILES.releasePeer(clientAddress, PEER_LEASE_TTL)
+    else:
+        CLIENT_FILES.removePeer(clientAddress) # Clear the client's recorded files.
+
+'''
+    maintainTracker() : Threaded
+        Periodically drops clients whose lease has run out and snapshots the tracker state when it is due.
+'''
+def maintainTracker():
+    while True:
+        time.sleep(MAINTENANCE_INTERVAL)
+        expired = (TRACKER_SERVICE or CLIENT_FILES).expirePeers() # The service also drops them from every worker.
+        if expired: LOG.info("Dropped %d disconnected client(s) whose lease ran out.", expired)
+        if isinstance(CLIENT_FILES, PersistentTrackerIndex) and CLIENT_FILES.snapshotIfDue():
+            LOG.info("Saved a snapshot of the tracker state (%d records).", len(CLIENT_FILES))
+
+'''
+    reapConnections() : Threaded
+        Disconnects clients that have stayed silent between commands for longer than IDLE_TIMEOUT, or that started
+        sending a frame and did not finish it within READ_TIMEOUT. The thread or coroutine serving the connection
+        then closes it and unregisters the client as if it had disconnected, dropping its files from the tracker.
+        Clients that go quiet on purpose send MSG_HEARTBEAT frames to stay connected.
+
+        A connection handling a command that has sent nothing for BUSY_TIMEOUT is disconnected the same way, and
+        one still registered REAP_GRACE after being disconnected, whose thread or coroutine is gone, is closed
+        and unregistered here.
+'''
+def reapConnections():
+    progress = {} # Connection -> (bytes sent, when they were last seen to change) while it handles a command.
+    aborted = {} # Connection -> when it was disconnected.
+    while True:
+        time.sleep(REAP_INTERVAL)
+        now = time.monotonic()
+        with CONNECTIONS_LOCK:
+            connections = list(CONNECTIONS)
+        busy = {}
+        for clientSocket, clientAddress in connections:
+            if clientSocket in aborted:
+                if now - aborted[clientSocket] > REAP_GRACE:
+                    LOG.warning("Reclaiming connection for client %s:%s, nothing closed it after it was dropped.", *clientAddress)
+                    reclaimConnection(clientSocket, clientAddress)
+                continue
+
+            frameStarted = clientSocket.frameStarted # Read before idleSince, the connection clears them in the other order.
+            idleSince = clientSocket.idleSince
+            if frameStarted is not None:
+                if not READ_TIMEOUT or now - frameStarted <= READ_TIMEOUT: continue
+                timeout = "read"
+            elif idleSince is not None:
+                if not IDLE_TIMEOUT or now - idleSince <= IDLE_TIMEOUT: continue
+                timeout = "idle"
+            else: # Busy handling a command.
+                bytesSent, since = progress.get(clientSocket, (None, now))
+                if bytesSent != clientSocket.bytesSent: since = now
+                busy[clientSocket] = (clientSocket.bytesSent, since)
+                if not BUSY_TIMEOUT or now - since <= BUSY_TIMEOUT: continue
+                timeout = "busy"
+            LOG.info("Disconnecting client %s:%s after it went silent (%s timeout).", *clientAddress, timeout)
+            CONNECTIONS_REAPED.labels(timeout).inc()
+            clientSocket.abort()
+            aborted[clientSocket] = now
+        progress = busy
+        registered = {clientSocket for clientSocket, clientAddress in connections}
+        aborted = {clientSocket: abortedAt for clientSocket, abortedAt in aborted.items() if clientSocket in registered} # The rest closed themselves.
+
+'''
+    reclaimConnection(clientSocket, clientAddress)
+        Closes and unregisters a dropped connection whose thread or coroutine did not, see reapConnections().
+'''
+def reclaimConnection(clientSocket, clientAddress):
+    if isinstance(clientSocket, ClientConnection): clientSocket.close() # An asynchronous connection's abort already closed its socket.
+    unregisterClient(clientSocket, clientAddress)
+
+def startReaper():
+    if IDLE_TIMEOUT or READ_TIMEOUT or BUSY_TIMEOUT: threading.Thread(target = reapConnections, daemon = True).start()
+
+'''
+    loadTrackerState(stateDirectory, leaseTTL)
+        Replaces the in-memory tracker with one persisted to the given directory, reloading any saved state.
+        Every reloaded client gets a lease so it can reconnect before its files are dropped.
+'''
+def loadTrackerState(stateDirectory, leaseTTL):
+    global CLIENT_FILES, PEER_LEASE_TTL
+    startTime = time.perf_counter()
+    CLIENT_FILES = PersistentTrackerIndex(stateDirectory)
+    PEER_LEASE_TTL = leaseTTL
+    CLIENT_FILES.leaseAllPeers(max(leaseTTL, MAINTENANCE_INTERVAL))
+    LOG.info("Loaded %d tracker records from '%s' in %.3fs.", len(CLIENT_FILES), stateDirectory, time.perf_counter() - startTime)
+
+'''
+    saveTrackerState()
+        Writes a final snapshot on shutdown so the next start only has to load it.
+'''
+def saveTrackerState():
+    if isinstance(CLIENT_FILES, PersistentTrackerIndex):
+        LOG.info("Saving the tracker state..")
+        CLIENT_FILES.close()
+
+'''
+    handlePayload(clientAddress, clientSocket, messageType, data, flags, requestId)
+        Verifies and dispatches a single frame received from a client, every reply is tagged with its request ID.
+        Returns False once the client has asked to close the connection.
+'''
+def handlePayload(clientAddress, clientSocket, messageType, data, flags = shared.FLAG_NONE, requestId = 0):
+    clientSocket.bytesReceived = clientSocket.bytesReceived + shared.FRAME_HEADER.size + len(data)
+    if messageType != shared.MSG_COMMAND: return True # Heartbeats only keep the connection from timing out.
+    clientSocket.requestId = requestId
+
+    payload = data.decode(errors = "replace").split(";HASH;", 1) # Client payload, bytes that are not UTF-8 fail the hash check.
+    if len(payload) < 2: payload.insert(0, "") # No hash at all.
+    payloadHashed = hashlib.sha224(payload[1].encode()).hexdigest() # Serverside hash.
+
+    if not (payload[0] == payloadHashed): # Check clients hash with the server's hash.
+        LOG.warning("Hash mismatch from client %s:%s, ignoring request: '%s'", *clientAddress, payload[1][:256])
+        sendClientMessage(clientAddress, clientSocket, "ERROR: Request failed verification and was ignored, please try again.")
+        return True
+
+    LOG.debug("[HASH] %s:%s sent verified payload.", *clientAddress)
+
+    if payload[1] == "exit": return False # If client is quitting.
+    bytesSent = clientSocket.bytesSent
+    try:
+        parseInput(clientAddress, clientSocket, payload[1])
+    except OSError:
+        raise # The client is gone.
+    except Exception:
+        if clientSocket.bytesSent != bytesSent: raise # Part of the reply is out, the client could not tell where it ends.
+        LOG.exception("Command from client %s:%s failed: '%s'", *clientAddress, payload[1].split("\n", 1)[0])
+        sendClientMessage(clientAddress, clientSocket, "ERROR: The server failed to handle the command, please try again.")
+    return True
+
+'''
+    ClientConnection(clientSocket)
+        Wraps a connected client socket with the request ID of the command currently being handled and counts
+        the bytes and command latencies it has seen, which only its own thread updates. It also records since
+        when the client has been idle and when it started sending its current frame, for reapConnections().
+'''
+class ClientConnection:
+    def __init__(self, clientSocket):
+        self.socket = clientSocket
+        self.requestId = 0
+        self.bytesReceived = 0
+        self.bytesSent = 0
+        self.commandLatency = {} # Latency of every command handled on this connection, only updated by its thread.
+        self.bulk = False # Set while a file is streamed, see bulkTransfer().
+        self.idleSince = time.monotonic() # When the connection began waiting for its next frame, None while handling one.
+        self.frameStarted = None # When the first bytes of the frame being received arrived.
+
+    def recv_into(self, buffer, count = 0):
+        received = self.socket.recv_into(buffer, count)
+        if self.frameStarted is None: self.frameStarted = time.monotonic()
+        return received
+
+    def sendall(self, data):
+        if self.bulk: UPLOAD_SCHEDULER.wait(self, len(data))
+        self.socket.sendall(data)
+        self.bytesSent = self.bytesSent + len(data)
+
+    def sendfile(self, fileObject, offset = 0, count = None):
+        if count is None: count = os.fstat(fileObject.fileno()).st_size - offset
+        sent = 0
+        try:
+            while sent < count: # Files go out a slice at a time, counted as they go, bulk transfers paced by the upload scheduler.
+                sliceSize = min(count - sent, UPLOAD_SCHEDULER.sliceSize)
+                if self.bulk: UPLOAD_SCHEDULER.wait(self, sliceSize)
+                sliceSent = self.socket.sendfile(fileObject, offset + sent, sliceSize)
+                if sliceSent == 0: break # The file ended early.
+                sent = sent + sliceSent
+                self.bytesSent = self.bytesSent + sliceSent # Shows reapConnections() the transfer is moving.
+        except OSError: # The file position is left after the bytes sent, count them even if the client dropped.
+            self.bytesSent = self.bytesSent + fileObject.tell() - offset - sent
+            raise
+        return sent
+
+    '''
+        sendChunks(fileObject, chunks)
+            Sends the (flags, payload) MSG_CHUNK frames yielded by chunks(fileObject) as they are produced.
+    '''
+    def sendChunks(self, fileObject, chunks):
+        for flags, payload in chunks(fileObject):
+            shared.sendFrame(self, shared.MSG_CHUNK, payload, flags, self.requestId)
+
+    '''
+        whenSent(callback)
+            Calls callback once everything sent so far has gone out, which on a blocking socket is right away.
+    '''
+    def whenSent(self, callback):
+        callback()
+
+    def endBulk(self):
+        self.bulk = False
+        UPLOAD_SCHEDULER.release(self)
+
+    '''
+        abort()
+            Shuts the socket down from another thread, which wakes the connection's thread to close it.
+    '''
+    def abort(self):
+        self.idleSince = self.frameStarted = None # Reaped once, its thread is about to close it.
+        try:
+            self.socket.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass # Already closed.
+
+    def close(self):
+        self.socket.close()
+
+'''
+    handleClient(clientSocket, clientAddress) : Threaded
+        Function that is called whenever a new client connects and is run in a separate thread, handles client input.
+'''
+def handleClient(clientSocket = False, clientAddress = False):
+    if not clientSocket or not clientAddress:
+        LOG.error("@handleClient: clientSocket or clientAddress not received.")
+        return
+
+    try:
+        while True:
+            try:
+                frame = shared.recvFrame(clientSocket, withHeader = True)
+            except (shared.ProtocolError, OSError) as e:
+                LOG.warning("Dropping client %s:%s after a broken frame: %s", *clientAddress, e)
+                break
+            if frame is None: break # Client closed the connection.
+            clientSocket.idleSince = clientSocket.frameStarted = None # In this order, see reapConnections().
+            try:
+                if not handlePayload(clientAddress, clientSocket, *frame): break
+            except OSError as e: # Such as a client that disconnects in the middle of a file transfer.
+                LOG.info("Lost client %s:%s while replying: %s", *clientAddress, e)
+                break
+            except Exception:
+                LOG.exception("Dropping client %s:%s after a command failed part way through its reply.", *clientAddress)
+                break
+            clientSocket.idleSince = time.monotonic()
+    finally:
+        # Actions to conduct when client disconnects.
+        LOG.info("Closing connection for client %s:%s", *clientAddress)
+        clientSocket.close() # Close this client's connection.
+        unregisterClient(clientSocket, clientAddress)
+
+'''
+    runThreadedServer()
+        Accepts connections on the server socket and serves each client in its own thread.
+'''
+def runThreadedServer():
+    LOG.info("Opening server socket on %s:%s..", *shared.SERVER_ADDRESS)
+    serverSocket = socket.socket(socket.AF_INET, socket.SOCK_STREAM) # Create a TCP/IP socket.
+    serverSocket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if REUSE_PORT: serverSocket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1) # The kernel spreads connections across the workers.
+    serverSocket.bind(shared.SERVER_ADDRESS) # Bind the socket to the port.
+    serverSocket.listen(SERVER_BACKLOG) # Listen for incoming connections.
+    startReaper()
+
+    while True:
+        try:
+            clientSocket, clientAddress = serverSocket.accept() # Wait and accept connections.
+            shared.enableKeepalive(clientSocket) # Catches clients whose host vanished, even with no idle timeout.
+            clientSocket = ClientConnection(clientSocket)
+            registerClient(clientSocket, clientAddress)
+            threading.Thread(target = handleClient, args = (clientSocket, clientAddress), daemon = True).start() # Start new thread for this client.
+        except KeyboardInterrupt as e:
+            LOG.info("Shutting down the server..")
+            break
+    closeSockets()
+    serverSocket.close()
+
+# ======================================================================================================================== #
+# Asynchronous Socket Data Input/Output
+# ======================================================================================================================== #
+
+'''
+    AsyncClientSocket(writer)
+        Socket-like wrapper around an asyncio StreamWriter so the existing command handlers can be reused unchanged.
+        Writes are queued in order and flushed by the connection coroutine once the handler returns, with file
+        streams handed to the event loop's zero-copy sendfile. Chunk streams are only read and compressed while
+        they are flushed, a chunk at a time on the default executor, so they neither block the event loop nor
+        pile up in memory.
+'''
+class AsyncClientSocket:
+    def __init__(self, writer):
+        self.writer = writer
+        self.loop = asyncio.get_running_loop()
+        self.requestId = 0 # Request ID of the command currently being handled.
+        self.pending = [] # Queued (data, fileObject, offset, count, bulk, frames) writes awaiting flush.
+        self.sentCallbacks = [] # Called once the queued writes have been flushed, see whenSent().
+        self.bytesReceived = 0
+        self.bytesSent = 0
+        self.commandLatency = {}
+        self.bulk = False # Set while a file is queued, see bulkTransfer().
+        self.idleSince = time.monotonic() # See ClientConnection.
+        self.frameStarted = None
+
+    def sendall(self, data):
+        self.pending.append((bytes(data), None, 0, 0, self.bulk, None))
+        self.bytesSent = self.bytesSent + len(data)
+
+    def sendfile(self, fileObject, offset = 0, count = None):
+        if count is None: count = os.fstat(fileObject.fileno()).st_size - offset
+        # Handlers close their file as soon as they return, so keep a duplicate descriptor until the flush.
+        self.pending.append((None, os.fdopen(os.dup(fileObject.fileno()), "rb"), offset, count, self.bulk, None))
+
+    '''
+        sendChunks(fileObject, chunks)
+            Queues the MSG_CHUNK frames yielded by chunks(fileObject), produced only once they are flushed. The
+            duplicate descriptor shares the file position, so chunks continue from where the handler left it.
+    '''
+    def sendChunks(self, fileObject, chunks):
+        requestId = self.requestId
+        def frames(fileObject):
+            for flags, payload in chunks(fileObject):
+                yield shared.packFrameHeader(shared.MSG_CHUNK, payload, flags, requestId), payload
+        self.pending.append((None, os.fdopen(os.dup(fileObject.fileno()), "rb"), 0, 0, self.bulk, frames))
+
+    '''
+        whenSent(callback)
+            Calls callback once the writes queued so far have been flushed, so transfer and command timings cover
+            the bytes actually going out rather than just queueing them. Dropped if the flush fails.
+    '''
+    def whenSent(self, callback):
+        self.sentCallbacks.append(callback)
+
+    def endBulk(self):
+        self.bulk = False # The slot is released once the queued transfer has been flushed.
+
+    async def flush(self):
+        pending, self.pending = self.pending, []
+        sentCallbacks, self.sentCallbacks = self.sentCallbacks, []
+        paced = False
+        try:
+            for data, fileObject, offset, count, bulk, frames in pending:
+                paced = paced or bulk
+                if frames is not None:
+                    with fileObject:
+                        await self.flushFrames(frames(fileObject), bulk)
+                    continue
+                if fileObject is None:
+                    if bulk:
+                        await UPLOAD_SCHEDULER.waitAsync(self, len(data))
+                        await self.writer.drain()
+                    self.writer.write(data)
+                    continue
+                with fileObject:
+                    await self.writer.drain()
+                    end = offset + count
+                    while offset < end: # Files go out a slice at a time, counted as they go, bulk transfers paced by the upload scheduler.
+                        sliceSize = min(end - offset, UPLOAD_SCHEDULER.sliceSize)
+                        if bulk: await UPLOAD_SCHEDULER.waitAsync(self, sliceSize)
+                        await asyncio.get_running_loop().sendfile(self.writer.transport, fileObject, offset, sliceSize)
+                        offset = offset + sliceSize
+                        self.bytesSent = self.bytesSent + sliceSize
+            await self.writer.drain()
+            for callback in sentCallbacks: callback()
+        finally:
+            if paced: UPLOAD_SCHEDULER.release(self)
+
+    async def flushFrames(self, frames, bulk):
+        while True:
+            frame = await self.loop.run_in_executor(None, next, frames, None) # Read and compress off the event loop.
+            if frame is None: return
+            header, payload = frame
+            if bulk: await UPLOAD_SCHEDULER.waitAsync(self, len(header) + len(payload))
+            self.writer.write(header)
+            self.writer.write(payload)
+            self.bytesSent = self.bytesSent + len(header) + len(payload)
+            await self.writer.drain() # Only one chunk is buffered at a time.
+
+    '''
+        abort()
+            Drops the connection from another thread, the connection coroutine then sees it end and closes it.
+    '''
+    def abort(self):
+        self.idleSince = self.frameStarted = None
+        self.loop.call_soon_threadsafe(self.writer.transport.abort)
+
+    def close(self):
+        for data, fileObject, offset, count, bulk, frames in self.pending:
+            if fileObject is not None: fileObject.close()
+        self.pending = []
+        self.writer.close()
+
+'''
+    recvClientFrameAsync(reader, clientSocket) : Coroutine
+        Receives a frame like shared.recvFrameAsync. The stream reader does not tell when the first bytes of a
+        frame arrive, so the read timeout of an asynchronous connection starts once the frame header has.
+'''
+async def recvClientFrameAsync(reader, clientSocket):
+    try:
+        header = await reader.readexactly(shared.FRAME_HEADER.size)
+    except asyncio.IncompleteReadError:
+        return None
+
+    clientSocket.frameStarted = time.monotonic()
+    messageType, flags, requestId, length, checksum = shared.unpackFrameHeader(header)
+    payload = await reader.readexactly(length)
+    shared.verifyFramePayload(payload, checksum)
+    return messageType, payload, flags, requestId
+
+'''
+    handleClientAsync(reader, writer) : Coroutine
+        Asynchronous equivalent of handleClient, run as a task on the event loop for every connection.
+'''
+async def handleClientAsync(reader, writer):
+    clientAddress = writer.get_extra_info("peername")[:2]
+    shared.enableKeepalive(writer.get_extra_info("socket"))
+    clientSocket = AsyncClientSocket(writer)
+
+    try:
+        await callTrackerChange(registerClient, clientSocket, clientAddress)
+        while True:
+            frame = await recvClientFrameAsync(reader, clientSocket)
+            if frame is None: break # Client closed the connection.
+            clientSocket.idleSince = clientSocket.frameStarted = None # In this order, see reapConnections().
+            if isTrackerCommand(*frame):
+                if not await callTrackerChange(handlePayload, clientAddress, clientSocket, *frame): break
+            elif not handlePayload(clientAddress, clientSocket, *frame): break
+            await clientSocket.flush()
+            clientSocket.idleSince = time.monotonic()
+    except (shared.ProtocolError, asyncio.IncompleteReadError, OSError) as e:
+        LOG.warning("Dropping client %s:%s after a broken frame: %s", *clientAddress, e)
+    except Exception:
+        LOG.exception("Dropping client %s:%s after a command failed part way through its reply.", *clientAddress)
+    finally:
+        # Actions to conduct when client disconnects, also reached when the server shuts down.
+        LOG.info("Closing connection for client %s:%s", *clientAddress)
+        clientSocket.close() # Close this client's connection.
+        await callTrackerChange(unregisterClient, clientSocket, clientAddress)
+
+'''
+    isTrackerCommand(messageType, data, flags, requestId)
+        Whether a frame holds one of TRACKER_COMMANDS, going by the command name alone. The frame is verified
+        when it is handled.
+'''
+def isTrackerCommand(messageType, data, flags = shared.FLAG_NONE, requestId = 0):
+    if messageType != shared.MSG_COMMAND: return False
+    commandName = data.rpartition(b";HASH;")[2].split(b"\n", 1)[0].split(b" ", 1)[0]
+    return commandName[1:].decode(errors = "replace") in TRACKER_COMMANDS
+
+'''
+    callTrackerChange(function, args..) : Coroutine
+        Calls a function that changes the tracker. With --workers the change waits on the tracker service, so it
+        runs on the default executor instead of holding up every other connection on the event loop.
+'''
+async def callTrackerChange(function, *args):
+    if not isinstance(CLIENT_FILES, ReplicatedTrackerIndex): return function(*args)
+    return await asyncio.get_running_loop().run_in_executor(None, function, *args)
+
+async def serveAsync():
+    server = await asyncio.start_server(handleClientAsync, *shared.SERVER_ADDRESS, backlog = SERVER_BACKLOG, reuse_address = True, reuse_port = REUSE_PORT)
+    async with server:
+        await server.serve_forever()
+
+'''
+    runAsyncServer()
+        Serves every client as a coroutine on a single asyncio event loop instead of a thread per client.
+'''
+def runAsyncServer():
+    raiseFileLimit() # Every idle connection holds a file descriptor.
+    LOG.info("Opening asynchronous server socket on %s:%s..", *shared.SERVER_ADDRESS)
+    startReaper()
+    try:
+        asyncio.run(serveAsync()) # Connection coroutines close their own sockets when cancelled on shutdown.
+    except KeyboardInterrupt as e:
+        LOG.info("Shutting down the server..")
+
+# ======================================================================================================================== #
+# Worker Processes
+# ======================================================================================================================== #
+
+'''
+    runWorkers(arguments)
+        Serves clients from several worker processes that all listen on the server address with SO_REUSEPORT, so
+        the kernel spreads connections across them and every worker has a core to itself. This process keeps the
+        tracker, serves it to the workers and runs its maintenance, see tracker.TrackerService.
+'''
+def runWorkers(arguments):
+    global TRACKER_SERVICE
+    TRACKER_SERVICE = TrackerService(CLIENT_FILES)
+    workers = []
+    for workerNumber in range(1, arguments.workers + 1): # Started before any thread, so forking them is safe.
+        worker = multiprocessing.Process(target = runWorker, args = (workerNumber, TRACKER_SERVICE.address, TRACKER_SERVICE.authKey, arguments), name = "worker" + str(workerNumber))
+        worker.start()
+        workers.append(worker)
+
+    signal.signal(signal.SIGTERM, signal.default_int_handler) # Stop the workers and save the tracker when terminated too.
+    threading.Thread(target = TRACKER_SERVICE.serveForever, daemon = True).start()
+    threading.Thread(target = maintainTracker, daemon = True).start()
+    LOG.info("Serving the tracker to %d workers on %s:%s..", len(workers), *shared.SERVER_ADDRESS)
+    try:
+        for worker in workers: worker.join()
+    except KeyboardInterrupt as e:
+        LOG.info("Shutting down the workers..")
+    finally:
+        for worker in workers:
+            worker.terminate()
+            worker.join()
+        TRACKER_SERVICE.close()
+
+'''
+    runWorker(workerNumber, trackerAddress, authKey, arguments)
+        Entry point of a worker process, serves clients with a replica of the tracker kept by the main process.
+'''
+def runWorker(workerNumber, trackerAddress, authKey, arguments):
+    global CLIENT_FILES, REUSE_PORT, WORKER_COUNT
+    configureServer(arguments, workerNumber)
+    CLIENT_FILES = ReplicatedTrackerIndex(trackerAddress, authKey)
+    REUSE_PORT = True
+    WORKER_COUNT = arguments.workers
+    if arguments.asyncMode:
+        runAsyncServer()
+    else:
+        runThreadedServer()
+
+'''
+    configureServer(arguments, workerNumber)
+        Applies the command line options every process serving clients needs, workers included.
+'''
+def configureServer(arguments, workerNumber = 0):
+    global LOG, WORKER_NUMBER, METRICS_ENABLED, FILE_CACHE, PEER_LEASE_TTL, UPLOAD_SCHEDULER, IDLE_TIMEOUT, READ_TIMEOUT
+    shared.configureLogging(arguments.logLevel)
+    if workerNumber: LOG = logging.getLogger("server.worker" + str(workerNumber))
+    WORKER_NUMBER = workerNumber
+    METRICS_ENABLED = not arguments.noMetrics
+    FILE_CACHE = ChunkCache(arguments.cacheSize * 1048576)
+    PEER_LEASE_TTL = arguments.leaseTTL
+    IDLE_TIMEOUT = arguments.idleTimeout
+    READ_TIMEOUT = arguments.readTimeout
+    UPLOAD_SCHEDULER = UploadScheduler(round(arguments.uploadRate * 1048576), round(arguments.peerUploadRate * 1048576), arguments.uploadSlots)
+    if arguments.metricsPort and (workerNumber or arguments.workers <= 1): # Every worker has its own metrics.
+        metrics.serveMetrics(METRICS, ("127.0.0.1", arguments.metricsPort + workerNumber))
+        LOG.info("Serving metrics on http://127.0.0.1:%d/metrics", arguments.metricsPort + workerNumber)
+
+'''
+    raiseFileLimit()
+        Raises the soft open file limit to the hard limit so the server can hold many connections open at once.
+'''
+def raiseFileLimit():
+    try:
+        import resource
+        softLimit, hardLimit = resource.getrlimit(resource.RLIMIT_NOFILE)
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hardLimit, hardLimit))
+    except (ImportError, ValueError, OSError):
+        pass # Not supported on this platform, keep the default limit.
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Peer-to-peer file sharing tracker server.")
+    parser.add_argument("--async", dest = "asyncMode", action = "store_true", help = "serve clients as coroutines on an asyncio event loop instead of one thread per client")
+    parser.add_argument("--state", dest = "stateDirectory", help = "persist the tracker to this directory so it survives restarts")
+    parser.add_argument("--cache-size", dest = "cacheSize", type = int, default = DEFAULT_CACHE_SIZE // 1048576, help = "megabytes of compressed file chunks to keep in memory for repeated /fetchfile requests, 0 disables the cache")
+    parser.add_argument("--lease-ttl", dest = "leaseTTL", type = float, help = "seconds a disconnected client's files stay tracked (default " + str(DEFAULT_LEASE_TTL) + " with --state, otherwise 0)")
+    parser.add_argument("--log-level", dest = "logLevel", default = shared.LOG_LEVEL, choices = ("DEBUG", "INFO", "WARNING", "ERROR"), type = str.upper, help = "least severe log messages to print (default " + shared.LOG_LEVEL + ")")
+    parser.add_argument("--metrics-port", dest = "metricsPort", type = int, nargs = "?", const = METRICS_PORT, help = "serve Prometheus metrics at http://localhost:PORT/metrics (default port " + str(METRICS_PORT) + ")")
+    parser.add_argument("--no-metrics", dest = "noMetrics", action = "store_true", help = "stop timing commands and transfers, /stats then only shows traffic, the tracker and the compressed-chunk cache")
+    parser.add_argument("--upload-rate", dest = "uploadRate", type = float, default = 0, help = "megabytes per second all file transfers may use together, 0 for no limit (per worker with --workers)")
+    parser.add_argument("--peer-upload-rate", dest = "peerUploadRate", type = float, default = 0, help = "megabytes per second a file may be streamed to each client, 0 for no limit")
+    parser.add_argument("--upload-slots", dest = "uploadSlots", type = int, default = DEFAULT_UPLOAD_SLOTS, help = "clients files are streamed to at once, the rest take turns every second, 0 for no limit (default " + str(DEFAULT_UPLOAD_SLOTS) + ")")
+    parser.add_argument("--idle-timeout", dest = "idleTimeout", type = float, default = DEFAULT_IDLE_TIMEOUT, help = "seconds a client may stay silent between commands before it is disconnected, clients send heartbeats to stay connected, 0 keeps idle clients (default " + str(DEFAULT_IDLE_TIMEOUT) + "), connections stuck in a command that sends nothing for " + str(BUSY_TIMEOUT) + " seconds are dropped either way")
+    parser.add_argument("--read-timeout", dest = "readTimeout", type = float, default = DEFAULT_READ_TIMEOUT, help = "seconds a client may take to finish sending a command it has started, 0 for no limit (default " + str(DEFAULT_READ_TIMEOUT) + ")")
+    parser.add_argument("--workers", type = int, default = 1, help = "serve clients from this many processes sharing the server port, one per core, with the tracker kept by the main process")
+    arguments = parser.parse_args()
+    if arguments.workers > 1 and not hasattr(socket, "SO_REUSEPORT"):
+        parser.error("--workers needs SO_REUSEPORT, which this platform does not support")
+    if arguments.leaseTTL is None:
+        arguments.leaseTTL = DEFAULT_LEASE_TTL if arguments.stateDirectory else 0
+    configureServer(arguments)
+
+    if not os.path.exists(SERVER_DIR): # If a directory for the server files doesn't exist.
+        os.makedirs(SERVER_DIR) # Create the directory.
+
+    if arguments.stateDirectory:
+        loadTrackerState(arguments.stateDirectory, arguments.leaseTTL)
+
+    try:
+        if arguments.workers > 1:
+            runWorkers(arguments)
+        else:
+            threading.Thread(target = maintainTracker, daemon = True).start()
+            if arguments.asyncMode:
+                runAsyncServer()
+            else:
+                runThreadedServer()
+    finally:
+        saveTrackerState()
@@ -1,17 +1,316 @@
-'''
-    @author  Skully (https://github.com/ImSkully)
-    @website https://skully.tech
-    @email   contact@skully.tech
-    @updated 13/12/21
-    
-    A simple peer-to-peer file sharing torrenting network with encrypted payload transportation
-    and support for multiple clients over sockets with multi-threading.
-'''
-
-# ======================================================================================================================== #
-# Shared Variable Definitions
-# ======================================================================================================================== #
-
-DEBUG = True # Toggles debugging outputs.
-COMMAND_PREFIX = "/" # The prefix to use for the command.
-SERVER_ADDRESS = ('localhost', 10000) # Socket IP and port to establish a connection to.
\ No newline at end of file
+'''
+    @author  Skully (https://github.com/ImSkully)
+    @website https://skully.tech
+    @email   contact@skully.tech
+    @updated 13/12/21
+    
+    A simple peer-to-peer file sharing torrenting network with encrypted payload transportation
+    and support for multiple clients over sockets with multi-threading.
+'''
+
+import asyncio
+import logging
+import mmap
+import os
+import socket
+import struct
+import sys
+import threading
+import zlib
+from contextlib import contextmanager
+
+# ======================================================================================================================== #
+# Shared Variable Definitions
+# ======================================================================================================================== #
+
+DEBUG = False # Toggles debugging outputs.
+LOG_LEVEL = "DEBUG" if DEBUG else "INFO" # Least severe log level that is written, every request is logged at DEBUG.
+LOG_FORMAT = "%(asctime)s %(levelname)s [%(name)s] %(message)s"
+COMMAND_PREFIX = "/" # The prefix to use for the command.
+SERVER_ADDRESS = ('localhost', 10000) # Socket IP and port to establish a connection to.
+PROTOCOL_MAGIC = b"P2" # Leading bytes of every frame header, used to detect a desynchronised stream.
+PROTOCOL_VERSION = 2 # Wire protocol version, bump whenever the frame header layout changes.
+RECV_BUFFER_SIZE = 65536 # Maximum number of bytes to pull from a socket in a single recv call.
+MAX_FRAME_SIZE = 67108864 # Largest frame payload accepted, checked before any buffer for it is allocated.
+STREAM_CHUNK_SIZE = 1048576 # Size of the chunks used when streaming a file without sendfile support.
+STREAM_WINDOW_SIZE = 16777216 # Size of each memory-mapped window used when receiving a streamed file.
+PIECE_SIZE = 50000 # Size in bytes of each file segment exchanged between peers.
+PEER_BACKLOG = 64 # Maximum number of pending connections queued on a client's peer listener.
+WIRE_COMPRESSION = True # Lets /fetchfile transfers be compressed on the wire when the file compresses well.
+POOL_MAX_IDLE = 4 # Maximum number of idle connections a ConnectionPool keeps open per address.
+PEER_UPLOAD_RATE = 0 # Bytes per second a client may upload pieces at in total, 0 for no limit.
+PEER_UPLOAD_RATE_PER_PEER = 0 # Bytes per second a client may upload pieces to any one peer, 0 for no limit.
+PEER_UPLOAD_SLOTS = 4 # Peers a client uploads pieces to at once, the others are choked and take turns.
+CHUNK_STORE_DIRECTORY = "chunks" # Content-addressed store of file pieces shared by every client started in the same directory, None to disable it.
+HEARTBEAT_INTERVAL = 30 # Seconds between the heartbeats that keep an idle tracker connection from timing out.
+KEEPALIVE_IDLE = 60 # Seconds a connection is quiet before TCP keepalive probes check the other end is still there.
+KEEPALIVE_INTERVAL = 10 # Seconds between TCP keepalive probes.
+KEEPALIVE_PROBES = 3 # Unanswered TCP keepalive probes before the connection is reset.
+
+'''
+    configureLogging(level)
+        Sends log records at or above the level to standard output. Records below it cost a single level check,
+        so debug logging on hot paths is free once it is turned off.
+'''
+def configureLogging(level = LOG_LEVEL):
+    logging.basicConfig(stream = sys.stdout, level = level, format = LOG_FORMAT)
+
+# ======================================================================================================================== #
+# Wire Protocol
+# ======================================================================================================================== #
+
+'''
+    Every message sent between a client and the server is a frame: a fixed size header followed by the raw payload.
+
+    FRAME_HEADER = (
+        magic,      2 bytes - PROTOCOL_MAGIC
+        version,    1 byte  - PROTOCOL_VERSION
+        type,       1 byte  - One of the MSG_* constants below.
+        flags,      2 bytes - Bitmask of FLAG_* constants, reserved for per-frame options.
+        requestId,  4 bytes - Chosen by the client for each command and echoed on every frame of the reply.
+        length,     8 bytes - Number of payload bytes that follow the header.
+        checksum,   4 bytes - CRC-32 of the payload bytes.
+    )
+'''
+FRAME_HEADER = struct.Struct("!2sBBHIQI")
+
+MSG_COMMAND = 1 # Client -> server command string, "<sha224>;HASH;<command>".
+MSG_RESPONSE = 2 # Server -> client text response.
+MSG_FILE = 3 # Server -> client file header, "<file name>\0<file size>", followed by exactly <file size> raw bytes.
+             # If the header ends in "\0<codec>" the file follows as MSG_CHUNK frames instead.
+MSG_PEER_REQUEST = 4 # Peer -> peer request, "have <file name>", "manifest <file name>" or "piece <index> <file name>".
+MSG_HAVE = 5 # Peer -> peer reply to "have", file size and piece size followed by a bitfield of the pieces held.
+MSG_PIECE = 6 # Peer -> peer reply to "piece", the piece index followed by the raw piece bytes.
+MSG_MANIFEST = 7 # Peer -> peer reply to "manifest <file name>", the file's piece manifest.
+MSG_CHUNK = 8 # Server -> client chunk of a compressed file transfer, flagged FLAG_COMPRESSED if the chunk is compressed.
+MSG_RANGE = 9 # Server -> client reply to /fetchrange, RANGE_HEADER followed by "<file name>[\0<codec>]", then the range
+              # as exactly <length> raw bytes, or as MSG_CHUNK frames if a codec is given.
+MSG_HEARTBEAT = 10 # Client -> server keepalive with an empty payload, sent while a connection is idle and never answered.
+
+RANGE_HEADER = struct.Struct("!QQQQ") # MSG_RANGE payload header: file size, file modified time (ns), range offset, range length.
+
+FLAG_NONE = 0
+FLAG_COMPRESSED = 1 # Payload was compressed with the codec negotiated for the transfer.
+
+class ProtocolError(Exception):
+    pass
+
+'''
+    recvExactly(theSocket, length)
+        Receives exactly the given number of bytes from the socket into a single preallocated buffer.
+        Raises ConnectionError if the peer closes the connection before all bytes arrive.
+'''
+def recvExactly(theSocket, length):
+    buffer = bytearray(length)
+    view = memoryview(buffer)
+    received = 0
+    while received < length:
+        count = theSocket.recv_into(view[received:], min(length - received, RECV_BUFFER_SIZE))
+        if count == 0:
+            raise ConnectionError("Connection closed with " + str(length - received) + " bytes outstanding.")
+        received = received + count
+    return buffer
+
+'''
+    packFrameHeader(messageType, payload, flags, requestId)
+        Builds the frame header that precedes the given payload bytes.
+'''
+def packFrameHeader(messageType, payload, flags = FLAG_NONE, requestId = 0):
+    return FRAME_HEADER.pack(PROTOCOL_MAGIC, PROTOCOL_VERSION, messageType, flags, requestId, len(payload), zlib.crc32(payload))
+
+'''
+    sendFrame(theSocket, messageType, payload, flags)
+        Sends a single frame containing the given payload bytes over the socket.
+'''
+def sendFrame(theSocket, messageType, payload = b"", flags = FLAG_NONE, requestId = 0):
+    header = packFrameHeader(messageType, payload, flags, requestId)
+    if len(payload) <= RECV_BUFFER_SIZE:
+        theSocket.sendall(header + payload) # Small frames go out in one write.
+    else:
+        theSocket.sendall(header) # Large payloads are sent as-is rather than copied onto the header.
+        theSocket.sendall(payload)
+
+'''
+    recvFrame(theSocket, withHeader)
+        Receives a single frame from the socket and returns a (messageType, payload) tuple, or a
+        (messageType, payload, flags, requestId) tuple if withHeader is set.
+        Returns None if the peer closed the connection cleanly between frames.
+'''
+def recvFrame(theSocket, withHeader = False):
+    try:
+        header = recvExactly(theSocket, FRAME_HEADER.size)
+    except ConnectionError:
+        return None
+
+    messageType, flags, requestId, length, checksum = unpackFrameHeader(header)
+    payload = recvExactly(theSocket, length)
+    verifyFramePayload(payload, checksum)
+    if withHeader: return messageType, payload, flags, requestId
+    return messageType, payload
+
+'''
+    recvFrameAsync(reader, withHeader)
+        Coroutine equivalent of recvFrame that reads a single frame from an asyncio StreamReader.
+'''
+async def recvFrameAsync(reader, withHeader = False):
+    try:
+        header = await reader.readexactly(FRAME_HEADER.size)
+    except asyncio.IncompleteReadError:
+        return None
+
+    messageType, flags, requestId, length, checksum = unpackFrameHeader(header)
+    payload = await reader.readexactly(length)
+    verifyFramePayload(payload, checksum)
+    if withHeader: return messageType, payload, flags, requestId
+    return messageType, payload
+
+'''
+    unpackFrameHeader(header)
+        Validates a raw frame header and returns a (messageType, flags, requestId, length, checksum) tuple. Frames
+        claiming more than MAX_FRAME_SIZE bytes are rejected before the payload is read.
+'''
+def unpackFrameHeader(header):
+    magic, version, messageType, flags, requestId, length, checksum = FRAME_HEADER.unpack(header)
+    if magic != PROTOCOL_MAGIC or version != PROTOCOL_VERSION:
+        raise ProtocolError("Received a frame with an unknown header, stream is out of sync.")
+    if length > MAX_FRAME_SIZE:
+        raise ProtocolError("Received a frame of " + str(length) + " bytes, larger than the " + str(MAX_FRAME_SIZE) + " bytes allowed.")
+    return messageType, flags, requestId, length, checksum
+
+def verifyFramePayload(payload, checksum):
+    if zlib.crc32(payload) != checksum:
+        raise ProtocolError("Frame checksum mismatch, payload was corrupted in transit.")
+
+
+'''
+    sendFileStream(theSocket, fileObject, count)
+        Streams count bytes of an open binary file to the socket, starting at the current file position.
+        Uses the zero-copy sendfile path where the socket supports it, otherwise falls back to sending
+        memoryview slices of a single reused buffer so memory use stays flat regardless of file size.
+'''
+def sendFileStream(theSocket, fileObject, count):
+    if hasattr(theSocket, "sendfile"):
+        theSocket.sendfile(fileObject, fileObject.tell(), count)
+        return
+
+    buffer = bytearray(min(count, STREAM_CHUNK_SIZE))
+    view = memoryview(buffer)
+    remaining = count
+    while remaining > 0:
+        read = fileObject.readinto(view[:min(remaining, len(buffer))])
+        if not read:
+            raise ConnectionError("File ended with " + str(remaining) + " bytes left to stream.")
+        theSocket.sendall(view[:read])
+        remaining = remaining - read
+
+'''
+    recvFileStream(theSocket, filePath, size)
+        Receives exactly size raw bytes from the socket straight into a preallocated output file. The file is
+        memory-mapped one window at a time so resident memory stays bounded no matter how large it is.
+'''
+def recvFileStream(theSocket, filePath, size):
+    with open(filePath, "wb+") as outputFile:
+        outputFile.truncate(size) # Preallocate the full file so it can be mapped.
+
+        windowOffset = 0
+        while windowOffset < size:
+            windowSize = min(size - windowOffset, STREAM_WINDOW_SIZE)
+            with mmap.mmap(outputFile.fileno(), windowSize, offset = windowOffset) as mapped:
+                view = memoryview(mapped)
+                received = 0
+                try:
+                    while received < windowSize:
+                        count = theSocket.recv_into(view[received:], min(windowSize - received, STREAM_CHUNK_SIZE))
+                        if count == 0:
+                            raise ConnectionError("Connection closed with " + str(size - windowOffset - received) + " bytes outstanding.")
+                        received = received + count
+                finally:
+                    view.release() # The map cannot be closed while a view into it is still alive.
+            windowOffset = windowOffset + windowSize
+
+'''
+    recvRangeStream(theSocket, fileDescriptor, offset, length, progress)
+        Receives exactly length raw bytes from the socket and writes them into an open file starting at offset,
+        reusing a single buffer. If given, progress(received) is called after every write so the caller can
+        record completed parts of the range before the rest has arrived.
+'''
+def recvRangeStream(theSocket, fileDescriptor, offset, length, progress = None):
+    buffer = bytearray(min(max(length, 1), STREAM_CHUNK_SIZE))
+    view = memoryview(buffer)
+    received = 0
+    while received < length:
+        count = theSocket.recv_into(view, min(length - received, len(buffer)))
+        if count == 0:
+            raise ConnectionError("Connection closed with " + str(length - received) + " bytes outstanding.")
+        os.pwrite(fileDescriptor, view[:count], offset + received)
+        received = received + count
+        if progress: progress(received)
+
+'''
+    enableKeepalive(theSocket)
+        Turns on TCP keepalive so a connection to a host that vanished without closing it, such as one that lost
+        power or network, is reset after KEEPALIVE_IDLE plus KEEPALIVE_PROBES * KEEPALIVE_INTERVAL quiet seconds.
+'''
+def enableKeepalive(theSocket):
+    theSocket.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+    for option, value in (("TCP_KEEPIDLE", KEEPALIVE_IDLE), ("TCP_KEEPINTVL", KEEPALIVE_INTERVAL), ("TCP_KEEPCNT", KEEPALIVE_PROBES)):
+        if hasattr(socket, option): theSocket.setsockopt(socket.IPPROTO_TCP, getattr(socket, option), value) # Not every platform has them.
+
+# ======================================================================================================================== #
+# Connection Pooling
+# ======================================================================================================================== #
+
+'''
+    ConnectionPool(connectFunction, maxIdle)
+        Keeps connections open once they have been used so later requests to the same address skip the TCP
+        handshake. connectFunction(address) opens a new connection whenever no idle one is available.
+
+        with pool.connection(address) as connection:
+            ..
+'''
+class ConnectionPool:
+    def __init__(self, connectFunction, maxIdle = POOL_MAX_IDLE):
+        self.connectFunction = connectFunction
+        self.maxIdle = maxIdle
+        self.lock = threading.Lock()
+        self.idle = {} # Address -> list of idle connections, most recently used last.
+
+    '''
+        acquire(address)
+            Returns an idle connection to the address if there is one, otherwise opens a new connection.
+            The second value is True if the connection was reused, since the other side may have closed it since.
+    '''
+    def acquire(self, address):
+        with self.lock:
+            connections = self.idle.get(address)
+            if connections: return connections.pop(), True
+        return self.connectFunction(address), False
+
+    '''
+        release(address, connection)
+            Returns a connection to the pool. It must have no request left awaiting a reply.
+    '''
+    def release(self, address, connection):
+        with self.lock:
+            connections = self.idle.setdefault(address, [])
+            if len(connections) < self.maxIdle:
+                connections.append(connection)
+                return
+        connection.close()
+
+    @contextmanager
+    def connection(self, address):
+        connection, reused = self.acquire(address)
+        try:
+            yield connection
+        except BaseException:
+            connection.close() # The connection may be part way through a reply, never reuse it.
+            raise
+        self.release(address, connection)
+
+    def close(self):
+        with self.lock:
+            idle = self.idle
+            self.idle = {}
+        for connections in idle.values():
+            for connection in connections: connection.close()
@@ -0,0 +1,634 @@
+'''
+    @author  Skully (https://github.com/ImSkully)
+    @website https://skully.tech
+    @email   contact@skully.tech
+    @updated 13/12/21
+
+    A simple peer-to-peer file sharing torrenting network with encrypted payload transportation
+    and support for multiple clients over sockets with multi-threading.
+'''
+
+import os
+import hashlib
+import socket
+import random
+import struct
+import threading
+import time
+import shared
+from concurrent.futures import ThreadPoolExecutor
+from manifest import Manifest, MANIFEST_NAME, loadManifest, createManifest
+from scheduler import UploadScheduler
+
+# ======================================================================================================================== #
+# Swarm Variable Definitions
+# ======================================================================================================================== #
+
+PIPELINE_DEPTH = 8 # Number of piece requests kept in flight on every peer connection.
+PEER_TIMEOUT = 10 # Seconds to wait on a peer before giving up on it.
+PEER_IDLE_TIMEOUT = 120 # Seconds a peer may keep a connection to the peer server open without sending a request.
+MAX_BAD_PIECES = 3 # Number of pieces failing verification before a peer is dropped.
+HASH_THREADS = os.cpu_count() or 1 # Threads used to hash a full file when a peer first asks for its manifest.
+
+HAVE_HEADER = struct.Struct("!QI") # MSG_HAVE payload header: file size, piece size. Followed by the bitfield.
+PIECE_HEADER = struct.Struct("!I") # MSG_PIECE payload header: piece index. Followed by the piece bytes.
+PARTIAL_EXTENSION = ".part" # Appended to the name of a file while it is being downloaded.
+STATE_EXTENSION = ".part.bitfield" # Appended to the name of a file for the record of its downloaded pieces.
+STATE_MAGIC = b"P2BF"
+STATE_HEADER = struct.Struct("!4sQI32s") # Bitfield file header: magic, file size, piece size, identity digest. Followed by the bitfield.
+
+# ======================================================================================================================== #
+# Piece Bitfield
+# ======================================================================================================================== #
+
+'''
+    Bitfield(pieceCount, data)
+        Compact record of which pieces of a file are held, one bit per piece.
+'''
+class Bitfield:
+    def __init__(self, pieceCount, data = None):
+        self.pieceCount = pieceCount
+        self.data = bytearray(data) if data is not None else bytearray((pieceCount + 7) // 8)
+
+    @classmethod
+    def full(cls, pieceCount):
+        bitfield = cls(pieceCount, b"\xff" * ((pieceCount + 7) // 8))
+        if pieceCount & 7: bitfield.data[-1] = (0xff << (8 - (pieceCount & 7))) & 0xff # Clear the unused trailing bits.
+        return bitfield
+
+    def set(self, index):
+        self.data[index >> 3] |= 0x80 >> (index & 7)
+
+    def has(self, index):
+        return bool(self.data[index >> 3] & (0x80 >> (index & 7)))
+
+    def count(self):
+        return sum(bin(byte).count("1") for byte in self.data)
+
+    def isComplete(self):
+        return self.count() == self.pieceCount
+
+    def toBytes(self):
+        return bytes(self.data)
+
+'''
+    getPieceCount(fileSize, pieceSize)
+        Returns the number of pieces a file of the given size is split into.
+'''
+def getPieceCount(fileSize, pieceSize):
+    return (fileSize + pieceSize - 1) // pieceSize
+
+'''
+    isSafeFileName(fileName)
+        Peers may only request plain file names, never paths outside of the client's directory.
+'''
+def isSafeFileName(fileName):
+    return bool(fileName) and fileName == os.path.basename(fileName) and fileName not in (".", "..")
+
+'''
+    connectPeer(address)
+        Opens a new connection to a peer's piece server, used as the connect function of a peer ConnectionPool.
+'''
+def connectPeer(address):
+    peerSocket = socket.create_connection(address, timeout = PEER_TIMEOUT)
+    peerSocket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1) # Piece requests are small, send them immediately.
+    return peerSocket
+
+# ======================================================================================================================== #
+# Partial Files
+# ======================================================================================================================== #
+
+'''
+    PartialFile(filePath, fileSize, pieceSize, identity, chunkSizes)
+        A download in progress, kept on disk so it can be resumed after the client or its connection dies.
+        Pieces are written into a preallocated "<file>.part" and every completed piece is recorded in a bitfield
+        file beside it, "<file>.part.bitfield", one bit per piece after a small header:
+
+        STATE_HEADER = (
+            magic,      4 bytes  - STATE_MAGIC
+            fileSize,   8 bytes
+            pieceSize,  4 bytes
+            identity,   32 bytes - SHA-256 of a string naming the exact version of the file, such as its root hash.
+        )
+
+        Pieces are pieceSize bytes each but the last, or the given chunkSizes for a manifest of content-defined
+        chunks. Opening a partial file picks up the pieces of an earlier download of the same version and starts
+        over if anything differs. A piece's bit is written only after its data, so a process that is killed never records
+        a piece it did not write; without an fsync the record is not guaranteed to survive a power loss.
+
+        partialFile = PartialFile("7000/file.mp3", fileSize, pieceSize, manifest.root)
+        for index in partialFile.getMissingPieces(): ..
+            os.pwrite(partialFile.fileDescriptor, pieceData, index * pieceSize)
+            partialFile.markComplete(index)
+        partialFile.finish()
+'''
+class PartialFile:
+    def __init__(self, filePath, fileSize, pieceSize, identity, chunkSizes = None):
+        self.filePath = filePath
+        self.partialPath = filePath + PARTIAL_EXTENSION
+        self.statePath = filePath + STATE_EXTENSION
+        self.fileSize = fileSize
+        self.pieceSize = pieceSize
+        self.pieceCount = len(chunkSizes) if chunkSizes is not None else getPieceCount(fileSize, pieceSize)
+        self.chunkSizes = chunkSizes
+        self.chunkOffsets = None
+        if chunkSizes is not None:
+            self.chunkOffsets = [0]
+            for chunkSize in chunkSizes: self.chunkOffsets.append(self.chunkOffsets[-1] + chunkSize)
+        self.identity = identity
+        self.header = STATE_HEADER.pack(STATE_MAGIC, fileSize, pieceSize, hashlib.sha256(identity.encode()).digest())
+
+        self.bitfield = self.loadBitfield()
+        self.resumed = self.bitfield is not None
+        if not self.resumed:
+            self.bitfield = Bitfield(self.pieceCount)
+            with open(self.statePath, "wb") as stateFile: # Record an empty bitfield before any piece is written.
+                stateFile.write(self.header + self.bitfield.toBytes())
+        self.fileDescriptor = os.open(self.partialPath, os.O_RDWR | os.O_CREAT)
+        if not self.resumed: os.ftruncate(self.fileDescriptor, fileSize) # Preallocate so pieces can be written at their offsets.
+        self.stateDescriptor = os.open(self.statePath, os.O_RDWR)
+
+    '''
+        loadBitfield()
+            Returns the recorded bitfield of an earlier download of the same file version, or None.
+    '''
+    def loadBitfield(self):
+        try:
+            with open(self.statePath, "rb") as stateFile:
+                state = stateFile.read()
+            if os.path.getsize(self.partialPath) != self.fileSize: return None
+        except OSError:
+            return None
+        if state[:STATE_HEADER.size] != self.header or len(state) != STATE_HEADER.size + (self.pieceCount + 7) // 8: return None
+        return Bitfield(self.pieceCount, state[STATE_HEADER.size:])
+
+    '''
+        markComplete(index)
+            Records a piece whose data has been written, rewriting only the byte of the bitfield holding its bit.
+            Callers completing pieces from several threads must hold a lock around it.
+    '''
+    def markComplete(self, index):
+        self.bitfield.set(index)
+        os.pwrite(self.stateDescriptor, self.bitfield.data[index >> 3:(index >> 3) + 1], STATE_HEADER.size + (index >> 3))
+
+    def getMissingPieces(self):
+        return [index for index in range(self.pieceCount) if not self.bitfield.has(index)]
+
+    def getPieceRange(self, index):
+        if self.chunkOffsets is not None: return self.chunkOffsets[index], self.chunkSizes[index]
+        offset = index * self.pieceSize
+        return offset, min(self.pieceSize, self.fileSize - offset)
+
+    def getCompletedBytes(self):
+        return sum(self.getPieceRange(index)[1] for index in range(self.pieceCount) if self.bitfield.has(index))
+
+    '''
+        getMissingRanges()
+            Returns the (offset, length) byte ranges of every run of consecutive missing pieces.
+    '''
+    def getMissingRanges(self):
+        ranges = []
+        for index in self.getMissingPieces():
+            offset, length = self.getPieceRange(index)
+            if ranges and ranges[-1][0] + ranges[-1][1] == offset: ranges[-1] = (ranges[-1][0], ranges[-1][1] + length)
+            else: ranges.append((offset, length))
+        return ranges
+
+    '''
+        close()
+            Closes the partial file, leaving it and its bitfield on disk for a later download to resume.
+    '''
+    def close(self):
+        if self.fileDescriptor is None: return
+        os.close(self.fileDescriptor)
+        os.close(self.stateDescriptor)
+        self.fileDescriptor = self.stateDescriptor = None
+
+    '''
+        finish()
+            Moves the completed file to its final name and removes the bitfield.
+    '''
+    def finish(self):
+        self.close()
+        os.replace(self.partialPath, self.filePath)
+        os.remove(self.statePath)
+
+    def discard(self):
+        self.close()
+        for path in (self.partialPath, self.statePath):
+            if os.path.exists(path): os.remove(path)
+
+# ======================================================================================================================== #
+# Peer Serving
+# ======================================================================================================================== #
+
+'''
+    PeerServer(directory, host, scheduler, chunkStore)
+        Listens for other peers and serves pieces of the files held in the client's directory, including the
+        completed pieces of any download that is still in progress. With a ChunkStore, files that were split
+        into it are served from their chunks even once the full file is gone. Pieces are paced by an
+        UploadScheduler, by default one with the shared.PEER_UPLOAD_* limits.
+'''
+class PeerServer:
+    def __init__(self, directory, host = "localhost", scheduler = None, chunkStore = None):
+        self.directory = directory
+        self.chunkStore = chunkStore
+        self.scheduler = scheduler or UploadScheduler(shared.PEER_UPLOAD_RATE, shared.PEER_UPLOAD_RATE_PER_PEER, shared.PEER_UPLOAD_SLOTS)
+        self.partialFiles = {} # File name -> (partial file path, Manifest, Bitfield) of running downloads.
+        self.manifests = {} # File name -> (file size, modified time, Manifest) of full files already hashed.
+        self.lock = threading.Lock()
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.socket.bind((host, 0)) # Let the operating system pick a free port.
+        self.address = self.socket.getsockname()
+
+    def start(self):
+        self.socket.listen(shared.PEER_BACKLOG)
+        threading.Thread(target = self.acceptPeers, daemon = True).start()
+
+    def close(self):
+        self.socket.close()
+
+    def addPartialFile(self, fileName, filePath, manifest, bitfield):
+        with self.lock:
+            self.partialFiles[fileName] = (filePath, manifest, bitfield)
+
+    def removePartialFile(self, fileName):
+        with self.lock:
+            self.partialFiles.pop(fileName, None)
+
+    def acceptPeers(self):
+        while True:
+            try:
+                peerSocket, peerAddress = self.socket.accept()
+            except OSError:
+                return # Listener was closed.
+            threading.Thread(target = self.handlePeer, args = (peerSocket, peerAddress), daemon = True).start()
+
+    '''
+        getPieceSource(fileName)
+            Returns a (file path, Manifest, Bitfield) tuple describing what can be served for a file. The file path
+            is None for a file only held in the chunk store.
+    '''
+    def getPieceSource(self, fileName):
+        with self.lock:
+            if fileName in self.partialFiles: return self.partialFiles[fileName]
+
+        filePath = os.path.join(self.directory, fileName)
+        if not isSafeFileName(fileName): return None
+        if not os.path.isfile(filePath): return self.getStoredSource(fileName)
+        manifest = self.getManifest(fileName, filePath)
+        return filePath, manifest, Bitfield.full(len(manifest.pieces))
+
+    def getStoredSource(self, fileName):
+        if not self.chunkStore: return None
+        manifest = loadManifest(os.path.join(self.directory, "raw", fileName, MANIFEST_NAME))
+        if manifest is None or not manifest.isValid(): return None
+
+        bitfield = Bitfield(len(manifest.pieces))
+        for index, digest in enumerate(manifest.pieces):
+            if self.chunkStore.hasChunk(digest): bitfield.set(index)
+        return None, manifest, bitfield
+
+    '''
+        getManifest(fileName, filePath)
+            Returns the manifest of a full file, preferring the one written by /split and hashing the file otherwise.
+    '''
+    def getManifest(self, fileName, filePath):
+        fileStat = os.stat(filePath)
+        with self.lock:
+            cached = self.manifests.get(fileName)
+        if cached and cached[:2] == (fileStat.st_size, fileStat.st_mtime): return cached[2]
+
+        manifest = loadManifest(os.path.join(self.directory, "raw", fileName, MANIFEST_NAME))
+        if manifest is None or manifest.fileSize != fileStat.st_size or not manifest.isValid():
+            manifest = createManifest(filePath, shared.PIECE_SIZE, HASH_THREADS)
+        with self.lock:
+            self.manifests[fileName] = (fileStat.st_size, fileStat.st_mtime, manifest)
+        return manifest
+
+    def handlePeer(self, peerSocket, peerAddress):
+        openFiles = {} # Descriptors kept open for the lifetime of this connection.
+        peerSocket.settimeout(PEER_IDLE_TIMEOUT) # Pooled connections of peers that went away would otherwise hold a thread forever.
+        try:
+            while True:
+                frame = shared.recvFrame(peerSocket)
+                if frame is None: break
+                messageType, payload = frame
+                if messageType != shared.MSG_PEER_REQUEST: continue
+
+                request = payload.decode().split(" ", 2)
+                if request[0] == "have" and len(request) == 2:
+                    self.sendHave(peerSocket, request[1])
+                elif request[0] == "manifest" and len(request) == 2:
+                    self.sendManifest(peerSocket, request[1])
+                elif request[0] == "piece" and len(request) == 3:
+                    self.sendPiece(peerSocket, request[2], int(request[1]), openFiles)
+                else:
+                    shared.sendFrame(peerSocket, shared.MSG_RESPONSE, b"ERROR: Invalid peer request.")
+        except (shared.ProtocolError, OSError, ValueError) as e:
+            if shared.DEBUG:
+                print("[PEER] Dropping peer {}:{}".format(*peerAddress[:2]) + ": " + str(e))
+        finally:
+            for fileDescriptor in openFiles.values(): os.close(fileDescriptor)
+            self.scheduler.release(peerSocket)
+            peerSocket.close()
+
+    def sendHave(self, peerSocket, fileName):
+        source = self.getPieceSource(fileName)
+        if source is None:
+            shared.sendFrame(peerSocket, shared.MSG_RESPONSE, b"ERROR: File not available.")
+            return
+
+        filePath, manifest, bitfield = source
+        shared.sendFrame(peerSocket, shared.MSG_HAVE, HAVE_HEADER.pack(manifest.fileSize, manifest.pieceSize) + bitfield.toBytes())
+
+    def sendManifest(self, peerSocket, fileName):
+        source = self.getPieceSource(fileName)
+        if source is None:
+            shared.sendFrame(peerSocket, shared.MSG_RESPONSE, b"ERROR: File not available.")
+            return
+        shared.sendFrame(peerSocket, shared.MSG_MANIFEST, source[1].toBytes())
+
+    def sendPiece(self, peerSocket, fileName, index, openFiles):
+        source = self.getPieceSource(fileName)
+        if source is None or index >= source[2].pieceCount or not source[2].has(index):
+            shared.sendFrame(peerSocket, shared.MSG_RESPONSE, b"ERROR: Piece not available.")
+            return
+
+        filePath, manifest, bitfield = source
+        if filePath is None:
+            pieceData = self.chunkStore.readChunk(manifest.pieces[index])
+            if pieceData is None:
+                shared.sendFrame(peerSocket, shared.MSG_RESPONSE, b"ERROR: Piece not available.")
+                return
+        else:
+            if filePath not in openFiles: openFiles[filePath] = os.open(filePath, os.O_RDONLY)
+            offset, length = manifest.getPieceRange(index)
+            pieceData = os.pread(openFiles[filePath], length, offset)
+        if self.scheduler.enabled: self.scheduler.wait(peerSocket, len(pieceData))
+        shared.sendFrame(peerSocket, shared.MSG_PIECE, PIECE_HEADER.pack(index) + pieceData)
+
+# ======================================================================================================================== #
+# Swarm Downloading
+# ======================================================================================================================== #
+
+'''
+    PeerConnection(address, pool)
+        Connection to a single seeding peer along with the pieces it has and its measured throughput.
+        With a pool, an idle connection left open by an earlier download is reused where possible.
+'''
+class PeerConnection:
+    def __init__(self, address, pool = None):
+        self.address = address
+        self.pool = pool
+        self.socket = None
+        self.reusable = False # Set once no request is left awaiting a reply, so the socket can go back to the pool.
+        self.bitfield = None
+        self.fileSize = 0
+        self.pieceSize = 0
+        self.bytesReceived = 0
+        self.manifest = None
+        self.activeTime = 0.0 # Seconds spent receiving pieces from this peer.
+        self.badPieces = set() # Pieces from this peer that failed verification, never requested from it again.
+        self.requested = set() # Pieces this peer has been asked for and not yet answered.
+
+    def connect(self, fileName):
+        if self.pool:
+            self.socket, reused = self.pool.acquire(self.address)
+            try:
+                self.requestFileInfo(fileName)
+                return
+            except (OSError, shared.ProtocolError):
+                if not reused: raise
+                self.socket.close() # The peer closed the idle connection, open a fresh one.
+        self.socket = connectPeer(self.address)
+        self.requestFileInfo(fileName)
+
+    def requestFileInfo(self, fileName):
+        shared.sendFrame(self.socket, shared.MSG_PEER_REQUEST, ("have " + fileName).encode())
+        frame = shared.recvFrame(self.socket)
+        if frame is None or frame[0] != shared.MSG_HAVE:
+            raise ConnectionError("Peer does not have the file.")
+
+        self.fileSize, self.pieceSize = HAVE_HEADER.unpack_from(frame[1])
+        bitfieldData = frame[1][HAVE_HEADER.size:]
+
+        shared.sendFrame(self.socket, shared.MSG_PEER_REQUEST, ("manifest " + fileName).encode())
+        frame = shared.recvFrame(self.socket)
+        if frame is None or frame[0] != shared.MSG_MANIFEST:
+            raise ConnectionError("Peer did not send a manifest.")
+        self.manifest = Manifest.fromBytes(frame[1])
+        if not self.manifest.isValid() or (self.manifest.fileSize, self.manifest.pieceSize) != (self.fileSize, self.pieceSize):
+            raise ConnectionError("Peer sent an invalid manifest.")
+        if len(bitfieldData) != (len(self.manifest.pieces) + 7) // 8:
+            raise ConnectionError("Peer sent a bitfield that does not match its manifest.")
+        self.bitfield = Bitfield(len(self.manifest.pieces), bitfieldData)
+        self.reusable = True
+
+    def getThroughput(self):
+        if self.activeTime <= 0: return 0.0
+        return self.bytesReceived / self.activeTime
+
+    def close(self):
+        if not self.socket: return
+        if self.pool and self.reusable:
+            self.pool.release(self.address, self.socket)
+        else:
+            self.socket.close()
+        self.socket = None
+
+'''
+    SwarmDownload(fileName, peerAddresses, directory, peerServer, pool, chunkStore)
+        Downloads a file from every given peer at once. Pieces are scheduled rarest-first and, once every
+        remaining piece is already in flight, requested again from idle peers (endgame) so one slow peer
+        cannot hold up the end of the download. Peer connections are returned to the pool afterwards, if given.
+        Pieces are recorded in a PartialFile, so a download that was interrupted only fetches the pieces it lacks.
+        With a ChunkStore, pieces it already holds are copied from it instead of fetched, and every piece fetched
+        is added to it.
+'''
+class SwarmDownload:
+    def __init__(self, fileName, peerAddresses, directory, peerServer = None, pool = None, chunkStore = None):
+        self.fileName = fileName
+        self.peerAddresses = peerAddresses
+        self.directory = directory
+        self.peerServer = peerServer
+        self.pool = pool
+        self.chunkStore = chunkStore
+        self.lock = threading.Lock()
+        self.peers = []
+        self.manifest = None
+        self.partialFile = None # PartialFile the pieces are written into.
+        self.completed = None # Bitfield of pieces written to disk.
+        self.resumedBytes = 0 # Bytes already on disk from an earlier, interrupted download.
+        self.storedBytes = 0 # Bytes copied from the chunk store rather than fetched.
+        self.pending = [] # Pieces not yet requested from anyone, rarest first.
+        self.inFlight = {} # Piece index -> number of peers currently asked for it.
+        self.fileDescriptor = None
+
+    '''
+        run()
+            Performs the download, returns True once the complete file is in the client's directory.
+    '''
+    def run(self):
+        for address in self.peerAddresses:
+            peer = PeerConnection(address, self.pool)
+            try:
+                peer.connect(self.fileName)
+                self.peers.append(peer)
+            except (OSError, shared.ProtocolError, ValueError, KeyError, struct.error) as e:
+                print("[CLIENT] Skipping peer {}:{}".format(*address) + ": " + str(e))
+                peer.close()
+
+        if not self.peers: return False
+
+        # Download the version of the file most peers agree on, identified by its manifest root hash.
+        roots = [peer.manifest.root for peer in self.peers]
+        self.manifest = max(self.peers, key = lambda peer: roots.count(peer.manifest.root)).manifest
+        for peer in self.peers:
+            if peer.manifest.root != self.manifest.root: peer.close()
+        self.peers = [peer for peer in self.peers if peer.manifest.root == self.manifest.root]
+        pieceCount = len(self.manifest.pieces)
+
+        # Order pieces by how many peers hold them, rarest first, breaking ties randomly to spread load.
+        availability = [0] * pieceCount
+        for peer in self.peers:
+            for index in range(pieceCount):
+                if peer.bitfield.has(index): availability[index] = availability[index] + 1
+        self.pending = [index for index in range(pieceCount) if availability[index] > 0]
+        random.shuffle(self.pending)
+        self.pending.sort(key = lambda index: availability[index])
+
+        # Pick up the pieces of an earlier, interrupted download of this version of the file, then the pieces the
+        # chunk store holds, such as those shared with another file.
+        self.partialFile = PartialFile(os.path.join(self.directory, self.fileName), self.manifest.fileSize, self.manifest.pieceSize, self.manifest.root, self.manifest.chunkSizes)
+        self.completed = self.partialFile.bitfield
+        self.fileDescriptor = self.partialFile.fileDescriptor
+        self.resumedBytes = self.partialFile.getCompletedBytes()
+        if self.chunkStore: self.storedBytes = self.copyStoredPieces()
+        self.pending = [index for index in self.pending if not self.completed.has(index)]
+        if len(self.pending) < pieceCount - self.completed.count():
+            print("[CLIENT] ERROR: No connected peer holds every piece of '" + self.fileName + "'.")
+            self.partialFile.close()
+            self.closePeers()
+            return False
+        if self.peerServer: self.peerServer.addPartialFile(self.fileName, self.partialFile.partialPath, self.manifest, self.completed)
+
+        try:
+            with ThreadPoolExecutor(max_workers = len(self.peers)) as executor:
+                for peer in self.peers: executor.submit(self.downloadFromPeer, peer)
+        finally:
+            self.partialFile.close()
+            self.closePeers()
+            if self.peerServer: self.peerServer.removePartialFile(self.fileName)
+
+        if not self.completed.isComplete(): return False
+        self.partialFile.finish()
+
+        # Keep the manifest so the file can be served and verified without hashing it again.
+        manifestDirectory = os.path.join(self.directory, "raw", self.fileName)
+        os.makedirs(manifestDirectory, exist_ok = True)
+        self.manifest.save(os.path.join(manifestDirectory, MANIFEST_NAME))
+        return True
+
+    def closePeers(self):
+        for peer in self.peers: peer.close()
+
+    '''
+        copyStoredPieces()
+            Writes every missing piece the chunk store holds into the partial file, returns the bytes copied.
+    '''
+    def copyStoredPieces(self):
+        copiedBytes = 0
+        for index in self.partialFile.getMissingPieces():
+            pieceData = self.chunkStore.readChunk(self.manifest.pieces[index])
+            if pieceData is None or not self.manifest.verifyPiece(index, pieceData): continue # Fetch it instead.
+            offset, length = self.manifest.getPieceRange(index)
+            os.pwrite(self.fileDescriptor, pieceData, offset)
+            self.partialFile.markComplete(index)
+            copiedBytes = copiedBytes + length
+        return copiedBytes
+
+    '''
+        pickPiece(peer)
+            Returns the next piece to request from the peer, or None if there is nothing left it can help with.
+    '''
+    def pickPiece(self, peer):
+        with self.lock:
+            for position, index in enumerate(self.pending):
+                if peer.bitfield.has(index) and index not in peer.badPieces:
+                    del self.pending[position]
+                    self.inFlight[index] = self.inFlight.get(index, 0) + 1
+                    return index
+
+            # Endgame: everything left is already in flight, duplicate a request that this peer has not made.
+            for index in self.inFlight:
+                if index not in peer.requested and index not in peer.badPieces and peer.bitfield.has(index) and not self.completed.has(index):
+                    self.inFlight[index] = self.inFlight[index] + 1
+                    return index
+            return None
+
+    def releasePiece(self, index, failed):
+        with self.lock:
+            self.inFlight[index] = self.inFlight[index] - 1
+            if self.inFlight[index] <= 0:
+                del self.inFlight[index]
+                if failed and not self.completed.has(index): self.pending.insert(0, index) # Retry it first.
+
+    def downloadFromPeer(self, peer):
+        outstanding = [] # Requests are answered in order, so responses match this queue front to back.
+        try:
+            while True:
+                while len(outstanding) < PIPELINE_DEPTH:
+                    index = self.pickPiece(peer)
+                    if index is None: break
+                    peer.reusable = False
+                    shared.sendFrame(peer.socket, shared.MSG_PEER_REQUEST, ("piece " + str(index) + " " + self.fileName).encode())
+                    outstanding.append(index)
+                    peer.requested.add(index)
+                if not outstanding: # Nothing left that this peer can provide.
+                    peer.reusable = True
+                    return
+
+                startTime = time.perf_counter()
+                frame = shared.recvFrame(peer.socket)
+                if frame is None: raise ConnectionError("Peer closed the connection.")
+                peer.activeTime = peer.activeTime + time.perf_counter() - startTime
+
+                index = outstanding.pop(0)
+                peer.requested.discard(index)
+                messageType, payload = frame
+                if messageType != shared.MSG_PIECE or PIECE_HEADER.unpack_from(payload)[0] != index:
+                    raise ConnectionError("Peer answered with an unexpected message.")
+
+                pieceData = memoryview(payload)[PIECE_HEADER.size:]
+                offset, length = self.manifest.getPieceRange(index)
+                if len(pieceData) != length:
+                    raise ConnectionError("Peer sent a piece of the wrong length.")
+
+                peer.bytesReceived = peer.bytesReceived + len(pieceData)
+                if not self.manifest.verifyPiece(index, pieceData): # Only this piece is fetched again.
+                    peer.badPieces.add(index)
+                    print("[CLIENT] Piece " + str(index) + " from {}:{}".format(*peer.address) + " failed verification, retrying it.")
+                    self.releasePiece(index, True)
+                    if len(peer.badPieces) >= MAX_BAD_PIECES: raise ConnectionError("Too many corrupt pieces.")
+                    continue
+
+                with self.lock:
+                    isNewPiece = not self.completed.has(index)
+                if isNewPiece: # In endgame another peer may have delivered this piece first.
+                    os.pwrite(self.fileDescriptor, pieceData, offset)
+                    with self.lock:
+                        self.partialFile.markComplete(index)
+                    if self.chunkStore: self.chunkStore.addChunk(self.manifest.pieces[index], pieceData)
+                self.releasePiece(index, False)
+        except (OSError, shared.ProtocolError, struct.error) as e:
+            print("[CLIENT] Lost peer {}:{}".format(*peer.address) + ": " + str(e))
+            for index in outstanding: self.releasePiece(index, True)
+
+    '''
+        getPeerStats()
+            Returns a list of (peer address, bytes received, throughput in bytes/s) for every peer used.
+    '''
+    def getPeerStats(self):
+        return [(peer.address, peer.bytesReceived, peer.getThroughput()) for peer in self.peers]
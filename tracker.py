@@ -0,0 +1,872 @@
+'''
+    @author  Skully (https://github.com/ImSkully)
+    @website https://skully.tech
+    @email   contact@skully.tech
+    @updated 13/12/21
+    
+    A simple peer-to-peer file sharing torrenting network with encrypted payload transportation
+    and support for multiple clients over sockets with multi-threading.
+'''
+
+import gc
+import os
+import time
+import zlib
+import array
+import bisect
+import pickle
+import socket
+import struct
+import threading
+import shared
+from collections import deque, Counter
+from itertools import repeat, compress, chain
+from multiprocessing.connection import Client, Listener
+
+# ======================================================================================================================== #
+# Tracker Index
+# ======================================================================================================================== #
+
+'''
+    TrackerIndex()
+        Inverted index of which peers hold which files, safe to share between client threads.
+
+        fileLookup = {
+            ["file_1.mp3"] = {(peerAddress), (peerAddress)},
+        }
+        peerFiles = {
+            [(peerAddress)] = {"file_1.mp3", "file_2.mp3"},
+        }
+        fileDetails = {
+            ["file_1.mp3"] = (fileSize, rootHash),
+        }
+        peerDetails = {
+            [(peerAddress)] = {"file_1.mp3"},
+        }
+
+        Both maps are updated together so looking up a file and dropping a peer only ever touch the entries
+        involved, regardless of how many peers and files the tracker holds. A file's size and root hash are set
+        by the first peer to announce them, every other peer announcing them must agree, and they are dropped
+        once no peer that announced them still holds the file.
+'''
+class TrackerIndex:
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.fileLookup = {} # File name -> set of peers holding it.
+        self.peerFiles = {} # Peer -> set of file names it holds.
+        self.servingAddresses = {} # Peer -> address its peer listener accepts piece requests on.
+        self.fileDetails = {} # File name -> (size, manifest root hash) as announced by its peers, if known.
+        self.peerDetails = {} # Peer -> names of the files it announced the details of.
+        self.detailCounts = {} # File name -> number of peers that announced its details.
+        self.leases = {} # Disconnected peer -> monotonic time its records are dropped unless it reconnects.
+        self.entryCount = 0 # Total number of (peer, file) records.
+        self.sortedNames = [] # Sorted file names used for prefix search, rebuilt lazily after changes.
+        self.sortedNamesDirty = False
+
+    def __len__(self):
+        return self.entryCount
+
+    def addPeer(self, peer):
+        with self.lock:
+            self.leases.pop(peer, None) # A reconnecting peer keeps the records it still holds.
+            if peer in self.peerFiles: return False
+            self.peerFiles[peer] = set()
+            return True
+
+    '''
+        releasePeer(peer, ttl)
+            Keeps a disconnected peer's records for ttl more seconds so it can reconnect without announcing again.
+    '''
+    def releasePeer(self, peer, ttl):
+        with self.lock:
+            if peer in self.peerFiles: self.leases[peer] = time.monotonic() + ttl
+
+    '''
+        leaseAllPeers(ttl)
+            Puts every known peer on a lease, used after reloading state since none of them are connected yet.
+    '''
+    def leaseAllPeers(self, ttl):
+        with self.lock:
+            expiry = time.monotonic() + ttl
+            for peer in self.peerFiles: self.leases[peer] = expiry
+
+    '''
+        expirePeers()
+            Drops every peer whose lease has run out, returns the number of peers dropped.
+    '''
+    def expirePeers(self):
+        with self.lock:
+            now = time.monotonic()
+            expired = [peer for peer, expiry in self.leases.items() if expiry <= now]
+            for peer in expired: self.removePeer(peer)
+            return len(expired)
+
+    def hasPeer(self, peer):
+        return peer in self.peerFiles
+
+    def setServingAddress(self, peer, address):
+        with self.lock:
+            self.servingAddresses[peer] = address
+
+    '''
+        getServingAddress(peer)
+            Returns the address other peers should download from, falling back to the peer's own address.
+    '''
+    def getServingAddress(self, peer):
+        return self.servingAddresses.get(peer, peer)
+
+    '''
+        removePeer(peer)
+            Drops a peer and every file record it holds, returns the number of records removed.
+    '''
+    def removePeer(self, peer):
+        with self.lock:
+            self.leases.pop(peer, None)
+            self.servingAddresses.pop(peer, None)
+            fileNames = self.peerFiles.pop(peer, None)
+            if fileNames is None: return 0
+
+            for fileName in self.peerDetails.pop(peer, ()): self.releaseDetails(fileName)
+            for fileName in fileNames:
+                holders = self.fileLookup[fileName]
+                holders.discard(peer)
+                if not holders:
+                    del self.fileLookup[fileName]
+                    self.sortedNamesDirty = True
+            self.entryCount = self.entryCount - len(fileNames)
+            return len(fileNames)
+
+    '''
+        addFile(peer, fileName)
+            Records that the peer holds the file, returns False if it was already recorded.
+    '''
+    def addFile(self, peer, fileName):
+        with self.lock:
+            fileNames = self.peerFiles.setdefault(peer, set())
+            if fileName in fileNames: return False
+
+            fileNames.add(fileName)
+            holders = self.fileLookup.get(fileName)
+            if holders is None:
+                holders = self.fileLookup[fileName] = set()
+                self.sortedNamesDirty = True
+            holders.add(peer)
+            self.entryCount = self.entryCount + 1
+            return True
+
+    '''
+        addFiles(peer, files)
+            Records a batch of (fileName, fileSize, rootHash) entries for the peer under a single lock hold, so
+            other threads see either none or all of the batch. Size and root hash may be None if not known.
+            Returns the number of records that were new. Raises ValueError, recording nothing, if another peer
+            announced different details for one of the files.
+    '''
+    def addFiles(self, peer, files):
+        with self.lock:
+            announced = self.peerDetails.get(peer, ())
+            for fileName, fileSize, rootHash in files:
+                details = self.fileDetails.get(fileName)
+                if fileSize is None or details is None or details == (fileSize, rootHash): continue
+                if self.detailCounts[fileName] > (fileName in announced): # Only the peer's own details may be replaced.
+                    raise ValueError("'" + fileName + "' is already tracked with a different size or root hash.")
+            return self.recordFiles(peer, files)
+
+    '''
+        recordFiles(peer, files)
+            Records a batch like addFiles without checking it, details that differ replace the file's own.
+            Used to apply changes that were already checked, such as when replaying the log.
+    '''
+    def recordFiles(self, peer, files):
+        with self.lock:
+            fileNames = self.peerFiles.setdefault(peer, set())
+            announced = self.peerDetails.setdefault(peer, set())
+            added = 0
+            for fileName, fileSize, rootHash in files:
+                if fileSize is not None:
+                    details = (fileSize, rootHash)
+                    if self.fileDetails.setdefault(fileName, details) != details: self.replaceDetails(peer, fileName, details)
+                    if fileName not in announced:
+                        announced.add(fileName)
+                        self.detailCounts[fileName] = self.detailCounts.get(fileName, 0) + 1
+                if fileName in fileNames: continue
+
+                fileNames.add(fileName)
+                holders = self.fileLookup.get(fileName)
+                if holders is None:
+                    holders = self.fileLookup[fileName] = set()
+                    self.sortedNamesDirty = True
+                holders.add(peer)
+                added = added + 1
+            self.entryCount = self.entryCount + added
+            return added
+
+    def removeFile(self, peer, fileName):
+        with self.lock:
+            fileNames = self.peerFiles.get(peer)
+            if not fileNames or fileName not in fileNames: return False
+
+            fileNames.discard(fileName)
+            announced = self.peerDetails.get(peer)
+            if announced and fileName in announced:
+                announced.discard(fileName)
+                self.releaseDetails(fileName)
+            holders = self.fileLookup[fileName]
+            holders.discard(peer)
+            if not holders:
+                del self.fileLookup[fileName]
+                self.sortedNamesDirty = True
+            self.entryCount = self.entryCount - 1
+            return True
+
+    '''
+        replaceDetails(peer, fileName, details)
+            Replaces the file's (size, root hash) details with the ones the peer announced, forgetting every
+            other peer that announced the old ones.
+    '''
+    def replaceDetails(self, peer, fileName, details):
+        for otherPeer, otherNames in self.peerDetails.items():
+            if otherPeer != peer: otherNames.discard(fileName)
+        self.fileDetails[fileName] = details
+        self.detailCounts[fileName] = 1 if fileName in self.peerDetails[peer] else 0
+
+    '''
+        releaseDetails(fileName)
+            Drops one peer's announcement of the file's details, and the details once no announcement is left.
+    '''
+    def releaseDetails(self, fileName):
+        count = self.detailCounts[fileName] - 1
+        if count:
+            self.detailCounts[fileName] = count
+        else:
+            del self.detailCounts[fileName]
+            del self.fileDetails[fileName]
+
+    '''
+        findPeers(fileName)
+            Returns a list of every peer holding the file.
+    '''
+    def findPeers(self, fileName):
+        with self.lock:
+            return list(self.fileLookup.get(fileName, ()))
+
+    '''
+        findFiles(fileNames)
+            Looks up a batch of files at once, returns a list of (fileName, fileSize, rootHash, serving addresses)
+            tuples in the same order. Unknown files have no addresses, unknown sizes and hashes are None.
+    '''
+    def findFiles(self, fileNames):
+        with self.lock:
+            results = []
+            for fileName in fileNames:
+                fileSize, rootHash = self.fileDetails.get(fileName, (None, None))
+                holders = self.fileLookup.get(fileName, ())
+                results.append((fileName, fileSize, rootHash, [self.servingAddresses.get(peer, peer) for peer in holders]))
+            return results
+
+    def getPeerFiles(self, peer):
+        with self.lock:
+            return list(self.peerFiles.get(peer, ()))
+
+    '''
+        searchPrefix(prefix, limit)
+            Returns up to limit file names starting with the prefix, in sorted order.
+    '''
+    def searchPrefix(self, prefix, limit = 50):
+        with self.lock:
+            if self.sortedNamesDirty:
+                self.sortedNames = sorted(self.fileLookup)
+                self.sortedNamesDirty = False
+
+            results = []
+            position = bisect.bisect_left(self.sortedNames, prefix)
+            while position < len(self.sortedNames) and len(results) < limit:
+                fileName = self.sortedNames[position]
+                if not fileName.startswith(prefix): break
+                results.append(fileName)
+                position = position + 1
+            return results
+
+    '''
+        searchSubstring(term, limit)
+            Returns up to limit file names containing the term, scanning distinct names only.
+    '''
+    def searchSubstring(self, term, limit = 50):
+        with self.lock:
+            results = []
+            for fileName in self.fileLookup:
+                if term in fileName:
+                    results.append(fileName)
+                    if len(results) >= limit: break
+            return results
+
+# ======================================================================================================================== #
+# Tracker Persistence
+# ======================================================================================================================== #
+
+'''
+[stateDirectory]
+    > tracker.snapshot (compact copy of the whole index, rewritten periodically)
+    > tracker.log (every change made since the snapshot, appended as it happens)
+    > tracker.log.old (the changes of a snapshot still being written, removed once it is on disk)
+'''
+
+SNAPSHOT_NAME = "tracker.snapshot"
+LOG_NAME = "tracker.log"
+ROTATED_LOG_NAME = "tracker.log.old"
+SNAPSHOT_INTERVAL = 300 # Seconds between snapshots while the log has changes in it.
+SNAPSHOT_LOG_SIZE = 67108864 # Log size in bytes that triggers a snapshot early.
+LOG_FSYNC = False # Flush every log record to disk before replying, survives power loss at the cost of throughput.
+
+'''
+    SNAPSHOT_HEADER = (
+        magic,      4 bytes - SNAPSHOT_MAGIC
+        version,    4 bytes - SNAPSHOT_VERSION
+        checksum,   4 bytes - CRC-32 of every byte after the header.
+    )
+    Followed by sections, each an 8 byte length and that many bytes, in this order:
+        names       - Every file name in sorted order, newline separated.
+        sizes       - Announced size of every name as signed 64-bit integers, -1 if unknown.
+        roots       - Announced root hash of every name, newline separated, empty if unknown.
+        peers       - Every peer as host:port, newline separated.
+        serving     - Serving address of every peer as host:port, newline separated, empty if not set.
+        counts      - Number of files held by every peer as unsigned 32-bit integers.
+        files       - Name indices of the files held by every peer in turn, unsigned 32-bit integers.
+        announced   - A byte for every file in files, 1 if the peer announced the file's size and root hash.
+    Version 1 snapshots have no announced section, every holder of a file with details counts as announcing them.
+'''
+SNAPSHOT_HEADER = struct.Struct("!4sII")
+SNAPSHOT_MAGIC = b"P2TS"
+SNAPSHOT_VERSION = 2
+SECTION_HEADER = struct.Struct("!Q")
+
+'''
+    LOG_HEADER = (operation, length, checksum)
+        Every log record is a header followed by a newline separated payload, starting with the peer as host:port.
+'''
+LOG_HEADER = struct.Struct("!BII")
+LOG_ADD_FILES = 1 # Followed by "<file name>\t<file size>\t<root hash>" lines, size and hash empty if unknown.
+LOG_REMOVE_FILE = 2 # Followed by the file name.
+LOG_REMOVE_PEER = 3
+LOG_SERVE = 4 # Followed by the serving address as host:port.
+
+def formatAddress(address):
+    return "{}:{}".format(*address)
+
+def parseAddress(address):
+    host, port = address.rsplit(":", 1)
+    return (host, int(port))
+
+'''
+    captureSnapshot(index)
+        Copies what a snapshot holds out of the index, only references and no encoding, so it is quick enough to
+        take while the index lock is held. Returns the state encodeSnapshot turns into a snapshot.
+'''
+def captureSnapshot(index):
+    with index.lock:
+        names = list(index.fileLookup) if index.sortedNamesDirty else index.sortedNames # Sorted names are replaced, never changed.
+        peerFiles = {peer: list(fileNames) for peer, fileNames in index.peerFiles.items()}
+        peerDetails = {peer: list(fileNames) for peer, fileNames in index.peerDetails.items() if fileNames}
+        return names, index.sortedNamesDirty, dict(index.fileDetails), peerFiles, dict(index.servingAddresses), peerDetails
+
+'''
+    encodeSnapshot(state)
+        Returns the state captured by captureSnapshot in the snapshot format described above, header included.
+'''
+def encodeSnapshot(state):
+    names, namesUnsorted, fileDetails, peerFiles, servingAddresses, peerDetails = state
+    if namesUnsorted: names = sorted(names)
+    nameIndices = {fileName: position for position, fileName in enumerate(names)}
+    peers = list(peerFiles)
+
+    sizes = array.array("q", [fileDetails.get(fileName, (-1, None))[0] for fileName in names])
+    roots = [fileDetails.get(fileName, (-1, None))[1] or "" for fileName in names]
+    counts = array.array("I", [len(peerFiles[peer]) for peer in peers])
+    fileIndices = array.array("I")
+    for peer in peers: fileIndices.extend(map(nameIndices.__getitem__, peerFiles[peer]))
+    serving = [formatAddress(servingAddresses[peer]) if peer in servingAddresses else "" for peer in peers]
+    announced = bytearray()
+    for peer in peers:
+        announcedNames = set(peerDetails.get(peer, ()))
+        announced += bytes(fileName in announcedNames for fileName in peerFiles[peer])
+
+    body = bytearray()
+    for section in ("\n".join(names).encode(), sizes.tobytes(), "\n".join(roots).encode(), "\n".join(map(formatAddress, peers)).encode(),
+                    "\n".join(serving).encode(), counts.tobytes(), fileIndices.tobytes(), announced):
+        body += SECTION_HEADER.pack(len(section))
+        body += section
+    return SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, zlib.crc32(body)) + body
+
+'''
+    decodeSnapshot(index, snapshot, source)
+        Rebuilds an empty index from a snapshot in bulk, source names where it came from in errors.
+'''
+def decodeSnapshot(index, snapshot, source):
+    magic, version, checksum = SNAPSHOT_HEADER.unpack_from(snapshot)
+    if magic != SNAPSHOT_MAGIC or version not in (1, SNAPSHOT_VERSION) or zlib.crc32(snapshot[SNAPSHOT_HEADER.size:]) != checksum:
+        raise ValueError("Tracker snapshot '" + source + "' is corrupt.")
+
+    sections = []
+    offset = SNAPSHOT_HEADER.size
+    while offset < len(snapshot):
+        length = SECTION_HEADER.unpack_from(snapshot, offset)[0]
+        offset = offset + SECTION_HEADER.size
+        sections.append(snapshot[offset:offset + length])
+        offset = offset + length
+    if version == 1: sections.append(None)
+    if len(sections) != 8: raise ValueError("Tracker snapshot '" + source + "' is corrupt.")
+    nameData, sizeData, rootData, peerData, servingData, countData, fileData, announcedData = sections
+
+    names = str(nameData, "utf-8").split("\n") if len(nameData) else []
+    sizes = array.array("q")
+    sizes.frombytes(sizeData)
+    roots = [rootHash or None for rootHash in str(rootData, "utf-8").split("\n")] if names else []
+    peers = [parseAddress(peer) for peer in str(peerData, "utf-8").split("\n")] if len(peerData) else []
+    counts = array.array("I")
+    counts.frombytes(countData)
+    fileIndices = array.array("I")
+    fileIndices.frombytes(fileData)
+    if announcedData is None: # Version 1.
+        hasDetails = bytes(size >= 0 for size in sizes)
+        announcedData = bytes(map(hasDetails.__getitem__, fileIndices))
+    if len(sizes) != len(names) or len(roots) != len(names) or len(counts) != len(peers) or sum(counts) != len(fileIndices) or len(announcedData) != len(fileIndices):
+        raise ValueError("Tracker snapshot '" + source + "' is corrupt.")
+
+    # Build the maps with C level loops where possible, this is what keeps reloading millions of entries fast.
+    # The garbage collector is paused meanwhile since none of these objects can form a cycle, otherwise it
+    # rescans the growing index over and over as millions of sets are allocated.
+    gcEnabled = gc.isenabled()
+    gc.disable()
+    try:
+        index.fileLookup = {fileName: set() for fileName in names}
+        index.fileDetails = {fileName: (fileSize, rootHash) for fileName, fileSize, rootHash in zip(names, sizes, roots) if fileSize >= 0}
+        offset = 0
+        for peer, count in zip(peers, counts):
+            peerNames = list(map(names.__getitem__, fileIndices[offset:offset + count]))
+            index.peerFiles[peer] = set(peerNames)
+            deque(map(set.add, map(index.fileLookup.__getitem__, peerNames), repeat(peer)), maxlen = 0) # Add the peer to every holder set.
+            announcedNames = set(compress(peerNames, announcedData[offset:offset + count]))
+            if announcedNames: index.peerDetails[peer] = announcedNames
+            offset = offset + count
+        index.detailCounts = dict(Counter(chain.from_iterable(index.peerDetails.values())))
+        for peer, serving in zip(peers, str(servingData, "utf-8").split("\n")):
+            if serving: index.servingAddresses[peer] = parseAddress(serving)
+    finally:
+        if gcEnabled: gc.enable()
+
+    index.entryCount = len(fileIndices)
+    index.sortedNames = names # Names are stored sorted, prefix search can use them as they are.
+    index.sortedNamesDirty = False
+
+'''
+    PersistentTrackerIndex(directory)
+        TrackerIndex that survives restarts. Every change is appended to a log as it is made and the whole index
+        is periodically written out as a compact snapshot, after which the log starts over. On startup the
+        snapshot is loaded in bulk and only the changes logged since then are replayed. Log records set or clear
+        entries, so replaying records the snapshot already holds leaves the index as it was.
+'''
+class PersistentTrackerIndex(TrackerIndex):
+    def __init__(self, directory):
+        super().__init__()
+        self.directory = directory
+        self.snapshotPath = os.path.join(directory, SNAPSHOT_NAME)
+        self.logPath = os.path.join(directory, LOG_NAME)
+        self.rotatedLogPath = os.path.join(directory, ROTATED_LOG_NAME)
+        self.logFile = None # Records are only written once loading has finished.
+        self.lastSnapshot = time.monotonic()
+        self.snapshotLock = threading.Lock() # One snapshot is written at a time.
+
+        os.makedirs(directory, exist_ok = True)
+        self.loadSnapshot()
+        self.logSize = self.replayLog(self.rotatedLogPath) + self.replayLog(self.logPath) # A snapshot that never made it to disk.
+        self.logFile = open(self.logPath, "ab", buffering = 0)
+
+    def addFile(self, peer, fileName):
+        with self.lock:
+            if not super().addFile(peer, fileName): return False
+            self.appendLog(LOG_ADD_FILES, formatAddress(peer) + "\n" + fileName + "\t\t")
+            return True
+
+    def addFiles(self, peer, files):
+        with self.lock:
+            added = super().addFiles(peer, files)
+            self.appendLog(LOG_ADD_FILES, formatAddress(peer) + "\n" + "\n".join(
+                fileName + "\t" + ("" if fileSize is None else str(fileSize)) + "\t" + (rootHash or "") for fileName, fileSize, rootHash in files
+            ))
+            return added
+
+    def removeFile(self, peer, fileName):
+        with self.lock:
+            if not super().removeFile(peer, fileName): return False
+            self.appendLog(LOG_REMOVE_FILE, formatAddress(peer) + "\n" + fileName)
+            return True
+
+    def removePeer(self, peer):
+        with self.lock:
+            known = peer in self.peerFiles
+            removed = super().removePeer(peer)
+            if known: self.appendLog(LOG_REMOVE_PEER, formatAddress(peer))
+            return removed
+
+    def setServingAddress(self, peer, address):
+        with self.lock:
+            super().setServingAddress(peer, address)
+            self.appendLog(LOG_SERVE, formatAddress(peer) + "\n" + formatAddress(address))
+
+    def appendLog(self, operation, payload):
+        if self.logFile is None: return # Replaying the log, the record is already in it, or already closed.
+        payload = payload.encode()
+        self.logFile.write(LOG_HEADER.pack(operation, len(payload), zlib.crc32(payload)) + payload)
+        if LOG_FSYNC: os.fsync(self.logFile.fileno())
+        self.logSize = self.logSize + LOG_HEADER.size + len(payload)
+
+    '''
+        replayLog(logPath)
+            Applies every complete record in a log, returns the log size. A record torn by a crash part way
+            through writing it is cut off so new records are appended after the last good one.
+    '''
+    def replayLog(self, logPath):
+        if not os.path.exists(logPath): return 0
+        with open(logPath, "rb") as logFile:
+            log = logFile.read()
+
+        offset = 0
+        while offset + LOG_HEADER.size <= len(log):
+            operation, length, checksum = LOG_HEADER.unpack_from(log, offset)
+            payload = log[offset + LOG_HEADER.size:offset + LOG_HEADER.size + length]
+            if len(payload) != length or zlib.crc32(payload) != checksum: break
+            self.applyLogRecord(operation, payload.decode())
+            offset = offset + LOG_HEADER.size + length
+
+        if offset < len(log): os.truncate(logPath, offset)
+        return offset
+
+    def applyLogRecord(self, operation, payload):
+        peer, *fields = payload.split("\n")
+        peer = parseAddress(peer)
+        if operation == LOG_ADD_FILES:
+            files = []
+            for fileEntry in fields:
+                fileName, fileSize, rootHash = fileEntry.rsplit("\t", 2)
+                files.append((fileName, int(fileSize) if fileSize else None, rootHash or None))
+            super().recordFiles(peer, files) # Checked when it was logged, and replaying must reach the same state.
+        elif operation == LOG_REMOVE_FILE:
+            super().removeFile(peer, fields[0])
+        elif operation == LOG_REMOVE_PEER:
+            super().removePeer(peer)
+        elif operation == LOG_SERVE:
+            super().setServingAddress(peer, parseAddress(fields[0]))
+
+    '''
+        loadSnapshot()
+            Rebuilds the index from the snapshot in bulk. Returns False if there is no usable snapshot.
+    '''
+    def loadSnapshot(self):
+        try:
+            with open(self.snapshotPath, "rb") as snapshotFile:
+                snapshot = memoryview(snapshotFile.read())
+        except FileNotFoundError:
+            return False
+
+        decodeSnapshot(self, snapshot, self.snapshotPath)
+        return True
+
+    '''
+        snapshot()
+            Writes the whole index to a new snapshot and starts the log over. Only copying the index and rotating
+            the log hold the index lock, the snapshot is encoded, written and synced to disk while changes carry on
+            into the new log. The snapshot replaces the old one atomically and the rotated log is removed after it,
+            so a crash at any point leaves either the old snapshot and both logs or the new snapshot and new log.
+    '''
+    def snapshot(self):
+        with self.snapshotLock:
+            with self.lock:
+                state = captureSnapshot(self)
+                self.rotateLog()
+            snapshot = encodeSnapshot(state)
+
+            temporaryPath = self.snapshotPath + ".tmp"
+            with open(temporaryPath, "wb") as snapshotFile:
+                snapshotFile.write(snapshot)
+                snapshotFile.flush()
+                os.fsync(snapshotFile.fileno())
+            os.replace(temporaryPath, self.snapshotPath)
+            os.remove(self.rotatedLogPath) # Everything in it is now part of the snapshot.
+
+    '''
+        rotateLog()
+            Moves the log aside for the snapshot being taken and starts a new one. If an earlier snapshot failed to
+            reach the disk its rotated log is still needed, so the log is appended to it instead.
+    '''
+    def rotateLog(self):
+        self.logFile.close()
+        if os.path.exists(self.rotatedLogPath):
+            with open(self.logPath, "rb") as logFile, open(self.rotatedLogPath, "ab") as rotatedFile:
+                rotatedFile.write(logFile.read())
+                rotatedFile.flush()
+                os.fsync(rotatedFile.fileno())
+            os.truncate(self.logPath, 0)
+        else:
+            os.replace(self.logPath, self.rotatedLogPath)
+        self.logFile = open(self.logPath, "ab", buffering = 0)
+        self.logSize = 0
+        self.lastSnapshot = time.monotonic()
+
+    '''
+        snapshotIfDue()
+            Takes a snapshot once the log has grown large or has had changes in it for long enough.
+    '''
+    def snapshotIfDue(self):
+        if self.logSize >= SNAPSHOT_LOG_SIZE or (self.logSize > 0 and time.monotonic() - self.lastSnapshot >= SNAPSHOT_INTERVAL):
+            self.snapshot()
+            return True
+        return False
+
+    def close(self):
+        if self.logSize > 0 or os.path.exists(self.rotatedLogPath): self.snapshot()
+        with self.lock:
+            self.logFile.close()
+            self.logFile = None
+
+# ======================================================================================================================== #
+# Tracker Replication
+# ======================================================================================================================== #
+
+'''
+    When the server runs as several worker processes, the tracker lives in the parent process behind a
+    TrackerService and every worker keeps a ReplicatedTrackerIndex, a full copy of the index that answers
+    lookups locally and forwards changes to the service over a local socket.
+
+    Worker                                      TrackerService
+        > (method, args) ---------------------> applies the change to its index, which may be persisted
+                                                and streams (sequence, method, args) to every replica
+        < (result, sequence) <-----------------
+        waits until its replica has applied the sequence, so a client always sees its own changes at once
+        and clients of other workers see them as soon as their replica catches up.
+'''
+REPLICATED_METHODS = {"addPeer", "releasePeer", "removePeer", "addFile", "addFiles", "removeFile", "setServingAddress"}
+REPLICA_TIMEOUT = 30 # Seconds a worker waits for the service before giving up on a change.
+REPLICA_MAX_IDLE = 64 # Idle connections to the service a worker keeps open, one is in use per concurrent change.
+REPLICA_MAX_BACKLOG = 268435456 # Bytes of changes queued for a worker that stopped reading them before it is dropped.
+
+'''
+    ReplicaStream(connection, state, sequence)
+        Streams a worker's replica the snapshot of the captured state, the sequence it was captured at and then
+        every change queued with push, in order, from a thread of its own. Queueing never blocks, so encoding
+        the snapshot and a worker that stops reading only hold up that worker's stream and not the index.
+'''
+class ReplicaStream:
+    def __init__(self, connection, state, sequence):
+        self.connection = connection
+        self.condition = threading.Condition()
+        self.changes = deque() # Pickled changes waiting to be sent.
+        self.backlog = 0 # Bytes of changes waiting to be sent.
+        self.closed = False
+        threading.Thread(target = self.run, args = (state, sequence), daemon = True).start()
+
+    '''
+        push(change)
+            Queues a pickled change for the worker, returns False once the stream has been closed. A worker more
+            than REPLICA_MAX_BACKLOG behind is dropped, which ends its change stream and fails its changes.
+    '''
+    def push(self, change):
+        with self.condition:
+            if self.closed: return False
+            if self.backlog + len(change) > REPLICA_MAX_BACKLOG:
+                self.close()
+                return False
+            self.changes.append(change)
+            self.backlog = self.backlog + len(change)
+            self.condition.notify()
+            return True
+
+    def run(self, state, sequence):
+        try:
+            self.connection.send_bytes(encodeSnapshot(state))
+            self.connection.send(sequence)
+            while True:
+                with self.condition:
+                    while not self.changes and not self.closed: self.condition.wait()
+                    if self.closed: return
+                    changes, self.changes = self.changes, deque()
+                    self.backlog = 0
+                for change in changes: self.connection.send_bytes(change)
+        except OSError:
+            pass # The worker has gone.
+        finally:
+            self.close()
+            self.connection.close()
+
+    def close(self):
+        with self.condition:
+            if self.closed: return
+            self.closed = True
+            self.changes.clear()
+            self.condition.notify()
+        try: # Wakes the stream's thread if it is stuck sending to a worker that stopped reading.
+            with socket.socket(fileno = os.dup(self.connection.fileno())) as connectionSocket:
+                connectionSocket.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+
+'''
+    TrackerService(index)
+        Owns the tracker index shared by the server's worker processes and applies their changes to it in one
+        order. Workers connect to address with authKey.
+'''
+class TrackerService:
+    def __init__(self, index):
+        self.index = index
+        self.authKey = os.urandom(32)
+        self.listener = Listener(authkey = self.authKey) # A Unix socket in a private directory where available.
+        self.address = self.listener.address
+        self.replicas = [] # Connections streaming changes to every worker's replica.
+        self.sequence = 0 # Number of changes applied so far.
+
+    '''
+        serveForever() : Threaded
+            Accepts worker connections until the service is closed, serving each in its own thread.
+    '''
+    def serveForever(self):
+        while True:
+            try:
+                connection = self.listener.accept()
+            except OSError:
+                break # The service was closed.
+            except Exception:
+                continue # A connection that failed to authenticate.
+            threading.Thread(target = self.handleConnection, args = (connection,), daemon = True).start()
+
+    def handleConnection(self, connection):
+        try:
+            request = connection.recv()
+            if request == "replicate":
+                with self.index.lock: # Changes made after the copy queue up behind it.
+                    self.replicas.append(ReplicaStream(connection, captureSnapshot(self.index), self.sequence))
+                return
+
+            while True: # Every other request is a (method, args) change.
+                try:
+                    reply = self.apply(*request)
+                except Exception as e: # Such as an unknown method, sent back to the worker to raise.
+                    reply = e
+                connection.send(reply)
+                request = connection.recv()
+        except (EOFError, OSError):
+            connection.close()
+
+    '''
+        apply(method, args)
+            Applies a change to the index and queues it for every replica, returns (result, sequence).
+    '''
+    def apply(self, method, args):
+        if method not in REPLICATED_METHODS: raise ValueError("'" + method + "' is not a tracker change.")
+        with self.index.lock:
+            result = getattr(self.index, method)(*args)
+            self.sequence = self.sequence + 1
+            change = pickle.dumps((self.sequence, method, args))
+            for replica in list(self.replicas):
+                if not replica.push(change): self.replicas.remove(replica) # The worker has gone.
+            return result, self.sequence
+
+    '''
+        expirePeers()
+            Equivalent of TrackerIndex.expirePeers that also drops the expired peers from every replica.
+    '''
+    def expirePeers(self):
+        with self.index.lock:
+            now = time.monotonic()
+            expired = [peer for peer, expiry in self.index.leases.items() if expiry <= now]
+            for peer in expired: self.apply("removePeer", (peer,))
+            return len(expired)
+
+    def close(self):
+        self.listener.close()
+        with self.index.lock:
+            for replica in self.replicas: replica.close()
+            self.replicas = []
+
+'''
+    ReplicatedTrackerIndex(address, authKey)
+        TrackerIndex kept in step with a TrackerService. Lookups are answered from the local copy without
+        leaving the process, changes are made by the service and wait until they have been applied here.
+'''
+class ReplicatedTrackerIndex(TrackerIndex):
+    def __init__(self, address, authKey):
+        super().__init__()
+        self.address = address
+        self.authKey = authKey
+        self.pool = shared.ConnectionPool(self.connect, REPLICA_MAX_IDLE)
+        self.applied = threading.Condition()
+        self.appliedSequence = 0
+        self.following = True
+
+        stream = self.connect(address)
+        stream.send("replicate")
+        decodeSnapshot(self, memoryview(stream.recv_bytes()), "tracker service")
+        self.appliedSequence = stream.recv()
+        threading.Thread(target = self.followChanges, args = (stream,), daemon = True).start()
+
+    def connect(self, address):
+        return Client(address, authkey = self.authKey)
+
+    '''
+        followChanges(stream) : Threaded
+            Applies every change streamed by the service to the local copy, in order.
+    '''
+    def followChanges(self, stream):
+        try:
+            while True:
+                sequence, method, args = pickle.loads(stream.recv_bytes())
+                getattr(TrackerIndex, method)(self, *args) # The local copy only, never forwarded back.
+                with self.applied:
+                    self.appliedSequence = sequence
+                    self.applied.notify_all()
+        except (EOFError, OSError):
+            pass # The service has shut down.
+        finally:
+            stream.close()
+            with self.applied:
+                self.following = False
+                self.applied.notify_all()
+
+    '''
+        forward(method, args..)
+            Has the service make a change and waits until the local copy has it, returns the change's result.
+            Raises the error the service replied with if it could not make the change.
+    '''
+    def forward(self, method, *args):
+        with self.pool.connection(self.address) as connection:
+            connection.send((method, args))
+            reply = connection.recv()
+        if isinstance(reply, Exception): raise reply
+        result, sequence = reply
+
+        with self.applied:
+            while self.appliedSequence < sequence:
+                if not self.following or not self.applied.wait(REPLICA_TIMEOUT):
+                    raise ConnectionError("Lost the change stream from the tracker service.")
+        return result
+
+    def addPeer(self, peer):
+        return self.forward("addPeer", peer)
+
+    def releasePeer(self, peer, ttl):
+        return self.forward("releasePeer", peer, ttl)
+
+    def removePeer(self, peer):
+        return self.forward("removePeer", peer)
+
+    def addFile(self, peer, fileName):
+        return self.forward("addFile", peer, fileName)
+
+    def addFiles(self, peer, files):
+        return self.forward("addFiles", peer, files)
+
+    def removeFile(self, peer, fileName):
+        return self.forward("removeFile", peer, fileName)
+
+    def setServingAddress(self, peer, address):
+        return self.forward("setServingAddress", peer, address)
+
+    def close(self):
+        self.pool.close()